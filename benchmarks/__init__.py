@@ -0,0 +1,3 @@
+"""!
+@brief Benchmarks for PromptGen on synthetic file trees (see run.py).
+"""
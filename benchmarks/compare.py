@@ -0,0 +1,44 @@
+"""!
+@file compare.py
+@brief Compare two benchmark runs: python -m benchmarks.compare OLD.json NEW.json
+"""
+import argparse
+import json
+import sys
+
+## Result keys that identify a measurement rather than describe its outcome.
+KEY_FIELDS = ('scenario', 'shape', 'files', 'pages', 'mb', 'events')
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        results = json.load(f)['results']
+    return {tuple(result.get(field) for field in KEY_FIELDS): result for result in results}
+
+
+def describe(key):
+    return " ".join(str(value) for value in key if value is not None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare",
+                                     description="Compare the timings of two benchmark result files.")
+    parser.add_argument("old", help="baseline results")
+    parser.add_argument("new", help="results to compare with the baseline")
+    args = parser.parse_args(argv)
+
+    old, new = load_results(args.old), load_results(args.new)
+    print(f"{'measurement':<36} {'old':>10} {'new':>10} {'ratio':>7}")
+    for key in [key for key in new if key in old]:
+        old_seconds, new_seconds = old[key]['seconds'], new[key]['seconds']
+        ratio = new_seconds / old_seconds if old_seconds else float('inf')
+        print(f"{describe(key):<36} {old_seconds:>9.3f}s {new_seconds:>9.3f}s {ratio:>6.2f}x")
+    for key in old.keys() - new.keys():
+        print(f"{describe(key):<36} only in {args.old}")
+    for key in new.keys() - old.keys():
+        print(f"{describe(key):<36} only in {args.new}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""!
+@file run.py
+@brief Benchmark harness: python -m benchmarks.run [options]
+
+Generates synthetic trees, drives FilePromptApp on the offscreen Qt platform
+and reports wall time and peak memory per scenario. Run it from the
+repository root. Settings and caches go to a temporary directory, so the
+real application state is never touched. Results can be written as JSON and
+compared with benchmarks.compare.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from . import synth
+
+GROUPS = ('tree', 'files', 'search')
+
+
+def parse_size(text):
+    """!
+    @brief Parse a file count such as 1000, 10k or 1m.
+    """
+    text = text.strip().lower()
+    factor = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(text[:-1] if factor != 1 else text) * factor
+
+
+def peak_rss_kb():
+    """!
+    @brief Peak resident set size of the process in KiB, None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Recorder:
+    """!
+    @brief Collects one result dict per measured scenario.
+
+    Peak RSS never decreases within a process, so it shows the high water
+    mark up to the end of each scenario. With trace_memory, tracemalloc
+    additionally reports the peak of Python allocations within the scenario
+    (at the cost of slower timings).
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    @contextlib.contextmanager
+    def measure(self, scenario, **params):
+        extra = {}
+        if self.trace_memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            seconds = time.perf_counter() - start
+            result = {'scenario': scenario, **params, 'seconds': round(seconds, 6),
+                      'peak_rss_kb': peak_rss_kb(), **extra}
+            if self.trace_memory:
+                result['py_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+            self.results.append(result)
+            print(format_result(result), flush=True)
+
+
+def format_result(result):
+    params = " ".join(f"{key}={value}" for key, value in result.items()
+                      if key not in ('scenario', 'seconds', 'peak_rss_kb'))
+    return f"{result['scenario']:<20} {result['seconds']:>10.3f}s  rss={result['peak_rss_kb']}KiB  {params}"
+
+
+def wait_until(app, predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark step did not finish in time")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def preview_done(window):
+    """!
+    @brief Whether the preview of the current selection is complete.
+    """
+    return (not window.restoring
+            and not window.selection_walker.runningRoots()
+            and not window.update_timer.isActive()
+            and not window.render_timer.isActive()
+            and all(path in window.file_contents or path in window.file_errors for path in window.selected_files))
+
+
+def in_tree(model, path):
+    parent = model.nodeForPath(os.path.dirname(path))
+    return parent is not None and (model.nodeForPath(path) is not None
+                                   or os.path.basename(path) in (parent.pending or ()))
+
+
+def close_window(app, window):
+    """!
+    @brief Close a FilePromptApp, saving its state, and delete it with its timers and watchers.
+    """
+    from PyQt5.QtCore import QEvent
+
+    window.close()
+    window.deleteLater()
+    app.sendPostedEvents(None, QEvent.DeferredDelete)
+
+
+def bench_tree(recorder, app, workdir, files, shape, burst, timeout):
+    """!
+    @brief Tree population, filtering, preview, directory events and restore.
+    """
+    import main
+    from PyQt5.QtCore import QSettings
+
+    def make_window():
+        config = os.path.join(workdir, "config")
+        settings = QSettings(os.path.join(config, "FilePromptApp.ini"), QSettings.IniFormat)
+        return main.FilePromptApp(settings=settings, data_dir=config)
+
+    params = {'shape': shape, 'files': files}
+    root = os.path.join(workdir, f"{shape}-{files}")
+    with recorder.measure('generate', **params):
+        synth.make_tree(root, files, shape)
+
+    window = make_window()
+    app.processEvents()
+    model = window.tree_model
+
+    with recorder.measure('populate', **params) as extra:
+        node = window.loadItemByPath(root)
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            model.materializeAll(current)
+            stack.extend(child for child in current.children if child.is_dir)
+        extra['rows'] = len(model.nodes_by_path)
+
+    with recorder.measure('filter', **params):
+        window.filter_edit.setText(".py, .md")
+        window.filter_timer.stop()
+        window.filter_tree_items()
+        app.processEvents()
+    with recorder.measure('filter_clear', **params):
+        window.filter_edit.setText("")
+        window.filter_timer.stop()
+        window.filter_tree_items()
+        app.processEvents()
+
+    with recorder.measure('preview', **params) as extra:
+        model.setCheckState(node, main.Qt.Checked)
+        window.updatePreview()
+        wait_until(app, lambda: preview_done(window), timeout)
+        extra['selected'] = len(window.selected_files)
+        extra['chars'] = window.preview_document.charCount()
+
+    # Directory events are only delivered for expanded directories.
+    watched = synth.tree_directories(root, files, shape)[0][:20]
+    for path in watched:
+        window.tree.expand(window.tree_proxy.indexFromNode(window.loadItemByPath(path)))
+    app.processEvents()
+    new_files = [os.path.join(watched[i % len(watched)], f"burst{i:04d}.txt") for i in range(burst)]
+    with recorder.measure('dir_burst', **params, events=len(new_files)):
+        for path in new_files:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("burst\n")
+        wait_until(app, lambda: all(in_tree(model, path) for path in new_files), timeout)
+    for path in new_files:
+        os.remove(path)
+    wait_until(app, lambda: not any(in_tree(model, path) for path in new_files), timeout)
+    wait_until(app, lambda: preview_done(window), timeout)
+
+    close_window(app, window)
+    with recorder.measure('restore', **params) as extra:
+        start = time.perf_counter()
+        window = make_window()
+        extra['first_paint_seconds'] = round(time.perf_counter() - start, 6)
+        wait_until(app, lambda: preview_done(window), timeout)
+        extra['selected'] = len(window.selected_files)
+
+    settings, snapshot_path = window.settings, window.snapshot_path
+    close_window(app, window)
+    settings.clear()
+    settings.sync()
+    with contextlib.suppress(OSError):
+        os.remove(snapshot_path)
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_files(recorder, workdir, pdf_pages, large_mb):
+    """!
+    @brief PDF extraction and reading of a large text file.
+    """
+    from promptgen.pdf import PdfTextCache, extract_text_from_pdf
+    from promptgen.textfile import ReadLimits, read_text
+
+    pdf_path = os.path.join(workdir, 'document.pdf')
+    synth.make_pdf(pdf_path, pdf_pages)
+    with recorder.measure('pdf_extract', pages=pdf_pages) as extra:
+        extra['chars'] = len(extract_text_from_pdf(pdf_path))
+    cache = PdfTextCache(os.path.join(workdir, 'pdf-cache'))
+    extract_text_from_pdf(pdf_path, cache=cache)
+    with recorder.measure('pdf_extract_cached', pages=pdf_pages):
+        extract_text_from_pdf(pdf_path, cache=cache)
+
+    large_path = os.path.join(workdir, 'large.txt')
+    synth.make_large_text(large_path, large_mb * 1024 * 1024)
+    with recorder.measure('read_large', mb=large_mb) as extra:
+        extra['chars'] = len(read_text(large_path))
+    with recorder.measure('read_large_capped', mb=large_mb) as extra:
+        extra['chars'] = len(read_text(large_path, ReadLimits(1024 * 1024, mode='both')))
+
+
+def bench_search(recorder, workdir, files, shape):
+    """!
+    @brief Building, saving, loading and querying the content search index.
+
+    Every 1000th file mentions a rare identifier, so the rare queries have a
+    few dozen matches while the common one matches nearly every file.
+    """
+    from promptgen.search import SearchIndex, compile_query
+
+    params = {'shape': shape, 'files': files}
+    root = os.path.join(workdir, f"search-{shape}-{files}")
+    paths = synth.make_tree(root, files, shape)
+    for path in paths[::1000]:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("class NeedleWidget:\n")
+    index_path = os.path.join(workdir, "search.idx")
+
+    index = SearchIndex()
+    index.set_roots([root])
+    with recorder.measure('search_build', **params) as extra:
+        index.sync(root)
+        extra['indexed'] = len(index)
+        extra['trigrams'] = index.trigram_count
+    with recorder.measure('search_save', **params) as extra:
+        index.save(index_path)
+        extra['bytes'] = os.path.getsize(index_path)
+    index = SearchIndex()
+    with recorder.measure('search_load', **params):
+        index.load(index_path)
+    with recorder.measure('search_resync', **params) as extra:
+        extra['changed'] = index.sync(root)
+
+    queries = (
+        ('search_rare', "NeedleWidget", False),
+        ('search_regex', r"class\s+Needle\w+:", True),
+        ('search_common', "lorem ipsum", False),
+    )
+    for scenario, query, regex in queries:
+        with recorder.measure(scenario, **params) as extra:
+            extra['matches'] = len(index.search(compile_query(query, regex)))
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run",
+                                     description="Benchmark PromptGen on synthetic data.")
+    parser.add_argument("--sizes", default="1k,10k", help="comma separated file counts, e.g. '1k,10k,100k'")
+    parser.add_argument("--shapes", default=",".join(synth.SHAPES), help="comma separated tree shapes: wide, deep")
+    parser.add_argument("--groups", default=",".join(GROUPS), help="scenario groups to run: tree, files, search")
+    parser.add_argument("--burst", type=int, default=200, help="files created for the directory event burst")
+    parser.add_argument("--pdf-pages", type=int, default=200, help="pages of the synthetic PDF")
+    parser.add_argument("--large-mb", type=int, default=64, help="size of the large text file in MiB")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for a single step")
+    parser.add_argument("--trace-memory", action="store_true", help="also report tracemalloc peaks (slower)")
+    parser.add_argument("--workdir", help="where to generate data (default: a temporary directory)")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    groups = {group.strip() for group in args.groups.split(",") if group.strip()}
+    workdir = args.workdir or tempfile.mkdtemp(prefix="promptgen-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    # Keep caches of the benchmark away from the user's; settings are
+    # passed to FilePromptApp explicitly. Must happen before Qt is imported.
+    os.environ["QT_QPA_PLATFORM"] = os.environ.get("QT_QPA_PLATFORM", "offscreen")
+    os.environ["XDG_CACHE_HOME"] = os.path.join(workdir, "cache")
+    os.environ["LOCALAPPDATA"] = os.path.join(workdir, "cache")
+
+    from PyQt5.QtCore import QT_VERSION_STR
+    from PyQt5.QtWidgets import QApplication
+
+    recorder = Recorder(args.trace_memory)
+    try:
+        if 'files' in groups:
+            bench_files(recorder, workdir, args.pdf_pages, args.large_mb)
+        if 'tree' in groups:
+            app = QApplication.instance() or QApplication(sys.argv[:1])
+            for size in args.sizes.split(","):
+                for shape in args.shapes.split(","):
+                    bench_tree(recorder, app, workdir, parse_size(size), shape.strip(), args.burst, args.timeout)
+        if 'search' in groups:
+            for size in args.sizes.split(","):
+                for shape in args.shapes.split(","):
+                    bench_search(recorder, workdir, parse_size(size), shape.strip())
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        report = {
+            'meta': {
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'qt': QT_VERSION_STR,
+                'cpus': os.cpu_count(),
+                'args': vars(args),
+            },
+            'results': recorder.results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
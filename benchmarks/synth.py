@@ -0,0 +1,115 @@
+"""!
+@file synth.py
+@brief Synthetic file trees, large text files and PDFs for the benchmarks.
+"""
+import math
+import os
+
+EXTENSIONS = ('.py', '.txt', '.md', '.json', '.js', '.c')
+
+SHAPES = ('wide', 'deep')
+
+## Directory levels per chain of the deep shape. Kept well below the path
+## length limits of common file systems.
+DEEP_LEVELS = 64
+
+
+def _filler(size):
+    line = "lorem ipsum dolor sit amet, consectetur adipiscing elit 0123456789\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def tree_directories(root, files, shape):
+    """!
+    @brief Directories of a synthetic tree and the number of files per directory.
+
+    wide spreads the files over directories directly below root, deep over
+    chains of DEEP_LEVELS nested directories.
+    """
+    if shape == 'wide':
+        per_dir = 100
+        count = math.ceil(files / per_dir)
+        return [os.path.join(root, f"d{i:05d}") for i in range(count)], per_dir
+    if shape == 'deep':
+        per_dir = 10
+        chains = math.ceil(files / (per_dir * DEEP_LEVELS))
+        dirs = []
+        for chain in range(chains):
+            path = os.path.join(root, f"c{chain:03d}")
+            for level in range(DEEP_LEVELS):
+                path = os.path.join(path, f"l{level}")
+                dirs.append(path)
+        return dirs, per_dir
+    raise ValueError(f"unknown shape: {shape!r}")
+
+
+def make_tree(root, files, shape='wide', file_bytes=512):
+    """!
+    @brief Create a tree of text files below root.
+
+    Extensions rotate through EXTENSIONS; every 50th file is a dot file and
+    every 97th starts with '__', so the name filters have work to do. A
+    .gitignore excluding *.json is placed in root.
+
+    @return List of the created file paths in creation order.
+    """
+    dirs, per_dir = tree_directories(root, files, shape)
+    content = _filler(file_bytes)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.gitignore'), 'w', encoding='utf-8') as f:
+        f.write("*.json\n")
+    paths = []
+    for i in range(files):
+        directory = dirs[i // per_dir]
+        if i % per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        prefix = '.' if i % 50 == 49 else '__' if i % 97 == 96 else ''
+        path = os.path.join(directory, f"{prefix}f{i:06d}{EXTENSIONS[i % len(EXTENSIONS)]}")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+
+def make_large_text(path, size):
+    """!
+    @brief Write a text file of size bytes in 1 MiB chunks.
+    """
+    chunk = _filler(1024 * 1024).encode('ascii')
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(chunk[:remaining])
+            remaining -= len(chunk)
+
+
+def make_pdf(path, pages, lines_per_page=40):
+    """!
+    @brief Write a minimal PDF with pages pages of Helvetica text.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode('ascii'))
+    font_id = 3 + 2 * pages
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode('ascii'))
+        text = " ".join(f"({_filler(60).strip()} page {i + 1} line {n}) Tj 0 -16 Td"
+                        for n in range(lines_per_page))
+        stream = f"BT /F1 10 Tf 40 760 Td {text} ET".encode('ascii')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
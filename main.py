@@ -1,37 +1,170 @@
 import sys
 import os
 import ctypes
+import heapq
+import json
+import re
 import string
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QTreeWidget, QTreeWidgetItem,
-    QVBoxLayout, QHBoxLayout, QTextEdit, QLineEdit, 
-    QPushButton, QSplitter, QCheckBox
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QLineEdit, 
+    QPushButton, QSplitter, QCheckBox, QLabel, QMenu, QInputDialog, QPlainTextEdit,
+    QFileDialog, QComboBox, QListView, QSpinBox, QHeaderView
 )
-from PyQt5.QtCore import Qt, QSettings, QFileSystemWatcher, QTimer
-import PyPDF2
+from PyQt5.QtCore import Qt, QSettings, QFileSystemWatcher, QTimer, QStandardPaths
+
+from promptgen import engine
+from promptgen.cache import ContentCache
+from promptgen.export import FOOTER_SEGMENT, LAYOUTS, get_layout
+from promptgen.instrument import profiler
+from promptgen.loader import DirectoryScanner, PreviewLoader, PromptExporter, SearchIndexer, SelectionWalker
+from promptgen.pdf import PdfTextCache, parse_page_range, shutdown_pool
+from promptgen.preview import PreviewOutlineModel, PreviewView
+from promptgen.search import compile_query
+from promptgen.selection import Selection
+from promptgen.snapshot import load_snapshot, save_snapshot
+from promptgen.textfile import TRUNCATE_MODES, ReadLimits
+from promptgen.tokens import (
+    BUDGET_MODES, PRIORITIES, CharTokenizer, TokenCounter, budget_reader, fit_plan, make_tokenizer,
+    path_priority, plan_budget
+)
+from promptgen.watch import WatchManager
+from promptgen.tree_model import FileFilterProxyModel, FileTreeModel, FileTreeView
+
+LOADING_TEXT = "[loading...]"
+
+## Files shown in bold in the tree when the token budget is exceeded.
+TOP_CONTRIBUTORS = 10
+
+
+def list_drive_roots():
+    """!
+    @brief Top level entries of the file tree.
+
+    On Windows every logical drive becomes a root, elsewhere the file system
+    root is used.
+    """
+    if os.name != 'nt':
+        return ["/"]
+    drives = []
+    bitmask = ctypes.windll.kernel32.GetLogicalDrives()
+    for i in range(26):
+        if bitmask & (1 << i):
+            drives.append(f"{string.ascii_uppercase[i]}:/")
+    return drives
+
+
+def app_data_dir():
+    """!
+    @brief Writable directory for the files the application keeps besides its settings.
+
+    On Windows the settings live in the registry, so QSettings.fileName()
+    cannot be used to place files.
+    """
+    path = QStandardPaths.writableLocation(QStandardPaths.AppLocalDataLocation)
+    os.makedirs(path, exist_ok=True)
+    return path
+
 
 class FilePromptApp(QWidget):
-    def __init__(self):
+    def __init__(self, settings=None, data_dir=None):
+        """!
+        @param data_dir Directory for the tree snapshot and the search index, by default app_data_dir().
+        """
         super().__init__()
-        self.settings = QSettings("MyCompany", "FilePromptApp")
-        self.RoleIsLoaded = Qt.UserRole + 1
-        self.RolePath = Qt.UserRole + 2
-        self.file_watcher = QFileSystemWatcher()
-        self.file_watcher.fileChanged.connect(self.onFileChanged)
-        self.dir_watcher = QFileSystemWatcher()
+        self.settings = settings or QSettings("MyCompany", "FilePromptApp")
+        self.data_dir = data_dir or app_data_dir()
+        cache_limit_mb = self.settings.value("cache_limit_mb", 256, type=int)
+        self.content_cache = ContentCache(max_chars=cache_limit_mb * 1024 * 1024)
+        pdf_cache_limit_mb = self.settings.value("pdf_cache_limit_mb", 512, type=int)
+        self.pdf_cache = PdfTextCache(max_bytes=pdf_cache_limit_mb * 1024 * 1024)
+        self.pdf_page_ranges = json.loads(self.settings.value("pdf_page_ranges", "{}"))
+        truncate_mode = self.settings.value("truncate_mode", "head")
+        self.read_limits = ReadLimits(
+            self.settings.value("max_file_kb", 1024, type=int) * 1024,
+            self.settings.value("max_file_lines", 0, type=int),
+            truncate_mode if truncate_mode in TRUNCATE_MODES else "head",
+        )
+        self.watch_manager = WatchManager(
+            dir_threshold=self.settings.value("watch_dir_threshold", 32, type=int),
+            poll_interval_ms=self.settings.value("watch_poll_interval_ms", 2000, type=int),
+            max_watches=self.settings.value("max_file_watches", 4096, type=int),
+            parent=self,
+        )
+        self.watch_manager.fileChanged.connect(self.onFileChanged)
+        self.dir_watcher = QFileSystemWatcher(self)
         self.dir_watcher.directoryChanged.connect(self.onDirectoryChanged)
         self.restoring = False
         self.pending_update = False
         self.update_timer = QTimer(self)
         self.update_timer.setSingleShot(True)
         self.update_timer.timeout.connect(self.updatePreview)
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.timeout.connect(self.filter_tree_items)
+        self.changed_dirs = {}  # Ordered set of directories with pending change events
+        self.dir_change_timer = QTimer(self)
+        self.dir_change_timer.setSingleShot(True)
+        self.dir_change_timer.timeout.connect(self.processDirectoryChanges)
+        self.selected_files = []
+        self.file_contents = {}
+        self.file_errors = {}
+        try:
+            tokenizer = make_tokenizer(self.settings.value("tokenizer", "chars"))
+        except ValueError as e:
+            print(f"{e}; estimating from characters.")
+            tokenizer = CharTokenizer()
+        self.token_counter = TokenCounter(tokenizer)
+        self.file_tokens = {}  # selected path -> tokens of its block
+        self.budget_plan = {}
+        self.budget_cuts = {}  # truncated path -> text cut to the budget
+        self.budget_read = lambda path: self.file_contents[path]
+        budget_mode = self.settings.value("budget_mode", "report")
+        self.budget_mode = budget_mode if budget_mode in BUDGET_MODES else "report"
+        self.file_priorities = json.loads(self.settings.value("file_priorities", "{}"))
+        self.preview_loader = PreviewLoader(self.loadPreviewFile, parent=self)
+        self.preview_loader.fileLoaded.connect(self.onFileLoaded)
+        self.preview_loader.fileFailed.connect(self.onFileFailed)
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.timeout.connect(self.renderPreview)
+        self.preview_blocks = {}  # path -> (content, block) of the last render
+        self.walk_results = {}
+        self.walk_progress = {}
+        self.selection_walker = SelectionWalker(parent=self)
+        self.selection_walker.progress.connect(self.onWalkProgress)
+        self.selection_walker.finished.connect(self.onWalkFinished)
+        self.snapshot_path = os.path.join(self.data_dir, "FilePromptApp_tree.json")
+        self.directory_scanner = DirectoryScanner(parent=self)
+        self.directory_scanner.scanned.connect(self.onDirectoryScanned)
+        self.directory_scanner.done.connect(self.onRevalidationDone)
+        self.export_layout = LAYOUTS.get(self.settings.value("export_layout", "markdown"), get_layout("markdown"))
+        self.prompt_exporter = PromptExporter(self.readFile, parent=self)
+        self.prompt_exporter.exported.connect(self.onPromptExported)
+        self.prompt_exporter.failed.connect(self.onExportFailed)
+        self.search_roots = json.loads(self.settings.value("search_roots", "[]"))
+        self.selection_profiles = json.loads(self.settings.value("selection_profiles", "{}"))
+        self.search_indexer = SearchIndexer(os.path.join(self.data_dir, "FilePromptApp_search.idx"), parent=self)
+        self.search_indexer.progress.connect(self.onSearchIndexProgress)
+        self.search_indexer.synced.connect(self.onSearchIndexSynced)
+        self.search_indexer.results.connect(self.onSearchResults)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.runSearch)
         self.initUI()
         self.loadSettings()
+        self.search_indexer.start(self.search_roots)
 
     def initUI(self):
         main_splitter = QSplitter(Qt.Horizontal)
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabel("File System")
+        self.tree = FileTreeView()
+        self.tree_model = FileTreeModel(self)
+        self.tree_proxy = FileFilterProxyModel(self)
+        self.tree_proxy.setSourceModel(self.tree_model)
+        self.tree.setModel(self.tree_proxy)
+        header = self.tree.header()
+        header.setStretchLastSection(False)
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        header.resizeSection(1, 110)
 
         self.prompt_edit = QTextEdit()
         self.prompt_edit.setPlaceholderText("Enter your prompt here...")
@@ -39,37 +172,144 @@ class FilePromptApp(QWidget):
 
         self.filter_edit = QLineEdit()
         self.filter_edit.setPlaceholderText("Filter by extensions (e.g: '.txt, .py')")
-        self.filter_edit.textChanged.connect(self.filter_tree_items)
+        self.filter_edit.textChanged.connect(self.scheduleFilterUpdate)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search file contents (right-click a folder to index it)")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.scheduleSearch)
+        self.search_regex_checkbox = QCheckBox("Regex")
+        self.search_regex_checkbox.stateChanged.connect(self.scheduleSearch)
+        self.search_case_checkbox = QCheckBox("Match case")
+        self.search_case_checkbox.stateChanged.connect(self.scheduleSearch)
+        self.search_label = QLabel()
+        self.search_check_button = QPushButton("Check Matches")
+        self.search_check_button.setToolTip("Check the matching files that pass the filter")
+        self.search_check_button.setEnabled(False)
+        self.search_check_button.clicked.connect(self.checkSearchMatches)
 
         self.ignore_dot_files_checkbox = QCheckBox("Ignore dot files")
         self.ignore_dunder_checkbox = QCheckBox("Ignore __ files")
         self.dark_mode_checkbox = QCheckBox("Dark Mode")
+        self.use_ignore_checkbox = QCheckBox("Use .gitignore")
+        self.use_ignore_checkbox.setChecked(True)
+        self.diagnostics_checkbox = QCheckBox("Diagnostics")
 
-        self.ignore_dot_files_checkbox.stateChanged.connect(self.filter_tree_items)
-        self.ignore_dunder_checkbox.stateChanged.connect(self.filter_tree_items)
+        self.ignore_dot_files_checkbox.stateChanged.connect(self.scheduleFilterUpdate)
+        self.ignore_dunder_checkbox.stateChanged.connect(self.scheduleFilterUpdate)
         self.dark_mode_checkbox.stateChanged.connect(self.toggleDarkMode)
-
-        self.preview_edit = QTextEdit()
-        self.preview_edit.setReadOnly(True)
-
+        self.use_ignore_checkbox.stateChanged.connect(self.onUseIgnoreChanged)
+        self.diagnostics_checkbox.stateChanged.connect(self.toggleDiagnostics)
+
+        self.profile_combo = QComboBox()
+        self.profile_combo.setMinimumContentsLength(12)
+        self.profile_combo.setToolTip("Switch to a saved selection")
+        self.profile_combo.activated[str].connect(self.switchProfile)
+        self.profile_save_button = QPushButton("Save Selection...")
+        self.profile_save_button.clicked.connect(self.saveProfile)
+        self.profile_delete_button = QPushButton("Delete")
+        self.profile_delete_button.clicked.connect(self.deleteProfile)
+        self.updateProfileCombo()
+
+        self.preview_view = PreviewView()
+        self.preview_document = self.preview_view.document()
+        self.preview_outline = QListView()
+        self.preview_outline.setUniformItemSizes(True)
+        self.preview_outline.setModel(PreviewOutlineModel(self.preview_document, self))
+        self.preview_outline.clicked.connect(
+            lambda index: self.preview_view.scrollToSection(index.data(Qt.UserRole)))
+        preview_splitter = QSplitter(Qt.Horizontal)
+        preview_splitter.addWidget(self.preview_outline)
+        preview_splitter.addWidget(self.preview_view)
+        preview_splitter.setStretchFactor(1, 1)
+        preview_splitter.setSizes([150, 450])
+
+        self.status_label = QLabel()
+
+        self.diagnostics_edit = QPlainTextEdit()
+        self.diagnostics_edit.setReadOnly(True)
+        self.diagnostics_edit.setLineWrapMode(QPlainTextEdit.NoWrap)
+        diagnostics_reset_button = QPushButton("Reset")
+        diagnostics_reset_button.clicked.connect(self.resetDiagnostics)
+        diagnostics_trace_button = QPushButton("Save Trace...")
+        diagnostics_trace_button.clicked.connect(self.saveDiagnosticsTrace)
+        diagnostics_buttons = QHBoxLayout()
+        diagnostics_buttons.addStretch()
+        diagnostics_buttons.addWidget(diagnostics_reset_button)
+        diagnostics_buttons.addWidget(diagnostics_trace_button)
+        diagnostics_layout = QVBoxLayout()
+        diagnostics_layout.setContentsMargins(0, 0, 0, 0)
+        diagnostics_layout.addWidget(self.diagnostics_edit)
+        diagnostics_layout.addLayout(diagnostics_buttons)
+        self.diagnostics_panel = QWidget()
+        self.diagnostics_panel.setLayout(diagnostics_layout)
+        self.diagnostics_panel.hide()
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.timeout.connect(self.refreshDiagnostics)
+
+        self.layout_combo = QComboBox()
+        self.layout_combo.addItems(LAYOUTS)
+        self.layout_combo.setCurrentText(self.export_layout.name)
+        self.layout_combo.setToolTip("Layout of the combined prompt")
+        self.layout_combo.currentTextChanged.connect(self.onLayoutChanged)
+        self.export_button = QPushButton("Export...")
+        self.export_button.clicked.connect(self.exportPrompt)
         self.button = QPushButton("Generate Prompt")
         self.button.clicked.connect(self.generatePrompt)
+        self.token_label = QLabel()
+        self.budget_spin = QSpinBox()
+        self.budget_spin.setRange(0, 100000000)
+        self.budget_spin.setSingleStep(1000)
+        self.budget_spin.setGroupSeparatorShown(True)
+        self.budget_spin.setSpecialValueText("no budget")
+        self.budget_spin.setSuffix(" tokens")
+        self.budget_spin.setToolTip("Token budget of the combined prompt")
+        self.budget_spin.setValue(self.settings.value("token_budget", 0, type=int))
+        self.budget_spin.valueChanged.connect(self.scheduleRender)
+        self.budget_mode_combo = QComboBox()
+        self.budget_mode_combo.addItems(BUDGET_MODES)
+        self.budget_mode_combo.setCurrentText(self.budget_mode)
+        self.budget_mode_combo.setToolTip("Only report, or truncate or drop the lowest priority files to fit the budget")
+        self.budget_mode_combo.currentTextChanged.connect(self.onBudgetModeChanged)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.budget_spin)
+        button_layout.addWidget(self.budget_mode_combo)
+        button_layout.addWidget(self.layout_combo)
+        button_layout.addWidget(self.export_button)
+        button_layout.addWidget(self.button, 1)
 
         right_splitter = QSplitter(Qt.Vertical)
         right_splitter.addWidget(self.prompt_edit)
-        right_splitter.addWidget(self.preview_edit)
+        right_splitter.addWidget(preview_splitter)
+        right_splitter.addWidget(self.diagnostics_panel)
 
         checkbox_layout = QHBoxLayout()
         checkbox_layout.addWidget(self.ignore_dot_files_checkbox)
         checkbox_layout.addWidget(self.ignore_dunder_checkbox)
+        checkbox_layout.addWidget(self.use_ignore_checkbox)
         checkbox_layout.addWidget(self.dark_mode_checkbox)
+        checkbox_layout.addWidget(self.diagnostics_checkbox)
         checkbox_layout.addStretch()
+        checkbox_layout.addWidget(self.profile_combo)
+        checkbox_layout.addWidget(self.profile_save_button)
+        checkbox_layout.addWidget(self.profile_delete_button)
 
         right_layout = QVBoxLayout()
         right_layout.addLayout(checkbox_layout)
         right_layout.addWidget(self.filter_edit)
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.search_edit, 1)
+        search_layout.addWidget(self.search_regex_checkbox)
+        search_layout.addWidget(self.search_case_checkbox)
+        search_layout.addWidget(self.search_label)
+        search_layout.addWidget(self.search_check_button)
+        right_layout.addLayout(search_layout)
         right_layout.addWidget(right_splitter)
-        right_layout.addWidget(self.button)
+        status_layout = QHBoxLayout()
+        status_layout.addWidget(self.status_label, 1)
+        status_layout.addWidget(self.token_label)
+        right_layout.addLayout(status_layout)
+        right_layout.addLayout(button_layout)
 
         right_widget = QWidget()
         right_widget.setLayout(right_layout)
@@ -81,15 +321,18 @@ class FilePromptApp(QWidget):
         main_layout.addWidget(main_splitter)
         self.setLayout(main_layout)
 
-        self.tree.itemExpanded.connect(self.onItemExpanded)
-        self.tree.itemCollapsed.connect(self.onItemCollapsed)
-        self.tree.itemChanged.connect(self.onItemChanged)
+        self.tree.expanded.connect(self.onItemExpanded)
+        self.tree.collapsed.connect(self.onItemCollapsed)
+        self.tree_model.checkStateChanged.connect(self.onItemChanged)
+        self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.tree.customContextMenuRequested.connect(self.onTreeContextMenu)
         self.populateTree()
 
         self.setWindowTitle("Prompt Generator")
         self.show()
         self.main_splitter = main_splitter
         self.right_splitter = right_splitter
+        self.preview_splitter = preview_splitter
 
     def toggleDarkMode(self, state):
         if state == Qt.Checked:
@@ -98,7 +341,7 @@ class FilePromptApp(QWidget):
                     background-color: #121212;
                     color: #e0e0e0;
                 }
-                QLineEdit, QTextEdit, QTreeWidget, QPushButton {
+                QLineEdit, QTextEdit, QTreeView, QListView, PreviewView, QPushButton, QComboBox {
                     background-color: #1e1e1e;
                     color: #e0e0e0;
                     border: 1px solid #444;
@@ -114,188 +357,592 @@ class FilePromptApp(QWidget):
             self.setStyleSheet("")
 
     def populateTree(self):
-        # Clear existing tree items
-        self.tree.clear()
-
-        # Get all drives on Windows
-        drives = []
-        bitmask = ctypes.windll.kernel32.GetLogicalDrives()
-        for i in range(26):
-            if bitmask & (1 << i):
-                drives.append(f"{string.ascii_uppercase[i]}:/")
-
-        for drive in drives:
-            root_item = QTreeWidgetItem(self.tree)
-            root_item.setText(0, drive)
-            root_item.setFlags(root_item.flags() | Qt.ItemIsTristate | Qt.ItemIsUserCheckable)
-            root_item.setCheckState(0, Qt.Unchecked)
-            root_item.setData(0, self.RolePath, drive)
-            root_item.setData(0, self.RoleIsLoaded, False)
-            root_item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
-
-    def onItemExpanded(self, item):
-        if not item.data(0, self.RoleIsLoaded):
-            item_path = item.data(0, self.RolePath)
-            self.addItems(item, item_path)
-            item.setData(0, self.RoleIsLoaded, True)
-        dir_path = item.data(0, self.RolePath)
+        self.tree_model.setRoots(list_drive_roots())
+
+    def onItemExpanded(self, index):
+        dir_path = self.tree_proxy.nodeFromIndex(index).path
         if os.path.isdir(dir_path) and dir_path not in self.dir_watcher.directories():
             self.dir_watcher.addPath(dir_path)
-        self.filter_tree_items()
 
-    def onItemCollapsed(self, item):
-        dir_path = item.data(0, self.RolePath)
+    def onItemCollapsed(self, index):
+        dir_path = self.tree_proxy.nodeFromIndex(index).path
         if dir_path in self.dir_watcher.directories():
             self.dir_watcher.removePath(dir_path)
 
     def onDirectoryChanged(self, path):
-        item = self.findItemByPath(path)
-        if item:
-            existing_items = {child.text(0): child for i in range(item.childCount()) if (child := item.child(i))}
-            try:
-                new_names = os.listdir(path)
-            except PermissionError:
-                new_names = []
-            new_names_set = set(new_names)
-            for name in list(existing_items.keys()):
-                if name not in new_names_set:
-                    item.removeChild(existing_items[name])
-            for name in new_names:
-                if name not in existing_items:
-                    child_path = os.path.join(path, name)
-                    child_item = QTreeWidgetItem(item)
-                    child_item.setText(0, name)
-                    child_item.setFlags(child_item.flags() | Qt.ItemIsUserCheckable)
-                    child_item.setCheckState(0, Qt.Unchecked)
-                    child_item.setData(0, self.RolePath, child_path)
-                    child_item.setData(0, self.RoleIsLoaded, False)
-                    if os.path.isdir(child_path):
-                        child_item.setFlags(child_item.flags() | Qt.ItemIsTristate)
-                        child_item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
-            self.sortItemChildren(item)
-            self.tree.update()
-            self.filter_tree_items()
+        """!
+        @brief Queue a directory change event.
 
-    def findItemByPath(self, path, parent_item=None):
-        if parent_item is None:
-            parent_item = self.tree.invisibleRootItem()
-        for i in range(parent_item.childCount()):
-            child = parent_item.child(i)
-            if child.data(0, self.RolePath) == path:
-                return child
-            if found := self.findItemByPath(path, child):
-                return found
-        return None
-
-    def addItems(self, parent, path):
-        try:
-            items = os.listdir(path)
-        except PermissionError:
-            return
+        Events are coalesced and handled in batches by
+        processDirectoryChanges(). The timer is not restarted by later
+        events, so a continuous burst is still processed every 100 ms.
+        """
+        self.changed_dirs[path] = None
+        if not self.dir_change_timer.isActive():
+            self.dir_change_timer.start(100)
 
-        dirs = []
-        files = []
-        for item_name in items:
-            item_path = os.path.join(path, item_name)
-            if os.path.isdir(item_path):
-                dirs.append((item_name, item_path))
-            else:
-                files.append((item_name, item_path))
-
-        dirs.sort(key=lambda x: x[0].lower())
-        files.sort(key=lambda x: x[0].lower())
-
-        initial_count = parent.childCount()
-
-        for item_name, item_path in dirs + files:  # Folders first, alphabetical
-            item = QTreeWidgetItem(parent)
-            item.setText(0, item_name)
-            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-            item.setCheckState(0, Qt.Unchecked)
-            item.setData(0, self.RolePath, item_path)
-            item.setData(0, self.RoleIsLoaded, False)
-            if os.path.isdir(item_path):
-                item.setFlags(item.flags() | Qt.ItemIsTristate)
-                item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
-        if initial_count:
-            self.sortItemChildren(parent)
-
-    def sortItemChildren(self, item):
+    @profiler.timed('tree.dir_events')
+    def processDirectoryChanges(self):
         """!
-        @brief Sort a tree item's children.
+        @brief Apply the queued directory changes to the tree.
 
-        Directories are placed before files, with all items sorted
-        alphabetically by name. This method preserves existing children and
-        reorders them in place.
+        Each changed directory is listed once and diffed against its rows.
+        The preview is rebuilt once per batch if a directory with checked
+        entries changed.
         """
-        children = [item.child(i) for i in range(item.childCount())]
-        children.sort(key=lambda c: (
-            not os.path.isdir(c.data(0, self.RolePath)), c.text(0).lower()
-        ))
-        for index, child in enumerate(children):
-            item.takeChild(item.indexOfChild(child))
-            item.insertChild(index, child)
+        paths, self.changed_dirs = self.changed_dirs, {}
+        profiler.count('dir_events', len(paths))
+        update_preview = False
+        for path in paths:
+            self.search_indexer.refreshDirectory(path)
+            node = self.findItemByPath(path)
+            if not node or not node.is_listed:
+                continue
+            try:
+                with os.scandir(path) as it:
+                    new_entries = {entry.name: entry.is_dir() for entry in it}
+            except OSError:
+                new_entries = {}
+            was_selected = node.check_state != Qt.Unchecked
+            if self.tree_model.applyListing(node, new_entries):
+                self.invalidateWalks(path)
+                update_preview = update_preview or was_selected
+        if update_preview:
+            self.schedulePreviewUpdate()
+
+    def onDirectoryScanned(self, generation, path, entries):
+        if not self.directory_scanner.isCurrent(generation) or entries is None:
+            return
+        node = self.findItemByPath(path)
+        if node and node.is_listed:
+            with profiler.stage('settings.revalidate'):
+                self.tree_model.applyListing(node, entries)
+
+    def onRevalidationDone(self, generation):
+        if self.directory_scanner.isCurrent(generation):
+            self.pending_update = True
+            self.finishRestore()
+
+    def findItemByPath(self, path):
+        return self.tree_model.nodeForPath(path)
 
     def generatePrompt(self):
+        if walking := self.selection_walker.runningRoots():
+            self.status_label.setText(f"Wait until {len(walking)} folder(s) are scanned before copying.")
+            return
         clipboard = QApplication.clipboard()
-        clipboard.setText(self.preview_edit.toPlainText())
+        clipboard.setText(self.promptText())
         print("Prompt copied to clipboard.")
 
-    def getCheckedItems(self, item):
+    def promptText(self):
+        """!
+        @brief Combined prompt of the selected files, as copied to the clipboard.
+
+        Loaded files are taken from the preview with the token budget
+        applied. Files that are still loading are read here through
+        readFile(), like exportPrompt() does, so the prompt is never missing
+        any of them; failed files only appear if the export layout records
+        errors.
+        """
+        if self.render_timer.isActive():
+            self.renderPreview()
+        layout = self.export_layout
+        parts = [layout.header(self.prompt_edit.toPlainText())]
+        for path in self.selected_files:
+            if path in self.file_contents:
+                if self.budget_plan.get(path) != 0:
+                    parts.append(layout.file_block(path, self.budget_read(path)))
+                continue
+            error = self.file_errors.get(path)
+            if error is None:
+                try:
+                    parts.append(layout.file_block(path, self.readFile(path)))
+                    continue
+                except Exception as e:
+                    error = str(e)
+            if block := layout.error_block(path, error):
+                parts.append(block)
+        parts.append(layout.footer())
+        return ''.join(parts)
+
+    def onLayoutChanged(self, name):
+        self.export_layout = get_layout(name)
+        self.preview_blocks = {}
+        self.renderPreview()
+
+    def exportPrompt(self):
+        """!
+        @brief Stream the combined prompt to a file chosen by the user.
+
+        Unlike the clipboard, the export reads the selected files itself and
+        writes them one by one, so it does not wait for the preview.
+        Targets ending in .gz are compressed. The token budget planned for
+        the files loaded so far is applied.
+        """
+        if walking := self.selection_walker.runningRoots():
+            self.status_label.setText(f"Wait until {len(walking)} folder(s) are scanned before exporting.")
+            return
+        layout = self.export_layout
+        suffix = layout.suffix
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Prompt", self.settings.value("export_dir", "") + f"prompt{suffix}",
+            f"{layout.name} (*{suffix});;{layout.name}, gzip (*{suffix}.gz);;All files (*)")
+        if not path:
+            return
+        self.settings.setValue("export_dir", os.path.join(os.path.dirname(path), ""))
+        self.export_button.setEnabled(False)
+        if self.render_timer.isActive():
+            self.renderPreview()
+        files = [file_path for file_path in self.selected_files if self.budget_plan.get(file_path) != 0]
+        reader = budget_reader(self.readFile, self.budget_cuts)
+        self.status_label.setText(f"Exporting {len(files)} files...")
+        self.prompt_exporter.start(path, self.prompt_edit.toPlainText(), files, layout, reader)
+
+    def onPromptExported(self, path, written, skipped):
+        self.export_button.setEnabled(True)
+        message = f"Exported {written} files to {path}."
+        if skipped:
+            message += f" {skipped} file(s) could not be read."
+        self.status_label.setText(message)
+
+    def onExportFailed(self, path, error):
+        self.export_button.setEnabled(True)
+        self.status_label.setText(f"Could not export to {path}: {error}")
+
+    def getCheckedItems(self, node, file_filter=None, missing=None):
+        """!
+        @brief Collect the checked, visible files below node in tree order.
+
+        Fully checked directories contribute the files found by their
+        recursive walk (see recursiveSelection()); partially checked ones are
+        descended into. Directories whose walk has not finished contribute
+        nothing yet and are appended to missing.
+        """
+        file_filter = file_filter or self.currentFileFilter()
         selected_files = []
-        for i in range(item.childCount()):
-            child = item.child(i)
-            # Skip items that are hidden (i.e. filtered out).
-            if child.isHidden():
+        for child in node.children or ():
+            # Skip items that are hidden (i.e. filtered out) and subtrees
+            # without any checked item.
+            if child.check_state == Qt.Unchecked or not self.isNodeVisible(child, file_filter):
                 continue
-            child_path = child.data(0, self.RolePath)
-            # Only add non-directory files that are visible and checked.
-            if child.checkState(0) == Qt.Checked and not os.path.isdir(child_path):
-                selected_files.append(child_path)
-            selected_files.extend(self.getCheckedItems(child))
+            if not child.is_dir:
+                selected_files.append(child.path)
+            elif child.check_state == Qt.Checked:
+                selected_files.extend(self.recursiveSelection(child.path, missing))
+            else:
+                selected_files.extend(self.getCheckedItems(child, file_filter, missing))
+        if node.pending and node.pending_state == Qt.Checked:
+            matcher = self.tree_model.ignoreMatcher(node)
+            for name, is_dir in node.iter_pending():
+                path = os.path.join(node.path, name)
+                if not file_filter.matches(name, is_dir) or (matcher and matcher.is_ignored(path, is_dir)):
+                    continue
+                if is_dir:
+                    selected_files.extend(self.recursiveSelection(path, missing))
+                else:
+                    selected_files.append(path)
         return selected_files
 
+    def recursiveSelection(self, path, missing=None):
+        """!
+        @brief Files below a checked directory, from a finished walk.
 
-    def updatePreview(self):
-        current_files = self.file_watcher.files()
-        if current_files:
-            self.file_watcher.removePaths(current_files)
+        The walk of the directory itself or of any ancestor that covered it
+        is used. Otherwise path is appended to missing and an empty list is
+        returned.
+        """
+        current = path
+        while True:
+            if (result := self.walk_results.get(current)) is not None:
+                if (files := result.files_below(path)) is not None:
+                    return files
+                break  # Pruned by the ancestor's walk; walk it on its own.
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+        if missing is not None:
+            missing.append(path)
+        return []
+
+    def invalidateWalks(self, path):
+        """!
+        @brief Drop walk results that cover path.
+        """
+        for root in list(self.walk_results):
+            if path == root or path.startswith(os.path.join(root, '')):
+                del self.walk_results[root]
 
-        selected_files = []
-        for i in range(self.tree.topLevelItemCount()):
-            top_item = self.tree.topLevelItem(i)
-            selected_files.extend(self.getCheckedItems(top_item))
-
-        if selected_files:
-            self.file_watcher.addPaths(selected_files)
-        prompt_text = self.prompt_edit.toPlainText()
-        full_prompt = prompt_text
-        for file_path in selected_files:
+    def onWalkProgress(self, root, count):
+        if self.selection_walker.isRunning(root):
+            self.walk_progress[root] = count
+            self.updateLoadStatus()
+
+    def onWalkFinished(self, root, result, token):
+        if not self.selection_walker.finish(root, token):
+            return
+        self.walk_results[root] = result
+        self.walk_progress.pop(root, None)
+        self.schedulePreviewUpdate()
+
+    def toggleDiagnostics(self, state):
+        """!
+        @brief Show or hide the diagnostics pane.
+
+        The profiler only collects while the pane is shown, unless it was
+        enabled through PROMPTGEN_PROFILE.
+        """
+        visible = state == Qt.Checked
+        if visible:
+            profiler.enabled = True
+            self.refreshDiagnostics()
+            self.diagnostics_timer.start(1000)
+        else:
+            profiler.enabled = os.environ.get('PROMPTGEN_PROFILE', '') not in ('', '0')
+            self.diagnostics_timer.stop()
+        self.diagnostics_panel.setVisible(visible)
+
+    def refreshDiagnostics(self):
+        watch = self.watch_manager.stats()
+        lines = [
+            profiler.format_summary(),
+            "",
+            f"content cache: {len(self.content_cache)} files, {self.content_cache.size} chars, "
+            f"{self.content_cache.hits} hits, {self.content_cache.misses} misses",
+            "watches: " + ", ".join(f"{name} {value}" for name, value in watch.items()),
+            f"tokens: {self.token_counter.tokenizer.name}, {self.token_counter.hits} hits, "
+            f"{self.token_counter.misses} misses",
+            f"search index: {len(self.search_indexer.index)} files, "
+            f"{self.search_indexer.index.trigram_count} trigrams",
+            f"tree: {len(self.tree_model.nodes_by_path)} rows",
+        ]
+        scroll = self.diagnostics_edit.verticalScrollBar().value()
+        self.diagnostics_edit.setPlainText("\n".join(lines))
+        self.diagnostics_edit.verticalScrollBar().setValue(scroll)
+
+    def resetDiagnostics(self):
+        profiler.reset()
+        self.refreshDiagnostics()
+
+    def saveDiagnosticsTrace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Trace", "promptgen-trace.json", "Trace files (*.json)")
+        if path:
             try:
-                _, ext = os.path.splitext(file_path)
-                normalized_path = os.path.abspath(file_path).replace("\\", "/")
-                content = self.extract_text_from_pdf(file_path) if ext.lower() == '.pdf' else open(file_path, 'r', encoding='utf-8', errors='ignore').read()
-                full_prompt += f"\n\nFile: {normalized_path}\n\n```\n{content}\n```"
-            except Exception as e:
-                print(f"Could not read {file_path}: {e}")
-        self.preview_edit.setPlainText(full_prompt)
+                profiler.dump_trace(path)
+            except OSError as e:
+                self.status_label.setText(f"Could not save trace: {e}")
+
+    def onUseIgnoreChanged(self, state):
+        self.tree_model.use_ignore = state == Qt.Checked
+        self.walk_results.clear()
+        self.selection_walker.cancelAll()
+        self.schedulePreviewUpdate()
+
+    def updatePreview(self):
+        missing = []
+        with profiler.stage('preview.select'):
+            selected_files = self.getCheckedItems(self.tree_model.root, missing=missing)
+        for path in missing:
+            if not self.selection_walker.isRunning(path):
+                self.selection_walker.start(path, self.currentFileFilter(), self.tree_model.use_ignore)
+
+        self.watch_manager.setFiles(selected_files)
+
+        # Keep already loaded contents so the preview does not flicker while
+        # the workers revalidate them against the content cache.
+        selected = set(selected_files)
+        self.file_contents = {path: content for path, content in self.file_contents.items() if path in selected}
+        self.token_counter.discard(path for path in self.selected_files if path not in selected)
+        self.file_errors = {}
+        self.selected_files = selected_files
+        self.preview_loader.start(selected_files)
+        self.renderPreview()
+
+    @profiler.timed('preview.render')
+    def renderPreview(self):
+        """!
+        @brief Push the current prompt and file states into the preview.
+
+        Files that are still being loaded or could not be read are shown as
+        placeholder blocks. Blocks of contents that did not change since the
+        last render are reused, which lets the preview skip them as well.
+        """
+        self.render_timer.stop()
+        layout = self.export_layout
+        header = layout.header(self.prompt_edit.toPlainText())
+        footer = layout.footer()
+        self.updateTokenCounts(header + footer)
+        segments = [(engine.PROMPT_SEGMENT, header)]
+        blocks = {}
+        for path in self.selected_files:
+            if path in self.file_errors:
+                content = f"[could not read file: {self.file_errors[path]}]"
+            else:
+                content = self.file_contents.get(path, LOADING_TEXT)
+            keep = self.budget_plan.get(path)
+            cached = self.preview_blocks.get(path)
+            if cached is not None and cached[0] is content and cached[1] == keep:
+                block = cached[2]
+            elif keep == 0:
+                block = layout.file_block(
+                    path, f"[left out to fit the token budget: {self.file_tokens[path]:,} tokens]")
+            else:
+                block = layout.file_block(path, content if keep is None else self.budget_read(path))
+            blocks[path] = (content, keep, block)
+            segments.append((path, block))
+        self.preview_blocks = blocks
+        if footer:
+            segments.append((FOOTER_SEGMENT, footer))
+        self.preview_view.setSegments(segments)
+        self.updateLoadStatus()
+
+    def updateTokenCounts(self, fixed_text):
+        """!
+        @brief Count the tokens of the loaded files and plan the budget.
+
+        The preview workers count every file they load, so this mostly hits
+        the count cache. The counts go to the tree and the total to the
+        token label.
+
+        @param fixed_text Text of the layout that does not depend on the files.
+        """
+        layout = self.export_layout
+        counts = {}
+        for path in self.selected_files:
+            content = self.file_contents.get(path)
+            if content is None:
+                continue
+            counts[path] = self.token_counter.count(path, content, layout)
+        fixed = self.token_counter.count_text(fixed_text)
+        budget = self.budget_spin.value()
+        plan = {}
+        if budget and self.budget_mode != 'report':
+            entries = ((path, tokens, path_priority(path, self.file_priorities)) for path, tokens in counts.items())
+            plan = plan_budget(entries, budget - fixed, self.budget_mode)
+        read = lambda path: self.file_contents[path]
+        count_block = lambda path, text: self.token_counter.count_text(layout.file_block(path, text))
+        cuts = fit_plan(plan, read, counts, count_block, self.read_limits.mode)
+        total = fixed + sum(counts.values())
+        over = bool(budget) and total > budget
+        self.file_tokens = counts
+        self.budget_plan = plan
+        self.budget_cuts = cuts
+        self.budget_read = budget_reader(read, cuts)
+        self.tree_model.setTokenCounts(counts, plan, heapq.nlargest(TOP_CONTRIBUTORS, counts, key=counts.get)
+                                       if over else ())
+
+        kept = total - sum(counts[path] - keep for path, keep in plan.items())
+        text = f"~{kept:,} tokens" + (f" of {budget:,}" if budget else "")
+        if dropped := sum(1 for keep in plan.values() if not keep):
+            text += f", {dropped} file(s) left out"
+        if len(plan) > dropped:
+            text += ", 1 file truncated"
+        if pending := len(self.selected_files) - len(counts) - len(self.file_errors):
+            text += f", {pending} file(s) not counted yet"
+        self.token_label.setText(text)
+        self.token_label.setToolTip(f"Tokenizer: {self.token_counter.tokenizer.name}")
+        style = "color: #d9534f;" if budget and kept > budget else ""
+        if self.token_label.styleSheet() != style:
+            self.token_label.setStyleSheet(style)
+
+    def scheduleRender(self):
+        if not self.render_timer.isActive():
+            self.render_timer.start(30)
+
+    def onBudgetModeChanged(self, mode):
+        self.budget_mode = mode
+        self.scheduleRender()
+
+    def setFilePriority(self, path, priority):
+        if priority == 'normal':
+            self.file_priorities.pop(path, None)
+        else:
+            self.file_priorities[path] = priority
+        self.scheduleRender()
+
+    def updateLoadStatus(self):
+        # file_contents only holds selected files.
+        done = len(self.file_contents)
+        failed = len(self.file_errors)
+        total = len(self.selected_files)
+        parts = []
+        if walking := self.selection_walker.runningRoots():
+            found = sum(self.walk_progress.get(root, 0) for root in walking)
+            parts.append(f"Scanning {len(walking)} folder(s): {found} files found...")
+        if done + failed < total:
+            parts.append(f"Loading {done + failed} of {total} files...")
+        if failed:
+            parts.append(f"{failed} file(s) could not be read.")
+        self.status_label.setText(" ".join(parts))
+        self.status_label.setToolTip("\n".join(f"{path}: {error}" for path, error in self.file_errors.items()))
+
+    def onFileLoaded(self, generation, path, content):
+        if not self.preview_loader.isCurrent(generation):
+            return
+        if self.file_contents.get(path) is content:
+            self.updateLoadStatus()
+            return
+        self.file_contents[path] = content
+        # Coalesce bursts of finished files into a single document patch.
+        if not self.render_timer.isActive():
+            self.render_timer.start(30)
+
+    def onFileFailed(self, generation, path, error):
+        if not self.preview_loader.isCurrent(generation):
+            return
+        self.file_contents.pop(path, None)
+        self.file_errors[path] = error
+        if not self.render_timer.isActive():
+            self.render_timer.start(30)
+
+    def readFile(self, file_path):
+        """!
+        @brief Read a selected file through the content cache.
+
+        Files whose mtime, size and inode are unchanged since the last read
+        are served from memory.
+        """
+        return self.content_cache.get(file_path, self.loadFile)
+
+    def loadPreviewFile(self, file_path):
+        """!
+        @brief readFile() for the preview workers, also counting the tokens.
+        """
+        content = self.readFile(file_path)
+        self.token_counter.count(file_path, content, self.export_layout)
+        return content
+
+    def loadFile(self, file_path):
+        spec = self.pdf_page_ranges.get(file_path)
+        pages = parse_page_range(spec) if spec else None
+        return engine.read_file(file_path, pages, self.pdf_cache, self.read_limits)
+
+    def onTreeContextMenu(self, pos):
+        index = self.tree.indexAt(pos)
+        if not index.isValid():
+            return
+        node = self.tree_proxy.nodeFromIndex(index)
+        path = node.path
+        menu = QMenu(self)
+        if node.is_dir:
+            indexed = self.search_indexer.index.covers(path)
+            action = menu.addAction("Index for Search", lambda: self.toggleSearchRoot(path))
+            action.setCheckable(True)
+            action.setChecked(indexed)
+            # Folders inside an indexed folder are covered by it.
+            action.setEnabled(not indexed or path in self.search_roots)
+        priority_menu = menu.addMenu("Budget priority")
+        current = self.file_priorities.get(path, 'normal')
+        for priority in reversed(PRIORITIES):
+            action = priority_menu.addAction(priority.capitalize(),
+                                             lambda priority=priority: self.setFilePriority(path, priority))
+            action.setCheckable(True)
+            action.setChecked(priority == current)
+        if path.lower().endswith('.pdf'):
+            menu.addAction("Set PDF page range...", lambda: self.editPdfPageRange(path))
+        menu.exec_(self.tree.viewport().mapToGlobal(pos))
+
+    def editPdfPageRange(self, path):
+        """!
+        @brief Ask for the pages of a PDF to include in the prompt.
+
+        An empty answer includes the whole document again.
+        """
+        spec, ok = QInputDialog.getText(
+            self, "PDF page range", "Pages to include (e.g. 1-5, 8, 10-), empty for all:",
+            text=self.pdf_page_ranges.get(path, ""))
+        if not ok:
+            return
+        spec = spec.strip()
+        try:
+            parse_page_range(spec)
+        except ValueError as e:
+            self.status_label.setText(str(e))
+            return
+        if spec:
+            self.pdf_page_ranges[path] = spec
+        else:
+            self.pdf_page_ranges.pop(path, None)
+        self.content_cache.invalidate(path)
+        self.schedulePreviewUpdate()
 
     def onFileChanged(self, path):
-        self.refreshFileWatcher(path)
+        self.content_cache.invalidate(path)
+        self.search_indexer.refreshFile(path)
         self.schedulePreviewUpdate()
 
-    def refreshFileWatcher(self, path):
+    def toggleSearchRoot(self, path):
+        """!
+        @brief Add a folder to the search index or remove it again.
+
+        Indexed folders inside a newly added one are merged into it.
+        """
+        if path in self.search_roots:
+            self.search_roots.remove(path)
+        else:
+            prefix = os.path.join(path, '')
+            self.search_roots = [root for root in self.search_roots if not root.startswith(prefix)] + [path]
+        self.search_indexer.setRoots(self.search_roots)
+        self.search_label.setText("Indexing...")
+
+    def scheduleSearch(self):
+        self.search_timer.start(250)
+
+    def runSearch(self):
         """!
-        @brief Ensure a changed file remains under watch.
+        @brief Start a search for the query in the search box.
+
+        Matches are highlighted once the indexer reports them; an empty
+        query clears the highlight.
+        """
+        self.search_timer.stop()
+        text = self.search_edit.text()
+        if not text:
+            self.search_indexer.cancel()
+            self.tree_model.setSearchMatches(())
+            self.search_check_button.setEnabled(False)
+            self.search_label.setText("")
+            return
+        try:
+            pattern = compile_query(text, self.search_regex_checkbox.isChecked(),
+                                    self.search_case_checkbox.isChecked())
+        except re.error as e:
+            self.search_label.setText(f"Invalid pattern: {e}")
+            return
+        if not self.search_roots:
+            self.search_label.setText("No folders indexed")
+            return
+        self.search_indexer.search(pattern)
 
-        Some editors replace files on save, causing the watcher to drop the
-        path. This method re-adds the file to the watcher if it still exists
-        and is no longer being monitored.
-        
-        @param path Absolute file system path that triggered the change event.
+    def onSearchResults(self, generation, matches):
+        if not self.search_indexer.isCurrent(generation):
+            return
+        self.tree_model.setSearchMatches(matches)
+        self.search_check_button.setEnabled(bool(matches))
+        text = f"{len(matches)} file(s)"
+        if self.search_indexer.isBusy():
+            text += " so far"
+        self.search_label.setText(text)
+
+    def onSearchIndexProgress(self, count):
+        self.search_label.setText(f"Indexing: {count} files...")
+
+    def onSearchIndexSynced(self, count):
+        # Files indexed since the last query may match it as well.
+        if self.search_edit.text():
+            self.scheduleSearch()
+        elif not self.search_indexer.isBusy():
+            self.search_label.setText(f"{count} files indexed")
+
+    @profiler.timed('search.check')
+    def checkSearchMatches(self):
+        """!
+        @brief Check all search matches that pass the current filter.
         """
-        if os.path.exists(path) and path not in self.file_watcher.files():
-            self.file_watcher.addPath(path)
+        file_filter = self.currentFileFilter()
+        for path in sorted(self.tree_model.searchMatches()):
+            if file_filter.matches(os.path.basename(path), False):
+                self.checkItemByPath(path)
 
     def finishRestore(self):
         """!
@@ -321,29 +968,28 @@ class FilePromptApp(QWidget):
             return
         self.update_timer.start(100)
 
-    def onItemChanged(self, item, column):
+    def onItemChanged(self, node):
         """!
         @brief Handle check state changes on tree items.
 
-        When a collapsed directory is checked, its children are lazily
-        loaded, filtered, and visible children are marked as checked.
-        Signals are temporarily blocked to avoid redundant updates.
+        Checking a directory starts a background walk of everything below
+        it; unchecking cancels walks that are still running there.
         """
-        if column != 0:
-            return
-
-        if item.checkState(0) == Qt.Checked:
-            item_path = item.data(0, self.RolePath)
-            if os.path.isdir(item_path) and not item.data(0, self.RoleIsLoaded):
-                self.addItems(item, item_path)
-                item.setData(0, self.RoleIsLoaded, True)
-                self.filter_tree_items()
-                self.tree.blockSignals(True)
-                for i in range(item.childCount()):
-                    child = item.child(i)
-                    if not child.isHidden():
-                        child.setCheckState(0, Qt.Checked)
-                self.tree.blockSignals(False)
+        if node.is_dir:
+            self.selection_walker.cancelBelow(node.path)
+            prefix = os.path.join(node.path, '')
+            for root in list(self.walk_results):
+                if root == node.path or root.startswith(prefix):
+                    del self.walk_results[root]
+            if node.check_state == Qt.Checked:
+                # Checking the last unchecked child also checks its parent;
+                # walk the outermost checked directory, which the selection
+                # is collected from.
+                while node.parent is not self.tree_model.root and node.parent.check_state == Qt.Checked:
+                    node = node.parent
+                if not self.selection_walker.isRunning(node.path):
+                    self.selection_walker.start(node.path, self.currentFileFilter(), self.tree_model.use_ignore)
+                self.updateLoadStatus()
 
         self.schedulePreviewUpdate()
 
@@ -353,6 +999,10 @@ class FilePromptApp(QWidget):
         self.ignore_dot_files_checkbox.setChecked(self.settings.value("hide_dot_files", False, type=bool))
         self.ignore_dunder_checkbox.setChecked(self.settings.value("hide_dunder", False, type=bool))
         self.dark_mode_checkbox.setChecked(self.settings.value("dark_mode", False, type=bool))
+        self.use_ignore_checkbox.setChecked(self.settings.value("use_ignore_files", True, type=bool))
+        self.diagnostics_checkbox.setChecked(self.settings.value("show_diagnostics", False, type=bool))
+        self.search_regex_checkbox.setChecked(self.settings.value("search_regex", False, type=bool))
+        self.search_case_checkbox.setChecked(self.settings.value("search_case", False, type=bool))
         self.toggleDarkMode(Qt.Checked if self.dark_mode_checkbox.isChecked() else Qt.Unchecked)
 
         if window_size := self.settings.value("window_size"):
@@ -361,31 +1011,68 @@ class FilePromptApp(QWidget):
             self.main_splitter.setSizes([int(s) for s in main_sizes])
         if right_sizes := self.settings.value("right_splitter_sizes"):
             self.right_splitter.setSizes([int(s) for s in right_sizes])
+        if preview_sizes := self.settings.value("preview_splitter_sizes"):
+            self.preview_splitter.setSizes([int(s) for s in preview_sizes])
 
-        self.checked_files = self.settings.value("checked_files", [])
+        self.profile_combo.setCurrentText(self.settings.value("selection_profile", ""))
+        selection = self.loadSelection()
         expanded_paths = self.settings.value("expanded_items", [])
+        if isinstance(expanded_paths, str):
+            expanded_paths = [expanded_paths]
 
-        def restore_state():
-            for path in self.checked_files:
-                self.checkItemByPath(path)
-
-            def restore_expanded(item):
-                path = item.data(0, self.RolePath)
-                if path in expanded_paths:
-                    self.tree.expandItem(item)
-                for i in range(item.childCount()):
-                    restore_expanded(item.child(i))
+        self.restoring = True
+        if self.restoreSnapshot():
+            return
 
-            for i in range(self.tree.topLevelItemCount()):
-                restore_expanded(self.tree.topLevelItem(i))
+        @profiler.timed('settings.restore')
+        def restore_state():
+            if selection:
+                self.applySelection(selection)
+            # Only the innermost expanded directories are stored; loading
+            # them expands their ancestors as well.
+            for path in expanded_paths:
+                if node := self.loadItemByPath(path):
+                    self.tree.expand(self.tree_proxy.indexFromNode(node))
 
             self.filter_tree_items()
             self.finishRestore()
 
-        self.restoring = True
-        # Delay restore until tree is fully populated
-        QTimer.singleShot(500, restore_state)
+        # Restore once the window is shown.
+        QTimer.singleShot(0, restore_state)
 
+    @profiler.timed('settings.restore')
+    def restoreSnapshot(self):
+        """!
+        @brief Restore the tree saved on the last exit from its snapshot.
+
+        The saved rows and check states are shown right away. The listed
+        directories are then rescanned in the background, expanded ones
+        first and each directory before its sub directories. The preview is
+        built once all of them have been revalidated.
+
+        @return False if there is no usable snapshot.
+        """
+        roots = load_snapshot(self.snapshot_path)
+        if roots is None:
+            return False
+        try:
+            expanded = self.tree_model.restoreSnapshot(roots)
+        except (IndexError, TypeError, ValueError) as e:
+            print(f"Ignoring invalid tree snapshot: {e}")
+            self.populateTree()
+            return False
+        for path in expanded:
+            if node := self.tree_model.nodeForPath(path):
+                self.tree.expand(self.tree_proxy.indexFromNode(node))
+        self.filter_tree_items()
+
+        expanded = set(expanded)
+        listed = [node.path for node in self.tree_model.iterNodes() if node.is_listed]
+        self.directory_scanner.start([path for path in listed if path in expanded] +
+                                     [path for path in listed if path not in expanded])
+        return True
+
+    @profiler.timed('settings.save')
     def saveSettings(self):
         # Save prompt and UI state
         self.settings.setValue("prompt_text", self.prompt_edit.toPlainText())
@@ -393,119 +1080,210 @@ class FilePromptApp(QWidget):
         self.settings.setValue("hide_dot_files", self.ignore_dot_files_checkbox.isChecked())
         self.settings.setValue("hide_dunder", self.ignore_dunder_checkbox.isChecked())
         self.settings.setValue("dark_mode", self.dark_mode_checkbox.isChecked())
+        self.settings.setValue("use_ignore_files", self.use_ignore_checkbox.isChecked())
+        self.settings.setValue("show_diagnostics", self.diagnostics_checkbox.isChecked())
+        self.settings.setValue("export_layout", self.export_layout.name)
         self.settings.setValue("window_size", self.size())
         self.settings.setValue("main_splitter_sizes", self.main_splitter.sizes())
         self.settings.setValue("right_splitter_sizes", self.right_splitter.sizes())
-
-        # Save checked files from all top-level items
-        checked_files = []
-        for i in range(self.tree.topLevelItemCount()):
-            top_item = self.tree.topLevelItem(i)
-            checked_files.extend(self.getCheckedItems(top_item))
-        self.settings.setValue("checked_files", checked_files)
-
-        # Save expanded items (by path)
-        expanded_paths = []
-        def collect_expanded(item):
-            if item.isExpanded():
-                expanded_paths.append(item.data(0, self.RolePath))
-            for i in range(item.childCount()):
-                collect_expanded(item.child(i))
-
-        for i in range(self.tree.topLevelItemCount()):
-            collect_expanded(self.tree.topLevelItem(i))
-
-        self.settings.setValue("expanded_items", expanded_paths)
+        self.settings.setValue("preview_splitter_sizes", self.preview_splitter.sizes())
+        self.settings.setValue("pdf_page_ranges", json.dumps(self.pdf_page_ranges))
+        self.settings.setValue("token_budget", self.budget_spin.value())
+        self.settings.setValue("budget_mode", self.budget_mode)
+        self.settings.setValue("file_priorities", json.dumps(self.file_priorities))
+        self.settings.setValue("search_roots", json.dumps(self.search_roots))
+        self.settings.setValue("search_regex", self.search_regex_checkbox.isChecked())
+        self.settings.setValue("search_case", self.search_case_checkbox.isChecked())
+        self.settings.setValue("selection_profiles", json.dumps(self.selection_profiles))
+        self.settings.setValue("selection_profile", self.profile_combo.currentText())
+
+        # Save the check states as rules instead of a list of every checked file.
+        self.settings.setValue("selection", json.dumps(self.currentSelection().to_dict()))
+        self.settings.remove("checked_files")
+
+        # Save expanded items (by path); the settings only keep the innermost ones.
+        expanded_paths = {
+            node.path for node in self.tree_model.iterNodes()
+            if node.is_dir and self.tree.isExpanded(self.tree_proxy.indexFromNode(node))
+        }
+        innermost = set(expanded_paths)
+        for path in expanded_paths:
+            parent = os.path.dirname(path)
+            while parent in innermost and parent != path:
+                innermost.discard(parent)
+                path, parent = parent, os.path.dirname(parent)
+        self.settings.setValue("expanded_items", sorted(innermost))
+        save_snapshot(self.snapshot_path, self.tree_model.snapshot(expanded_paths))
 
 
     def closeEvent(self, event):
+        # Pending timers and change notifications would hand new work to the
+        # executors after they are shut down.
+        for timer in (self.update_timer, self.render_timer, self.filter_timer, self.dir_change_timer,
+                      self.search_timer, self.diagnostics_timer):
+            timer.stop()
+        self.watch_manager.blockSignals(True)
+        self.dir_watcher.blockSignals(True)
+        self.preview_loader.shutdown()
+        self.selection_walker.shutdown()
+        self.directory_scanner.shutdown()
+        self.prompt_exporter.shutdown()
+        self.search_indexer.shutdown()
+        shutdown_pool()
         try:
             self.saveSettings()
         except Exception as e:
             print(f"Error saving settings: {e}")
         event.accept()
 
-    def restoreCheckedItems(self):
-        for path in self.checked_files:
-            self.checkItemByPath(path)
+    def loadSelection(self):
+        """!
+        @brief The selection saved on the last exit.
 
-    def checkItemByPath(self, file_path):
-        for i in range(self.tree.topLevelItemCount()):
-            root_item = self.tree.topLevelItem(i)
-            root_path = root_item.data(0, self.RolePath)
-            if not file_path.startswith(root_path):
-                continue
+        Settings of older versions, which list every checked file, are read
+        as one include rule per file.
+        """
+        if self.settings.contains("selection"):
+            try:
+                return Selection.from_dict(json.loads(self.settings.value("selection")))
+            except ValueError as e:
+                print(f"Ignoring invalid saved selection: {e}")
+        checked_files = self.settings.value("checked_files", [])
+        if isinstance(checked_files, str):
+            checked_files = [checked_files]
+        return Selection(dict.fromkeys(checked_files, True))
+
+    @profiler.timed('selection.rules')
+    def currentSelection(self):
+        return Selection(self.tree_model.selectionRules(), self.filter_edit.text(),
+                         self.ignore_dot_files_checkbox.isChecked(), self.ignore_dunder_checkbox.isChecked())
+
+    @profiler.timed('selection.apply')
+    def applySelection(self, selection):
+        """!
+        @brief Check the tree according to the rules of selection.
 
-            relative_parts = os.path.relpath(file_path, root_path).split(os.sep)
-            current_item = root_item
-
-            for part in relative_parts:
-                self.tree.expandItem(current_item)
-                if not current_item.data(0, self.RoleIsLoaded):
-                    self.addItems(current_item, current_item.data(0, self.RolePath))
-                    current_item.setData(0, self.RoleIsLoaded, True)
-
-                found = None
-                for j in range(current_item.childCount()):
-                    child = current_item.child(j)
-                    if child.text(0) == part:
-                        found = child
-                        break
-                if not found:
-                    return  # Path doesn't exist or wasn't loadable
-                current_item = found
-
-            current_item.setCheckState(0, Qt.Checked)
+        Rules are applied parents first and only the rows they name are
+        loaded. The files below included directories are found by the
+        walks when the preview is built.
+        """
+        for node in self.tree_model.topLevelNodes():
+            if node.check_state != Qt.Unchecked:
+                self.tree_model.setCheckState(node, Qt.Unchecked)
+        for path, include in selection.iter_rules():
+            if node := self.loadItemByPath(path, expand=False):
+                self.tree_model.setCheckState(node, Qt.Checked if include else Qt.Unchecked)
+
+    def updateProfileCombo(self):
+        current = self.profile_combo.currentText()
+        self.profile_combo.clear()
+        self.profile_combo.addItems(sorted(self.selection_profiles, key=str.lower))
+        self.profile_combo.setCurrentText(current)
+        self.profile_delete_button.setEnabled(bool(self.selection_profiles))
+
+    def switchProfile(self, name):
+        """!
+        @brief Replace the selection and the filter with a saved profile.
+        """
+        try:
+            selection = Selection.from_dict(self.selection_profiles[name])
+        except (KeyError, ValueError) as e:
+            self.status_label.setText(f"Could not load the selection {name!r}: {e}")
             return
+        self.filter_edit.setText(selection.extensions)
+        self.ignore_dot_files_checkbox.setChecked(selection.ignore_dot)
+        self.ignore_dunder_checkbox.setChecked(selection.ignore_dunder)
+        self.filter_tree_items()
+        self.applySelection(selection)
+        self.status_label.setText(f"Switched to {name} ({len(selection)} rules).")
+
+    def saveProfile(self):
+        name, ok = QInputDialog.getText(self, "Save Selection", "Name of the selection:",
+                                        text=self.profile_combo.currentText())
+        name = name.strip()
+        if not ok or not name:
+            return
+        self.selection_profiles[name] = self.currentSelection().to_dict()
+        self.updateProfileCombo()
+        self.profile_combo.setCurrentText(name)
 
-    def extract_text_from_pdf(self, file_path):
-        content = ''
-        try:
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                content = ''.join(page.extract_text() for page in reader.pages if page.extract_text())
-        except Exception as e:
-            print(f"Error reading PDF {file_path}: {e}")
-        return content
+    def deleteProfile(self):
+        self.selection_profiles.pop(self.profile_combo.currentText(), None)
+        self.updateProfileCombo()
 
-    def filter_tree_items(self):
-        filter_ext = [ext.strip().lower() for ext in self.filter_edit.text().split(',')] if self.filter_edit.text() else []
-        self.recursive_filter_items(self.tree.invisibleRootItem(), filter_ext)
-
-    def recursive_filter_items(self, item, filter_ext):
-        any_child_visible = False
-        for i in range(item.childCount()):
-            child = item.child(i)
-            child_visible = self.recursive_filter_items(child, filter_ext)
-            any_child_visible |= child_visible
-            child.setHidden(not child_visible)
-        if item == self.tree.invisibleRootItem():
-            return True  # Always process the invisible root
-
-        item_name = item.text(0)
-        _, ext = os.path.splitext(item_name.lower())
-        item_path = item.data(0, self.RolePath)
-        is_dir = os.path.isdir(item_path)
-        
-        # Directories always "match" the extension filter.
-        matches_filter = True if is_dir else (ext in filter_ext if filter_ext else True)
-        
-        # Use the new checkbox names.
-        ignore_dot = self.ignore_dot_files_checkbox.isChecked() and item_name.startswith('.')
-        ignore_dunder = self.ignore_dunder_checkbox.isChecked() and item_name.startswith('__')
-        
-        # Item is visible if it matches the filter or has visible children and isn't being ignored.
-        item_visible = (matches_filter or any_child_visible) and not (ignore_dot or ignore_dunder)
-        
+    def checkItemByPath(self, file_path):
+        if node := self.loadItemByPath(file_path):
+            self.tree_model.setCheckState(node, Qt.Checked)
+
+    def loadItemByPath(self, path, expand=True):
+        """!
+        @brief Return the node for path, loading its ancestors if needed.
+
+        The nearest indexed ancestor is looked up in the path index and only
+        the missing levels below it are loaded, each with a single index
+        lookup. With expand, all ancestors of the returned node are expanded.
+
+        @return The FileNode, or None if the path does not exist in the tree.
+        """
+        missing = []
+        current = path
+        while self.tree_model.nodeForPath(current) is None:
+            parent_path = os.path.dirname(current)
+            if parent_path == current:
+                return None
+            missing.append(os.path.basename(current))
+            current = parent_path
+
+        node = self.tree_model.nodeForPath(current)
+        for name in reversed(missing):
+            node = self.tree_model.childForName(node, name)
+            if node is None:
+                return None  # Path doesn't exist or wasn't loadable
+
+        ancestor = node.parent if expand else self.tree_model.root
+        while ancestor is not self.tree_model.root:
+            index = self.tree_proxy.indexFromNode(ancestor)
+            if not self.tree.isExpanded(index):
+                self.tree.expand(index)
+            ancestor = ancestor.parent
+        return node
+
+    def currentFileFilter(self):
+        return engine.FileFilter(
+            engine.parse_extensions(self.filter_edit.text()),
+            self.ignore_dot_files_checkbox.isChecked(),
+            self.ignore_dunder_checkbox.isChecked(),
+        )
+
+    def isNodeVisible(self, node, file_filter):
         # Always show drive roots and other top-level items.
-        if item.parent() is None:
-            item_visible = True
+        return node.parent is self.tree_model.root or \
+            file_filter.matches_parts(node.ext, node.is_dir, node.flags)
+
+    def scheduleFilterUpdate(self):
+        """!
+        @brief Debounce filter edits so typing does not re-filter per keystroke.
+        """
+        self.filter_timer.start(150)
 
-        item.setHidden(not item_visible)
-        return item_visible
+    @profiler.timed('tree.filter')
+    def filter_tree_items(self):
+        """!
+        @brief Apply the current filter to the tree and the preview.
 
+        The proxy model only re-evaluates rows when the filter actually
+        changed; rows added later are filtered as they are inserted.
+        """
+        self.filter_timer.stop()
+        if self.tree_proxy.setFileFilter(self.currentFileFilter()):
+            # Walks honour the filter, so their results are stale now.
+            self.walk_results.clear()
+            self.selection_walker.cancelAll()
+            self.schedulePreviewUpdate()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    app.setOrganizationName("MyCompany")
+    app.setApplicationName("FilePromptApp")
     ex = FilePromptApp()
     sys.exit(app.exec_())
\ No newline at end of file
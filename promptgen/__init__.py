@@ -0,0 +1,49 @@
+"""!
+@brief Prompt assembly for PromptGen, usable without the GUI.
+"""
+from .cache import ContentCache, file_signature
+from .engine import (
+    FileFilter,
+    collect_files,
+    extract_text_from_pdf,
+    format_file_block,
+    normalize_path,
+    parse_extensions,
+    read_file,
+    walk_files,
+)
+from .export import LAYOUTS, build_prompt, export_prompt, get_layout, iter_export, open_target
+from .pdf import PdfTextCache, parse_page_range
+from .search import SearchIndex, compile_query
+from .selection import Selection
+from .textfile import ReadLimits, read_text
+from .tokens import TokenCounter, make_tokenizer, plan_budget
+
+__all__ = [
+    "ContentCache",
+    "FileFilter",
+    "LAYOUTS",
+    "PdfTextCache",
+    "ReadLimits",
+    "SearchIndex",
+    "Selection",
+    "TokenCounter",
+    "build_prompt",
+    "collect_files",
+    "compile_query",
+    "export_prompt",
+    "extract_text_from_pdf",
+    "file_signature",
+    "format_file_block",
+    "get_layout",
+    "iter_export",
+    "make_tokenizer",
+    "normalize_path",
+    "open_target",
+    "parse_extensions",
+    "parse_page_range",
+    "plan_budget",
+    "read_file",
+    "read_text",
+    "walk_files",
+]
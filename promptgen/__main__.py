@@ -0,0 +1,182 @@
+"""!
+@file __main__.py
+@brief Command line front end: python -m promptgen [options] PATH...
+"""
+import argparse
+import json
+import os
+import sys
+
+from .engine import FileFilter, collect_files, parse_extensions, read_file
+from .export import LAYOUTS, export_prompt, get_layout, open_target
+from .instrument import profiler
+from .pdf import PdfTextCache, parse_page_range
+from .selection import Selection
+from .textfile import TRUNCATE_MODES, ReadLimits
+from .tokens import BUDGET_MODES, TokenCounter, budget_reader, fit_plan, make_tokenizer, plan_budget
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m promptgen",
+        description="Combine a prompt with the contents of files, like the PromptGen GUI.",
+    )
+    parser.add_argument("paths", nargs="*", help="files, directories or glob patterns (use ** for recursion)")
+    prompt_group = parser.add_mutually_exclusive_group()
+    prompt_group.add_argument("-p", "--prompt", default="", help="prompt text placed before the files")
+    prompt_group.add_argument("-P", "--prompt-file", help="read the prompt from a file ('-' for stdin)")
+    parser.add_argument("-e", "--extensions", default="", help="only include these extensions, e.g. '.txt, .py'")
+    parser.add_argument("--ignore-dot", action="store_true", help="skip files and directories starting with '.'")
+    parser.add_argument("--ignore-dunder", action="store_true", help="skip files and directories starting with '__'")
+    parser.add_argument("--no-ignore", action="store_true",
+                        help="do not apply .gitignore/.promptignore rules or skip .git, node_modules, ...")
+    parser.add_argument("--selection", metavar="FILE",
+                        help="add the files of a selection saved as JSON, with its own filter")
+    parser.add_argument("-o", "--output", help="write to this file instead of stdout (gzipped if it ends in .gz)")
+    parser.add_argument("--layout", choices=LAYOUTS, default="markdown",
+                        help="markdown code blocks, xml elements or jsonl records (default: markdown)")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output, also when writing to stdout")
+    parser.add_argument("--pdf-pages", action="append", default=[], metavar="[PDF=]PAGES",
+                        help="only include these pages, e.g. '1-5, 8'; prefix with a PDF path to "
+                             "limit a single document (repeatable)")
+    parser.add_argument("--no-pdf-cache", action="store_true", help="do not use the on-disk PDF text cache")
+    parser.add_argument("--max-bytes", type=int, default=0, help="truncate each file to this many bytes")
+    parser.add_argument("--max-lines", type=int, default=0, help="truncate each file to this many lines")
+    parser.add_argument("--tokenizer", default="chars", metavar="SPEC",
+                        help="token counter: 'chars' (4 characters per token), 'chars:N', 'tiktoken[:ENCODING]' "
+                             "or 'hf:TOKENIZER.JSON' (default: chars)")
+    parser.add_argument("--budget", type=int, default=0, metavar="TOKENS",
+                        help="fit the prompt into this many tokens (see --budget-mode)")
+    parser.add_argument("--budget-mode", choices=BUDGET_MODES, default="drop",
+                        help="drop or truncate the largest files to fit the budget, or only report (default: drop)")
+    parser.add_argument("--count-tokens", action="store_true",
+                        help="print the tokens of every file and the total to stderr")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write stage timings and counters to FILE in Chrome trace format")
+    parser.add_argument("--truncate", choices=TRUNCATE_MODES, default="head",
+                        help="keep the head, the tail or both ends of truncated files (default: head)")
+    return parser
+
+
+def parse_pdf_pages(values):
+    """!
+    @brief Split --pdf-pages values into a default and per-document ranges.
+
+    @return Tuple (default_ranges, {absolute_path: ranges}).
+    """
+    default = None
+    per_file = {}
+    for value in values:
+        path, sep, spec = value.rpartition('=')
+        if sep:
+            per_file[os.path.abspath(path)] = parse_page_range(spec)
+        else:
+            default = parse_page_range(spec)
+    return default, per_file
+
+
+def make_reader(args):
+    default_pages, per_file_pages = parse_pdf_pages(args.pdf_pages)
+    pdf_cache = None if args.no_pdf_cache else PdfTextCache()
+    limits = ReadLimits(args.max_bytes, args.max_lines, args.truncate)
+
+    def reader(file_path):
+        pages = per_file_pages.get(os.path.abspath(file_path), default_pages)
+        return read_file(file_path, pages, pdf_cache, limits)
+    return reader
+
+
+def read_prompt(args):
+    if args.prompt_file == "-":
+        return sys.stdin.read()
+    if args.prompt_file:
+        with open(args.prompt_file, "r", encoding="utf-8") as f:
+            return f.read()
+    return args.prompt
+
+
+def apply_budget(args, prompt_text, files, reader):
+    """!
+    @brief Count the tokens of all files and fit them into --budget.
+
+    The files are read once for counting and again while writing, so the
+    output is still streamed.
+
+    @return The files to write and the reader to use for them.
+    """
+    counter = TokenCounter(make_tokenizer(args.tokenizer))
+    layout = get_layout(args.layout)
+    fixed = counter.count_text(layout.header(prompt_text) + layout.footer())
+    tokens = {}
+    for file_path in files:
+        try:
+            content = reader(file_path)
+        except Exception:
+            continue  # reported when writing
+        tokens[file_path] = counter.count(file_path, content, layout)
+    plan = {}
+    if args.budget and args.budget_mode != 'report':
+        plan = plan_budget(((path, count, 1) for path, count in tokens.items()), args.budget - fixed,
+                           args.budget_mode)
+    cuts = fit_plan(plan, reader, tokens, lambda path, text: counter.count_text(layout.file_block(path, text)),
+                    args.truncate)
+    if args.count_tokens:
+        for file_path, count in tokens.items():
+            note = "" if file_path not in plan else " (dropped)" if not plan[file_path] else f" -> {plan[file_path]}"
+            print(f"{count:>10} {file_path}{note}", file=sys.stderr)
+    total = fixed + sum(tokens.values()) - sum(tokens[path] - keep for path, keep in plan.items())
+    budget = f" of {args.budget}" if args.budget else ""
+    print(f"{total:>10} tokens{budget} ({counter.tokenizer.name})", file=sys.stderr)
+    files = [file_path for file_path in files if plan.get(file_path) != 0]
+    return files, budget_reader(reader, cuts)
+
+
+def load_selection(path):
+    """!
+    @brief Selection from a JSON file in the format of Selection.to_dict().
+
+    @throws OSError if the file cannot be read, ValueError if it is not a selection.
+    """
+    with open(path, encoding="utf-8") as f:
+        try:
+            return Selection.from_dict(json.load(f))
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from e
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.paths and not args.selection:
+        parser.error("give at least one path or --selection")
+    try:
+        reader = make_reader(args)
+        selection = load_selection(args.selection) if args.selection else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.trace:
+        profiler.enabled = True
+    file_filter = FileFilter(parse_extensions(args.extensions), args.ignore_dot, args.ignore_dunder)
+    missing = []
+    with profiler.stage('collect'):
+        files = collect_files(args.paths, file_filter, not args.no_ignore, missing)
+        if selection is not None:
+            seen = set(files)
+            files += [path for path in selection.iter_files(use_ignore=not args.no_ignore) if path not in seen]
+    if missing:
+        parser.error("no such file or directory: " + ", ".join(missing))
+    if not files:
+        print("No files matched.", file=sys.stderr)
+
+    prompt_text = read_prompt(args)
+    if args.budget or args.count_tokens:
+        files, reader = apply_budget(args, prompt_text, files, reader)
+    with open_target(args.output or "-", True if args.gzip else None) as stream:
+        export_prompt(stream, prompt_text, files, reader, args.layout)
+    if args.trace:
+        profiler.dump_trace(args.trace)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""!
+@file cache.py
+@brief In-memory file content cache with LRU eviction.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from .instrument import profiler
+
+
+def file_signature(path):
+    """!
+    @brief Identity of a file's current contents.
+
+    @return Tuple of (mtime_ns, size, inode) used to detect modifications.
+    @throws OSError if the file cannot be stat'ed.
+    """
+    profiler.count('stat_calls')
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class ContentCache:
+    """!
+    @brief Cache of file texts keyed on path and stat signature.
+
+    An entry is reused as long as the file's mtime, size and inode are
+    unchanged, so a rebuild only reads files that were actually modified.
+    The total size of cached texts is bounded by max_chars; the least
+    recently used entries are evicted first. All methods are thread-safe.
+    """
+
+    def __init__(self, max_chars=256 * 1024 * 1024):
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> (signature, content)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, loader):
+        """!
+        @brief Return the content of path, loading it only when stale.
+
+        @param path File to read.
+        @param loader Callable taking the path and returning its text.
+        """
+        signature = file_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                profiler.count('cache_hits')
+                return entry[1]
+            self.misses += 1
+        profiler.count('cache_misses')
+        content = loader(path)
+        self._store(path, signature, content)
+        return content
+
+    def _store(self, path, signature, content):
+        with self._lock:
+            self._discard(path)
+            if len(content) > self.max_chars:
+                return
+            self._entries[path] = (signature, content)
+            self._size += len(content)
+            while self._size > self.max_chars:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _discard(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def invalidate(self, path):
+        with self._lock:
+            self._discard(path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def set_max_chars(self, max_chars):
+        with self._lock:
+            self.max_chars = max_chars
+            while self._size > self.max_chars and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
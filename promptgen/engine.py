@@ -0,0 +1,207 @@
+"""!
+@file engine.py
+@brief Qt-free prompt assembly.
+
+Finding, reading and formatting the files of a prompt lives here, so the
+same output can be produced by the GUI, the command line and batch jobs
+without starting Qt. export.py assembles the combined prompt from these
+pieces.
+"""
+import glob
+import os
+import re
+import sys
+
+from .instrument import profiler
+from .pdf import extract_text_from_pdf
+from .textfile import read_text, truncate_text
+
+
+def parse_extensions(text):
+    """!
+    @brief Split a filter string such as ".txt, .py" into extensions.
+
+    @param text Comma separated extensions as typed into the filter box.
+    @return Lower-cased extensions, or an empty list when no filter is set.
+    """
+    return [ext.strip().lower() for ext in text.split(',')] if text else []
+
+
+NAME_DOT = 1
+NAME_DUNDER = 2
+
+
+def name_flags(name):
+    """!
+    @brief Bit mask of NAME_DOT and NAME_DUNDER describing a file name.
+    """
+    flags = 0
+    if name.startswith('.'):
+        flags |= NAME_DOT
+    if name.startswith('__'):
+        flags |= NAME_DUNDER
+    return flags
+
+
+def name_extension(name):
+    """!
+    @brief Lower-cased extension of a file name, including the dot.
+    """
+    return sys.intern(os.path.splitext(name.lower())[1])
+
+
+class FileFilter:
+    """!
+    @brief Name based visibility rules shared by the tree and the walker.
+
+    Directories always match the extension filter. Dot and dunder names are
+    rejected regardless of their type when the corresponding flag is set.
+    """
+
+    def __init__(self, extensions=(), ignore_dot=False, ignore_dunder=False):
+        self.extensions = list(extensions)
+        self.ignore_dot = ignore_dot
+        self.ignore_dunder = ignore_dunder
+        self._extension_set = frozenset(self.extensions)
+        self._ignored_flags = (NAME_DOT if ignore_dot else 0) | (NAME_DUNDER if ignore_dunder else 0)
+
+    def __eq__(self, other):
+        return isinstance(other, FileFilter) and \
+            (self.extensions, self.ignore_dot, self.ignore_dunder) == \
+            (other.extensions, other.ignore_dot, other.ignore_dunder)
+
+    def __hash__(self):
+        return hash((tuple(self.extensions), self.ignore_dot, self.ignore_dunder))
+
+    def is_ignored(self, name):
+        return bool(name_flags(name) & self._ignored_flags)
+
+    def matches_extension(self, name):
+        return not self.extensions or name_extension(name) in self._extension_set
+
+    def matches(self, name, is_dir):
+        return self.matches_parts(name_extension(name), is_dir, name_flags(name))
+
+    def matches_parts(self, ext, is_dir, flags):
+        """!
+        @brief matches() for a name whose extension and flags are precomputed.
+        """
+        if flags & self._ignored_flags:
+            return False
+        return is_dir or not self.extensions or ext in self._extension_set
+
+
+def normalize_path(path):
+    """!
+    @brief Absolute path with forward slashes, as shown in the prompt.
+    """
+    return os.path.abspath(path).replace("\\", "/")
+
+
+def sort_entries(entries):
+    """!
+    @brief Order (name, is_dir) pairs like the file tree.
+
+    Directories come before files and both groups are sorted
+    case-insensitively by name.
+    """
+    return sorted(entries, key=lambda e: (not e[1], e[0].lower()))
+
+
+def walk_files(root, file_filter=None, use_ignore=True):
+    """!
+    @brief Yield the files below a directory in file tree order.
+
+    See walker.iter_walk() for the traversal and ignore rules.
+    """
+    from .walker import iter_walk  # walker builds on FileFilter from this module
+    return iter_walk(root, file_filter, use_ignore)
+
+
+def collect_files(patterns, file_filter=None, use_ignore=True, missing=None):
+    """!
+    @brief Expand paths and glob patterns into an ordered list of files.
+
+    Literal paths are taken as given apart from the extension filter, glob
+    matches are subject to the whole filter and directories are walked with
+    walk_files(). Duplicates are dropped, keeping the first occurrence.
+
+    @param patterns Iterable of file paths, directory paths or glob patterns.
+    @param file_filter Optional FileFilter.
+    @param use_ignore Whether directory walks honour ignore files and pruning.
+    @param missing Optional list; literal paths that do not exist are
+    appended to it.
+    @return List of file paths.
+    """
+    file_filter = file_filter or FileFilter()
+    files = []
+    seen = set()
+
+    def add(path):
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            files.append(path)
+
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = [(path, True) for path in sorted(glob.glob(pattern, recursive=True))]
+        else:
+            matches = [(pattern, False)]
+        for path, from_glob in matches:
+            is_dir = os.path.isdir(path)
+            if from_glob and not file_filter.matches(os.path.basename(path), is_dir):
+                continue
+            if is_dir:
+                for child in walk_files(path, file_filter, use_ignore):
+                    add(child)
+            elif not os.path.exists(path):
+                if missing is not None:
+                    missing.append(path)
+            elif file_filter.matches_extension(os.path.basename(path)):
+                add(path)
+    return files
+
+
+def read_file(file_path, pdf_pages=None, pdf_cache=None, limits=None):
+    """!
+    @brief Return the text of a file as it appears in the prompt.
+
+    PDFs are converted to text, everything else is read as UTF-8 with
+    undecodable bytes dropped. Binary files and content cut by limits are
+    replaced by visible markers (see textfile.read_text()).
+
+    @param file_path File to read.
+    @param pdf_pages Optional page ranges (see pdf.parse_page_range()) for PDFs.
+    @param pdf_cache Optional pdf.PdfTextCache for extracted PDF text.
+    @param limits Optional textfile.ReadLimits capping the content.
+    """
+    _, ext = os.path.splitext(file_path)
+    profiler.count('files_read')
+    if ext.lower() == '.pdf':
+        with profiler.stage('read.pdf'):
+            return truncate_text(extract_text_from_pdf(file_path, pdf_pages, pdf_cache), limits)
+    with profiler.stage('read.text'):
+        return read_text(file_path, limits)
+
+
+_BACKTICK_RUN = re.compile(r'`{3,}')
+
+
+def markdown_fence(content):
+    """!
+    @brief Shortest backtick fence, at least three long, that cannot be
+    closed by a backtick run inside content.
+    """
+    if '```' not in content:
+        return '```'
+    return '`' * (max(len(run) for run in _BACKTICK_RUN.findall(content)) + 1)
+
+
+def format_file_block(file_path, content):
+    fence = markdown_fence(content)
+    return f"\n\nFile: {normalize_path(file_path)}\n\n{fence}\n{content}\n{fence}"
+
+
+## Key of the prompt segment in export.iter_export(); never a file path.
+PROMPT_SEGMENT = None
@@ -0,0 +1,239 @@
+"""!
+@file export.py
+@brief Output layouts and streaming export of the combined prompt.
+
+A layout turns the prompt and the file contents into text pieces: a header,
+one block per file and a footer. export_prompt() writes those pieces to a
+stream as soon as each file has been read, so the combined prompt never has
+to exist as a single string.
+"""
+import abc
+import contextlib
+import gzip
+import io
+import json
+import re
+import sys
+from xml.sax.saxutils import quoteattr
+
+from .engine import PROMPT_SEGMENT, format_file_block, normalize_path, read_file
+from .instrument import profiler
+
+## Key of the footer segment; never a file path.
+FOOTER_SEGMENT = ''
+
+
+class Layout(abc.ABC):
+    """!
+    @brief Base class of the output layouts.
+
+    Subclasses implement file_block() and override the other pieces they
+    need. error_block() returns None to leave unreadable files out of the
+    output.
+    """
+
+    name = None
+    suffix = '.txt'
+
+    def header(self, prompt_text):
+        return prompt_text
+
+    @abc.abstractmethod
+    def file_block(self, file_path, content):
+        """!
+        @brief Text of one file in the output.
+        """
+
+    def error_block(self, file_path, message):
+        return None
+
+    def footer(self):
+        return ''
+
+
+class MarkdownLayout(Layout):
+    """!
+    @brief The prompt followed by fenced code blocks, as shown in the preview.
+
+    Fences are longer than any backtick run inside the file, so files that
+    contain Markdown code blocks themselves do not end the block early.
+    """
+
+    name = 'markdown'
+    suffix = '.md'
+
+    def file_block(self, file_path, content):
+        return format_file_block(file_path, content)
+
+
+# Characters that may not appear in XML 1.0 documents, not even in CDATA.
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def xml_cdata(text):
+    """!
+    @brief text as CDATA sections, splitting every ']]>' across two sections.
+    """
+    text = _XML_INVALID.sub('\ufffd', text)
+    return '<![CDATA[' + text.replace(']]>', ']]]]><![CDATA[>') + ']]>'
+
+
+class XmlLayout(Layout):
+    """!
+    @brief A <promptgen> document with one <file> element per file.
+    """
+
+    name = 'xml'
+    suffix = '.xml'
+
+    def header(self, prompt_text):
+        return f"<promptgen>\n<prompt>{xml_cdata(prompt_text)}</prompt>\n"
+
+    def file_block(self, file_path, content):
+        return f"<file path={self._path(file_path)}>{xml_cdata(content)}</file>\n"
+
+    def error_block(self, file_path, message):
+        return f"<file path={self._path(file_path)} error={quoteattr(_XML_INVALID.sub('', message))}/>\n"
+
+    def footer(self):
+        return "</promptgen>\n"
+
+    @staticmethod
+    def _path(file_path):
+        return quoteattr(_XML_INVALID.sub('', normalize_path(file_path)))
+
+
+class JsonlLayout(Layout):
+    """!
+    @brief One JSON record per line: the prompt, then a record per file.
+
+    Records have a type field of "prompt", "file" or "error".
+    """
+
+    name = 'jsonl'
+    suffix = '.jsonl'
+
+    def header(self, prompt_text):
+        return self._record(type='prompt', text=prompt_text)
+
+    def file_block(self, file_path, content):
+        return self._record(type='file', path=normalize_path(file_path), content=content)
+
+    def error_block(self, file_path, message):
+        return self._record(type='error', path=normalize_path(file_path), message=message)
+
+    @staticmethod
+    def _record(**fields):
+        return json.dumps(fields, ensure_ascii=False) + "\n"
+
+
+LAYOUTS = {layout.name: layout for layout in (MarkdownLayout(), XmlLayout(), JsonlLayout())}
+
+
+def get_layout(layout):
+    """!
+    @brief Resolve a layout name; Layout instances are returned as they are.
+
+    @throws ValueError for unknown names.
+    """
+    if isinstance(layout, Layout):
+        return layout
+    try:
+        return LAYOUTS[layout]
+    except KeyError:
+        raise ValueError(f"unknown layout: {layout!r}") from None
+
+
+def _report_error(file_path, message):
+    print(f"Could not read {file_path}: {message}", file=sys.stderr)
+
+
+def iter_export(prompt_text, files, reader=read_file, layout='markdown', on_error=None):
+    """!
+    @brief Yield the combined prompt in a layout as (key, text) segments.
+
+    Keys are PROMPT_SEGMENT for the header, the file path for file and error
+    blocks and FOOTER_SEGMENT for a non-empty footer. Files are read one at a
+    time, right before their segment is yielded.
+
+    @param prompt_text Free text placed before the file blocks.
+    @param files Ordered iterable of file paths.
+    @param reader Callable returning the text of a file.
+    @param layout Layout or layout name.
+    @param on_error Callable taking a path and an error message for files
+    that cannot be read; by default they are reported on stderr.
+    """
+    layout = get_layout(layout)
+    on_error = on_error or _report_error
+    yield PROMPT_SEGMENT, layout.header(prompt_text)
+    for file_path in files:
+        try:
+            content = reader(file_path)
+        except Exception as e:
+            on_error(file_path, str(e))
+            block = layout.error_block(file_path, str(e))
+            if block is not None:
+                yield file_path, block
+            continue
+        yield file_path, layout.file_block(file_path, content)
+    if footer := layout.footer():
+        yield FOOTER_SEGMENT, footer
+
+
+def export_prompt(stream, prompt_text, files, reader=read_file, layout='markdown', on_error=None):
+    """!
+    @brief Stream the combined prompt in a layout to a text stream.
+
+    See iter_export() for the parameters.
+
+    @return Number of characters written.
+    """
+    written = 0
+    with profiler.stage('export', layout=get_layout(layout).name):
+        for _, text in iter_export(prompt_text, files, reader, layout, on_error):
+            stream.write(text)
+            written += len(text)
+    return written
+
+
+def build_prompt(prompt_text, files, reader=read_file, layout='markdown'):
+    """!
+    @brief The combined prompt as one string; see iter_export() for the parameters.
+    """
+    return ''.join(text for _, text in iter_export(prompt_text, files, reader, layout))
+
+
+@contextlib.contextmanager
+def open_target(target, compress=None):
+    """!
+    @brief Open an export target as a UTF-8 text stream.
+
+    @param target File path, or '-' for stdout.
+    @param compress Whether to gzip the output. By default, paths ending in
+    '.gz' are compressed.
+    """
+    if compress is None:
+        compress = target != '-' and target.lower().endswith('.gz')
+    if target == '-':
+        if not compress:
+            try:
+                yield sys.stdout
+            finally:
+                sys.stdout.flush()
+            return
+        raw = gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb')
+        stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        try:
+            yield stream
+        finally:
+            stream.flush()
+            stream.detach()
+            raw.close()
+            sys.stdout.buffer.flush()
+        return
+    if compress:
+        stream = gzip.open(target, 'wt', encoding='utf-8', newline='')
+    else:
+        stream = open(target, 'w', encoding='utf-8', newline='')
+    with stream:
+        yield stream
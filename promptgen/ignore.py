@@ -0,0 +1,205 @@
+"""!
+@file ignore.py
+@brief .gitignore / .promptignore rules and directory pruning.
+
+Rules follow the gitignore syntax: blank lines and # comments are skipped,
+! negates, a trailing / restricts a pattern to directories, a pattern with
+a / in the middle or at the start is anchored to the directory of the
+ignore file, and * ? [...] ** have their usual glob meaning. Compiled rules
+are cached per ignore file and reused until the file changes.
+"""
+import os
+import re
+import threading
+
+IGNORE_FILES = ('.gitignore', '.promptignore')
+
+## Directories that are never descended into when ignore rules are enabled.
+DEFAULT_PRUNE_DIRS = frozenset({
+    '.git', '.hg', '.svn', 'node_modules', '__pycache__',
+    '.venv', 'venv', '.tox', '.nox', '.mypy_cache', '.pytest_cache', '.ruff_cache',
+})
+
+
+class IgnoreRule:
+    __slots__ = ('regex', 'negate', 'dir_only')
+
+    def __init__(self, regex, negate, dir_only):
+        self.regex = regex
+        self.negate = negate
+        self.dir_only = dir_only
+
+    def matches(self, rel_path, is_dir):
+        match = self.regex.fullmatch(rel_path)
+        if match is None:
+            return False
+        # A match through the trailing "/..." group means rel_path lies
+        # inside a matching directory.
+        return is_dir or not self.dir_only or match.group('inside') is not None
+
+
+def translate_pattern(pattern):
+    """!
+    @brief Convert a gitignore pattern (without ! and trailing /) to a regex.
+
+    @return Regex source matching paths relative to the ignore file's
+    directory, with a named group 'inside' for paths below a match.
+    """
+    anchored = '/' in pattern
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                i += 2
+                if i < len(pattern) and pattern[i] == '/':
+                    out.append('(?:.*/)?')
+                    i += 1
+                else:
+                    out.append('.*')
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                chars = pattern[i + 1:end]
+                if chars[0] in '!^':
+                    chars = '^' + chars[1:]
+                out.append('[' + chars.replace('\\', '\\\\') + ']')
+                i = end + 1
+                continue
+        elif c == '\\' and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    prefix = '' if anchored else '(?:.*/)?'
+    return prefix + ''.join(out) + '(?P<inside>/.*)?'
+
+
+def parse_ignore_lines(lines):
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        if not line.endswith('\\ '):
+            line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        try:
+            regex = re.compile(translate_pattern(line), re.DOTALL)
+        except re.error:
+            continue
+        rules.append(IgnoreRule(regex, negate, dir_only))
+    return rules
+
+
+_rules_cache = {}
+_rules_lock = threading.Lock()
+
+
+def load_rules(dir_path):
+    """!
+    @brief Compiled rules of the ignore files in dir_path.
+
+    Each ignore file is parsed once and reused until its mtime or size
+    changes.
+
+    @return List of IgnoreRule, empty if the directory has no ignore file.
+    """
+    rules = []
+    for name in IGNORE_FILES:
+        path = os.path.join(dir_path, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        signature = (st.st_mtime_ns, st.st_size)
+        with _rules_lock:
+            cached = _rules_cache.get(path)
+        if cached is None or cached[0] != signature:
+            try:
+                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                    cached = (signature, parse_ignore_lines(f))
+            except OSError:
+                continue
+            with _rules_lock:
+                _rules_cache[path] = cached
+        rules.extend(cached[1])
+    return rules
+
+
+class IgnoreMatcher:
+    """!
+    @brief Ignore rules in effect for one directory.
+
+    Holds the rule layers of the directory and its ancestors; rules of
+    deeper directories and later lines take precedence, as in git.
+    """
+
+    def __init__(self, layers=(), prune_dirs=DEFAULT_PRUNE_DIRS):
+        self.layers = tuple(layers)
+        self.prune_dirs = prune_dirs
+
+    @classmethod
+    def for_directory(cls, dir_path, prune_dirs=DEFAULT_PRUNE_DIRS):
+        """!
+        @brief Matcher with the ignore files of dir_path and all its ancestors.
+        """
+        chain = []
+        current = os.path.abspath(dir_path)
+        while True:
+            chain.append(current)
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+        layers = []
+        for path in reversed(chain):
+            if rules := load_rules(path):
+                layers.append((path, rules))
+        return cls(layers, prune_dirs)
+
+    def child(self, dir_path, names=None):
+        """!
+        @brief Matcher for a sub directory.
+
+        @param dir_path The sub directory.
+        @param names Optional names listed in dir_path; when given, the
+        ignore files are only read if they are among them.
+        """
+        if names is not None and not any(name in names for name in IGNORE_FILES):
+            return self
+        rules = load_rules(dir_path)
+        if not rules:
+            return self
+        return IgnoreMatcher(self.layers + ((os.path.abspath(dir_path), rules),), self.prune_dirs)
+
+    def is_ignored(self, path, is_dir):
+        if is_dir and os.path.basename(path) in self.prune_dirs:
+            return True
+        path = os.path.abspath(path)
+        ignored = False
+        for base, rules in self.layers:
+            rel_path = path[len(base):].lstrip('/\\').replace('\\', '/')
+            for rule in rules:
+                if rule.matches(rel_path, is_dir):
+                    ignored = not rule.negate
+        return ignored
@@ -0,0 +1,165 @@
+"""!
+@file instrument.py
+@brief Stage timings and counters for the hot paths.
+
+The module level profiler is shared by the engine, the workers and the GUI.
+It is disabled by default; while disabled, stage() returns a shared no-op
+context manager and count() returns immediately, so the hooks can stay in
+the hot paths. Setting the environment variable PROMPTGEN_PROFILE=1 enables
+it from the start.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+_NO_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'args', 'start')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+
+class Profiler:
+    """!
+    @brief Thread-safe collector of stage durations and counters.
+
+    Every stage adds to per-name totals and is kept as a trace event; the
+    newest max_events events are retained for dump_trace().
+    """
+
+    def __init__(self, enabled=False, max_events=100000):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        self._stages = {}  # name -> [calls, total_ns, max_ns]
+        self._counters = {}
+        self._thread_names = {}
+        self._origin = time.perf_counter_ns()
+
+    def stage(self, name, **args):
+        """!
+        @brief Context manager timing one run of the stage name.
+
+        @param args Optional details stored with the trace event.
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name, args)
+
+    def timed(self, name):
+        """!
+        @brief Decorator timing every call of a function as the stage name.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Stage(self, name, None):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def record(self, name, start_ns, duration_ns, args=None):
+        thread = threading.current_thread()
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = [0, 0, 0]
+            stats[0] += 1
+            stats[1] += duration_ns
+            stats[2] = max(stats[2], duration_ns)
+            self._events.append((name, start_ns, duration_ns, thread.ident, args))
+            self._thread_names[thread.ident] = thread.name
+
+    def reset(self):
+        with self._lock:
+            self._events.clear()
+            self._stages.clear()
+            self._counters.clear()
+            self._origin = time.perf_counter_ns()
+
+    def summary(self):
+        """!
+        @brief Totals per stage (in milliseconds) and the counters.
+        """
+        with self._lock:
+            stages = {
+                name: {
+                    'calls': calls,
+                    'total_ms': total / 1e6,
+                    'mean_ms': total / calls / 1e6,
+                    'max_ms': longest / 1e6,
+                }
+                for name, (calls, total, longest) in self._stages.items()
+            }
+            return {'stages': stages, 'counters': dict(self._counters)}
+
+    def format_summary(self):
+        """!
+        @brief summary() as a plain text table, slowest stages first.
+        """
+        summary = self.summary()
+        lines = [f"{'stage':<22}{'calls':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}"]
+        for name, stats in sorted(summary['stages'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<22}{stats['calls']:>8}{stats['total_ms']:>12.1f}"
+                         f"{stats['mean_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+        if summary['counters']:
+            lines.append("")
+            lines.extend(f"{name:<22}{value:>12}" for name, value in sorted(summary['counters'].items()))
+        return "\n".join(lines)
+
+    def dump_trace(self, path):
+        """!
+        @brief Write the events in Chrome trace format (chrome://tracing, Perfetto).
+
+        Counters are added as counter events at the end of the trace and,
+        together with the per-stage totals, under otherData.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+            origin = self._origin
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in thread_names.items()]
+        end_us = 0.0
+        for name, start, duration, tid, args in events:
+            ts = (start - origin) / 1000
+            end_us = max(end_us, ts + duration / 1000)
+            event = {'name': name, 'ph': 'X', 'ts': ts, 'dur': duration / 1000, 'pid': pid, 'tid': tid}
+            if args:
+                event['args'] = args
+            trace.append(event)
+        summary = self.summary()
+        for name, value in summary['counters'].items():
+            trace.append({'name': name, 'ph': 'C', 'ts': end_us, 'pid': pid, 'args': {name: value}})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms', 'otherData': summary}, f)
+
+
+## Profiler shared by the whole application.
+profiler = Profiler(enabled=os.environ.get('PROMPTGEN_PROFILE', '') not in ('', '0'))
@@ -0,0 +1,389 @@
+"""!
+@file loader.py
+@brief Background workers that report back to the GUI through signals.
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from .export import export_prompt, open_target
+from .instrument import profiler
+from .search import SearchIndex
+from .walker import walk_tree
+
+
+class PreviewLoader(QObject):
+    """!
+    @brief Runs a reader over the selected files off the GUI thread.
+
+    Every call to start() begins a new generation and cancels the previous
+    one: queued jobs are dropped and results of jobs that were already
+    running are discarded. Results are delivered through queued signals, so
+    the slots run on the thread that owns the loader.
+    """
+
+    fileLoaded = pyqtSignal(int, str, object)  # generation, path, content
+    fileFailed = pyqtSignal(int, str, str)  # generation, path, error message
+
+    def __init__(self, reader, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.reader = reader
+        self.generation = 0
+        self._futures = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(8, (os.cpu_count() or 1) + 4),
+            thread_name_prefix="preview-loader",
+        )
+
+    def start(self, files):
+        """!
+        @brief Load files in the background, superseding earlier requests.
+
+        @param files Ordered list of paths to read.
+        @return Generation number attached to the emitted results.
+        """
+        self.cancel()
+        with self._lock:
+            generation = self.generation
+        self._futures = [self._executor.submit(self._load, generation, path) for path in files]
+        return generation
+
+    def cancel(self):
+        with self._lock:
+            self.generation += 1
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+
+    def isCurrent(self, generation):
+        return generation == self.generation
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, generation, path):
+        if not self.isCurrent(generation):
+            return
+        try:
+            content = self.reader(path)
+        except Exception as e:
+            if self.isCurrent(generation):
+                self.fileFailed.emit(generation, path, str(e))
+            return
+        if self.isCurrent(generation):
+            self.fileLoaded.emit(generation, path, content)
+
+
+class SelectionWalker(QObject):
+    """!
+    @brief Walks checked directories recursively on a worker pool.
+
+    One walk runs per directory; starting a walk for a directory cancels a
+    walk already running for it. Progress is reported at most every 100 ms.
+    """
+
+    progress = pyqtSignal(str, int)  # root, files found so far
+    finished = pyqtSignal(str, object, object)  # root, WalkResult, token
+
+    def __init__(self, max_workers=2, parent=None):
+        super().__init__(parent)
+        self._running = {}  # root -> cancel event
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="selection-walker")
+
+    def start(self, root, file_filter, use_ignore=True):
+        self.cancel(root)
+        token = threading.Event()
+        self._running[root] = token
+        self._executor.submit(self._walk, root, file_filter, use_ignore, token)
+
+    def cancel(self, root):
+        if token := self._running.pop(root, None):
+            token.set()
+
+    def cancelBelow(self, path):
+        """!
+        @brief Cancel walks of path and of directories inside it.
+        """
+        prefix = os.path.join(path, '')
+        for root in list(self._running):
+            if root == path or root.startswith(prefix):
+                self.cancel(root)
+
+    def cancelAll(self):
+        for root in list(self._running):
+            self.cancel(root)
+
+    def isRunning(self, root):
+        return root in self._running
+
+    def runningRoots(self):
+        return list(self._running)
+
+    def finish(self, root, token):
+        """!
+        @brief Claim a finished walk; False if it was cancelled or superseded.
+        """
+        if self._running.get(root) is not token:
+            return False
+        del self._running[root]
+        return True
+
+    def shutdown(self):
+        self.cancelAll()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _walk(self, root, file_filter, use_ignore, token):
+        last_report = 0.0
+
+        def report(count):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report >= 0.1:
+                last_report = now
+                self.progress.emit(root, count)
+
+        with profiler.stage('walk', root=root):
+            result = walk_tree(root, file_filter, use_ignore, token, report)
+        profiler.count('walk_files', len(result.files))
+        if not result.cancelled:
+            self.finished.emit(root, result, token)
+
+
+class DirectoryScanner(QObject):
+    """!
+    @brief Lists directories one after another on a worker thread.
+
+    Directories are scanned in the order given to start(); each listing is
+    delivered through scanned as a dict mapping names to whether they are
+    directories, or None if the directory could not be read.
+    """
+
+    scanned = pyqtSignal(int, str, object)  # generation, path, entries
+    done = pyqtSignal(int)  # generation
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="directory-scanner")
+
+    def start(self, paths):
+        """!
+        @brief Scan paths in order, superseding earlier requests.
+
+        @return Generation number attached to the emitted results.
+        """
+        self.cancel()
+        self._executor.submit(self._scan, self.generation, list(paths))
+        return self.generation
+
+    def cancel(self):
+        self.generation += 1
+
+    def isCurrent(self, generation):
+        return generation == self.generation
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _scan(self, generation, paths):
+        for path in paths:
+            if not self.isCurrent(generation):
+                return
+            try:
+                with os.scandir(path) as it:
+                    entries = {entry.name: entry.is_dir() for entry in it}
+            except OSError:
+                entries = None
+            self.scanned.emit(generation, path, entries)
+        if self.isCurrent(generation):
+            self.done.emit(generation)
+
+
+class PromptExporter(QObject):
+    """!
+    @brief Streams the combined prompt to a file on a worker thread.
+
+    Exports run one after another. Files are read through the given reader
+    while the output is written, so only one file is held at a time.
+    """
+
+    exported = pyqtSignal(str, int, int)  # target, files written, files skipped
+    failed = pyqtSignal(str, str)  # target, error message
+
+    def __init__(self, reader, parent=None):
+        super().__init__(parent)
+        self.reader = reader
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-exporter")
+
+    def start(self, target, prompt_text, files, layout, reader=None):
+        """!
+        @brief Export prompt_text and files in layout to target (see export.open_target()).
+
+        @param reader Optional reader used instead of the one of the exporter.
+        """
+        self._executor.submit(self._export, target, prompt_text, list(files), layout, reader or self.reader)
+
+    def shutdown(self):
+        # Let a running export finish writing its file.
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _export(self, target, prompt_text, files, layout, reader):
+        skipped = []
+        try:
+            with open_target(target) as stream:
+                export_prompt(stream, prompt_text, files, reader, layout,
+                              lambda path, error: skipped.append(path))
+        except Exception as e:
+            self.failed.emit(target, str(e))
+            return
+        self.exported.emit(target, len(files) - len(skipped), len(skipped))
+
+
+class SearchIndexer(QObject):
+    """!
+    @brief Keeps a search.SearchIndex up to date and runs queries against it.
+
+    Index updates run one after another on one worker thread, queries on
+    another, so a query answers from the files indexed so far while the
+    index is still being built. Every call to search() begins a new query
+    generation and cancels the running query. The index is saved to
+    index_path after each sync and on shutdown, if it changed.
+    """
+
+    progress = pyqtSignal(int)  # files seen by the running sync
+    synced = pyqtSignal(int)  # files in the index
+    results = pyqtSignal(int, object)  # generation, sorted list of matching paths
+
+    def __init__(self, index_path, parent=None):
+        super().__init__(parent)
+        self.index = SearchIndex()
+        self.index_path = index_path
+        self.generation = 0
+        self._cancel = threading.Event()
+        self._query_cancel = threading.Event()
+        self._dirty = False
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._updates = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-indexer")
+        self._queries = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-query")
+
+    def start(self, roots):
+        """!
+        @brief Load the saved index and revalidate it against roots.
+        """
+        self._submit(self._load, list(roots))
+
+    def setRoots(self, roots):
+        """!
+        @brief Index roots from now on, dropping files outside of them.
+        """
+        self._submit(self._setRoots, list(roots))
+
+    def refreshDirectory(self, path):
+        if self.index.covers(path):
+            self._submit(self._refresh, self.index.refresh_directory, path)
+
+    def refreshFile(self, path):
+        if self.index.covers(path):
+            self._submit(self._refresh, self.index.update_file, path)
+
+    def isBusy(self):
+        return self._pending > 0
+
+    def search(self, pattern):
+        """!
+        @brief Look for pattern (see search.compile_query()) in the background.
+
+        @return Generation number attached to the results.
+        """
+        self.cancel()
+        self._query_cancel = cancel = threading.Event()
+        self._queries.submit(self._search, self.generation, pattern, cancel)
+        return self.generation
+
+    def cancel(self):
+        self._query_cancel.set()
+        self.generation += 1
+
+    def isCurrent(self, generation):
+        return generation == self.generation
+
+    def shutdown(self):
+        self._cancel.set()
+        self.cancel()
+        self._queries.shutdown(wait=False, cancel_futures=True)
+        self._updates.shutdown(wait=True, cancel_futures=True)
+        self._save()
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self._pending += 1
+        self._updates.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        notify = False
+        try:
+            notify = fn(*args)
+        except Exception as e:
+            print(f"Search index update failed: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._pending -= 1
+        if notify:
+            self.synced.emit(len(self.index))
+
+    def _load(self, roots):
+        with profiler.stage('search.load'):
+            self.index.load(self.index_path)
+        return self._setRoots(roots)
+
+    def _setRoots(self, roots):
+        if roots != self.index.roots:
+            self.index.set_roots(roots)
+            self._dirty = True
+        last_report = 0.0
+
+        def report(count):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report >= 0.1:
+                last_report = now
+                self.progress.emit(count)
+
+        for root in roots:
+            if self._cancel.is_set():
+                return False
+            if self.index.sync(root, self._cancel, report):
+                self._dirty = True
+        self._save()
+        return True
+
+    def _refresh(self, update, path):
+        if update(path):
+            self._dirty = True
+            return True
+        return False
+
+    def _save(self):
+        if not self._dirty:
+            return
+        try:
+            with profiler.stage('search.save'):
+                self.index.save(self.index_path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Could not save the search index: {e}", file=sys.stderr)
+
+    def _search(self, generation, pattern, cancel):
+        if not self.isCurrent(generation):
+            return
+        matches = self.index.search(pattern, cancel)
+        if self.isCurrent(generation) and not cancel.is_set():
+            self.results.emit(generation, matches)
@@ -0,0 +1,264 @@
+"""!
+@file pdf.py
+@brief PDF text extraction with a persistent on-disk cache.
+
+Extracted page texts are stored per content hash, so unchanged PDFs are
+only parsed once, even across restarts. Large documents are split across a
+process pool on first extraction; the pool is shared by all threads and is
+shut down with shutdown_pool().
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+from .cache import file_signature
+from .instrument import profiler
+
+## Documents with at least this many pages are extracted in parallel.
+PARALLEL_PAGE_THRESHOLD = 32
+
+## Upper bound for the processes of the shared extraction pool.
+MAX_POOL_WORKERS = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def default_cache_dir():
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'promptgen', 'pdf')
+
+
+def parse_page_range(spec):
+    """!
+    @brief Parse a page selection such as "1-5, 8, 10-".
+
+    Pages are 1-based and ranges are inclusive; an open end runs to the last
+    page.
+
+    @return List of (first, last) tuples, last is None for open ranges.
+    @throws ValueError if the selection is malformed.
+    """
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition('-')
+        first = int(first) if first.strip() else 1
+        last = (int(last) if last.strip() else None) if sep else first
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"invalid page range: {part!r}")
+        ranges.append((first, last))
+    return ranges
+
+
+def select_pages(page_texts, ranges):
+    """!
+    @brief Pick the pages covered by ranges, in document order.
+    """
+    count = len(page_texts)
+    wanted = set()
+    for first, last in ranges:
+        wanted.update(range(first - 1, min(count, last if last is not None else count)))
+    return [page_texts[i] for i in sorted(wanted)]
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PdfTextCache:
+    """!
+    @brief Directory of extracted page texts keyed by PDF content hash.
+
+    Each document is stored as a JSON list of page texts. When the total size
+    exceeds max_bytes the least recently used documents are deleted.
+    """
+
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._digests = {}  # PDF path -> (file_signature, content hash)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + '.json')
+
+    def digest(self, file_path):
+        """!
+        @brief Content hash of a PDF, only computed again when its stat signature changes.
+
+        @throws OSError if the file cannot be read.
+        """
+        signature = file_signature(file_path)
+        with self._lock:
+            entry = self._digests.get(file_path)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        digest = hash_file(file_path)
+        with self._lock:
+            self._digests[file_path] = (signature, digest)
+        return digest
+
+    def get(self, digest):
+        path = self._path(digest)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                pages = json.load(f)
+            os.utime(path)  # Mark as recently used for eviction.
+        except (OSError, ValueError):
+            return None
+        return pages
+
+    def put(self, digest, page_texts):
+        """!
+        @brief Store the page texts of a document, best effort.
+
+        A cache directory that cannot be written is reported on stderr and
+        otherwise ignored, so callers still get the text they extracted.
+        """
+        path = self._path(digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(page_texts, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not cache PDF text in {self.directory}: {e}", file=sys.stderr)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            try:
+                with os.scandir(self.directory) as it:
+                    entries = [(e.stat().st_mtime, e.stat().st_size, e.path)
+                               for e in it if e.name.endswith('.json')]
+            except OSError:
+                return
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            try:
+                with os.scandir(self.directory) as it:
+                    for entry in it:
+                        if entry.name.endswith('.json'):
+                            os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _extract_page_span(file_path, start, stop):
+    reader = PyPDF2.PdfReader(file_path)
+    return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+def pool_workers():
+    return min(os.cpu_count() or 1, MAX_POOL_WORKERS)
+
+
+def _shared_pool():
+    """!
+    @brief The process pool for page extraction, created on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=pool_workers())
+        return _pool
+
+
+def shutdown_pool():
+    """!
+    @brief Stop the processes of the shared pool; a later extraction starts a new one.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pages(file_path, max_workers=None):
+    """!
+    @brief Extract the text of every page of a PDF.
+
+    Documents with PARALLEL_PAGE_THRESHOLD pages or more are split into
+    contiguous spans that are extracted by the shared process pool, so
+    concurrent extractions never start more than pool_workers() processes.
+
+    @param max_workers Number of spans, by default pool_workers().
+    @return List with one text per page.
+    """
+    reader = PyPDF2.PdfReader(file_path)
+    page_count = len(reader.pages)
+    workers = max_workers or pool_workers()
+    if page_count < PARALLEL_PAGE_THRESHOLD or workers < 2:
+        return [page.extract_text() or '' for page in reader.pages]
+
+    span = -(-page_count // workers)
+    starts = range(0, page_count, span)
+    try:
+        spans = _shared_pool().map(_extract_page_span, [file_path] * len(starts), starts,
+                                   [min(page_count, start + span) for start in starts])
+        return [text for texts in spans for text in texts]
+    except (OSError, RuntimeError) as e:
+        # Process pools are unavailable in some environments (frozen apps,
+        # restricted sandboxes) and break when a worker dies; fall back to
+        # extracting in this process.
+        print(f"Parallel PDF extraction failed for {file_path}, retrying serially: {e}", file=sys.stderr)
+        shutdown_pool()
+        return [page.extract_text() or '' for page in reader.pages]
+
+
+def extract_text_from_pdf(file_path, pages=None, cache=None):
+    """!
+    @brief Return the text of a PDF.
+
+    @param file_path PDF to read.
+    @param pages Optional list of (first, last) ranges from parse_page_range().
+    @param cache Optional PdfTextCache consulted before parsing the document.
+    """
+    content = ''
+    try:
+        digest = cache.digest(file_path) if cache is not None else None
+        page_texts = cache.get(digest) if digest else None
+        if page_texts is None:
+            with profiler.stage('pdf.parse', path=file_path):
+                page_texts = extract_pages(file_path)
+            profiler.count('pdf_pages_parsed', len(page_texts))
+            if digest:
+                cache.put(digest, page_texts)
+        if pages:
+            page_texts = select_pages(page_texts, pages)
+        content = ''.join(page_texts)
+    except Exception as e:
+        print(f"Error reading PDF {file_path}: {e}", file=sys.stderr)
+    return content
@@ -0,0 +1,501 @@
+"""!
+@file preview.py
+@brief Virtualized, read-only preview of the combined prompt.
+
+The preview keeps the prompt as ordered (key, text) sections instead of a
+QTextDocument. Nothing is laid out ahead of time: PreviewView only slices
+the rows that are visible out of the section texts while painting, so
+opening and scrolling a preview of tens of megabytes costs about the same as
+a small one. File sections can be collapsed to a single header row, and
+PreviewOutlineModel lists them for quick jumps.
+"""
+import bisect
+import operator
+import os
+from array import array
+
+from PyQt5.QtCore import QAbstractListModel, QEvent, QModelIndex, QObject, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QFontDatabase, QKeySequence, QPainter, QPalette
+from PyQt5.QtWidgets import QAbstractScrollArea, QApplication, QMenu
+
+## Characters per chunk of the lazy line index of a section.
+CHUNK_CHARS = 16384
+
+TAB_WIDTH = 4
+
+
+class PreviewSection:
+    """!
+    @brief One segment of the preview and its lazily built line index.
+
+    Sections with a non-empty key are file sections; they get a header row
+    and can be collapsed. A single trailing newline is not shown as an extra
+    empty line.
+    """
+
+    __slots__ = ('key', 'text', 'size', 'line_count', 'titled', 'collapsed', '_newlines')
+
+    def __init__(self, key, text, collapsed=False):
+        self.key = key
+        self.text = text
+        self.size = len(text) - 1 if text.endswith('\n') else len(text)
+        self.line_count = text.count('\n', 0, self.size) + 1 if self.size else 0
+        self.titled = bool(key)
+        self.collapsed = collapsed
+        self._newlines = None  # newlines before the start of each chunk
+
+    def rowCount(self):
+        return self.titled + (0 if self.collapsed else self.line_count)
+
+    def _index(self):
+        if self._newlines is None:
+            counts = array('q', [0])
+            total = 0
+            for start in range(0, self.size, CHUNK_CHARS):
+                total += self.text.count('\n', start, min(start + CHUNK_CHARS, self.size))
+                counts.append(total)
+            self._newlines = counts
+        return self._newlines
+
+    def lineStart(self, line):
+        """!
+        @brief Offset of the first character of line.
+
+        Only the chunk holding the line is searched, so the cost does not
+        depend on the position of the line in the section.
+        """
+        if line == 0:
+            return 0
+        counts = self._index()
+        chunk = bisect.bisect_left(counts, line) - 1
+        pos = chunk * CHUNK_CHARS
+        find = self.text.index
+        for _ in range(line - counts[chunk]):
+            pos = find('\n', pos) + 1
+        return pos
+
+    def lines(self, first, count, max_chars=None):
+        """!
+        @brief Up to count lines from line first as (text, length) pairs.
+
+        @param max_chars Optional limit of the returned text of each line;
+        length is always the full length of the line.
+        """
+        count = min(count, self.line_count - first)
+        if count <= 0:
+            return []
+        text, size = self.text, self.size
+        pos = self.lineStart(first)
+        result = []
+        for _ in range(count):
+            end = text.find('\n', pos, size)
+            if end < 0:
+                end = size
+            stop = end if max_chars is None else min(end, pos + max_chars)
+            result.append((text[pos:stop], end - pos))
+            pos = end + 1
+        return result
+
+
+class PreviewDocument(QObject):
+    """!
+    @brief Ordered sections of the preview and their mapping to rows.
+
+    setSegments() keeps the sections whose key and text did not change,
+    including their line index and collapsed state, so re-applying the
+    segments while files load only touches the files that changed.
+    """
+
+    changed = pyqtSignal()
+    sectionsReset = pyqtSignal()  # the list of file sections changed
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sections = []
+        self._row_starts = [0]
+        self._by_key = {}  # key -> section index
+        self._titled = []
+
+    @property
+    def keys(self):
+        return [section.key for section in self.sections]
+
+    def text(self):
+        return ''.join(section.text for section in self.sections)
+
+    def charCount(self):
+        return sum(len(section.text) for section in self.sections)
+
+    def clear(self):
+        self.setSegments([])
+
+    def setSegments(self, segments):
+        """!
+        @brief Replace the sections with a new list of segments.
+
+        @param segments Iterable of (key, text) pairs in display order.
+        """
+        old_sections = self.sections
+        sections = []
+        for key, text in segments:
+            index = self._by_key.get(key)
+            if index is None:
+                section = PreviewSection(key, text)
+            else:
+                section = old_sections[index]
+                if section.text is not text and section.text != text:
+                    section = PreviewSection(key, text, section.collapsed)
+            sections.append(section)
+        if len(sections) == len(old_sections) and all(map(operator.is_, sections, old_sections)):
+            return
+
+        old_titled = [old_sections[index].key for index in self._titled]
+        self.sections = sections
+        self._by_key = {section.key: index for index, section in enumerate(sections)}
+        self._titled = [index for index, section in enumerate(sections) if section.titled]
+        self._updateRows()
+        if old_titled != [sections[index].key for index in self._titled]:
+            self.sectionsReset.emit()
+        self.changed.emit()
+
+    def _updateRows(self):
+        starts = [0]
+        for section in self.sections:
+            starts.append(starts[-1] + section.rowCount())
+        self._row_starts = starts
+
+    # Rows ------------------------------------------------------------------
+
+    def rowCount(self):
+        return self._row_starts[-1]
+
+    def sectionIndex(self, key):
+        return self._by_key.get(key, -1)
+
+    def sectionRow(self, index):
+        """!
+        @brief First row of section index, its header row for file sections.
+        """
+        return self._row_starts[index]
+
+    def sectionAt(self, row):
+        """!
+        @brief Index of the section shown at row, -1 outside the document.
+        """
+        if row < 0 or row >= self.rowCount():
+            return -1
+        # Sections without rows share their start with the next section;
+        # bisect_right skips them.
+        return bisect.bisect_right(self._row_starts, row) - 1
+
+    def fileSections(self):
+        """!
+        @brief Indexes of the file sections in display order.
+        """
+        return self._titled
+
+    def rows(self, first, count, max_chars=None):
+        """!
+        @brief Contents of count rows starting at row first.
+
+        @return List of (section index, line, text, length) tuples. Header
+        rows have the line -1 and the section key as text.
+        """
+        result = []
+        index = self.sectionAt(first)
+        if index < 0:
+            return result
+        offset = first - self._row_starts[index]
+        while len(result) < count and index < len(self.sections):
+            section = self.sections[index]
+            if section.titled:
+                if offset == 0:
+                    result.append((index, -1, section.key, 0))
+                else:
+                    offset -= 1
+            if not section.collapsed:
+                line = offset
+                for text, length in section.lines(line, count - len(result), max_chars):
+                    result.append((index, line, text, length))
+                    line += 1
+            index += 1
+            offset = 0
+        return result
+
+    def rowsText(self, first, last):
+        """!
+        @brief Text of the rows first to last (inclusive) without header rows.
+        """
+        return '\n'.join(text for _, line, text, _ in self.rows(first, last - first + 1) if line >= 0)
+
+    # Collapsing ------------------------------------------------------------
+
+    def setCollapsed(self, index, collapsed):
+        section = self.sections[index]
+        if not section.titled or section.collapsed == collapsed:
+            return
+        section.collapsed = collapsed
+        self._updateRows()
+        self.changed.emit()
+
+    def setAllCollapsed(self, collapsed):
+        for section in self.sections:
+            if section.titled:
+                section.collapsed = collapsed
+        self._updateRows()
+        self.changed.emit()
+
+
+class PreviewView(QAbstractScrollArea):
+    """!
+    @brief Read-only view of a PreviewDocument that paints only visible rows.
+
+    Rows have a fixed height and text is drawn in a fixed pitch font, so the
+    scroll bars count rows and columns and no layout is ever computed for
+    text outside the viewport. Clicking a file header toggles the section;
+    dragging over text selects whole lines, which Ctrl+C copies. The top row
+    stays in place when the document changes.
+    """
+
+    MARGIN = 4
+
+    def __init__(self, document=None, parent=None):
+        super().__init__(parent)
+        self._document = document or PreviewDocument(self)
+        self._document.changed.connect(self._onDocumentChanged)
+        self._document.sectionsReset.connect(self._onSectionsReset)
+        self._anchor = (None, 0)  # key and line of the top row
+        self._selection = None  # (anchor row, cursor row)
+        self._max_columns = 0
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.viewport().setCursor(Qt.IBeamCursor)
+        self.verticalScrollBar().valueChanged.connect(self._storeAnchor)
+        self._updateMetrics()
+
+    def document(self):
+        return self._document
+
+    def setSegments(self, segments):
+        self._document.setSegments(segments)
+
+    # Geometry --------------------------------------------------------------
+
+    def _updateMetrics(self):
+        metrics = self.fontMetrics()
+        self._line_height = max(1, metrics.lineSpacing())
+        self._char_width = max(1, metrics.horizontalAdvance(' '))
+        self._ascent = metrics.ascent()
+        self._updateScrollBars()
+
+    def pageRows(self):
+        return max(1, self.viewport().height() // self._line_height)
+
+    def pageColumns(self):
+        return max(1, (self.viewport().width() - 2 * self.MARGIN) // self._char_width)
+
+    def rowAt(self, y):
+        return self.verticalScrollBar().value() + y // self._line_height
+
+    def _updateScrollBars(self):
+        v_bar = self.verticalScrollBar()
+        v_bar.setRange(0, max(0, self._document.rowCount() - self.pageRows()))
+        v_bar.setPageStep(self.pageRows())
+        h_bar = self.horizontalScrollBar()
+        h_bar.setRange(0, max(0, self._max_columns - self.pageColumns()))
+        h_bar.setPageStep(self.pageColumns())
+
+    def _storeAnchor(self, row):
+        document = self._document
+        index = document.sectionAt(row)
+        if index >= 0:
+            section = document.sections[index]
+            self._anchor = (section.key, row - document.sectionRow(index) - section.titled)
+
+    def _onDocumentChanged(self):
+        self._selection = None
+        v_bar = self.verticalScrollBar()
+        key, line = self._anchor
+        index = self._document.sectionIndex(key)
+        self._updateScrollBars()
+        if index >= 0:
+            section = self._document.sections[index]
+            row = self._document.sectionRow(index)
+            if line >= 0 and not section.collapsed:
+                row += section.titled + max(0, min(line, section.line_count - 1))
+            v_bar.setValue(row)
+        self.viewport().update()
+
+    def _onSectionsReset(self):
+        self._max_columns = 0
+
+    def scrollToSection(self, key):
+        """!
+        @brief Scroll the section key to the top of the view.
+        """
+        index = self._document.sectionIndex(key)
+        if index >= 0:
+            self.verticalScrollBar().setValue(self._document.sectionRow(index))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._updateScrollBars()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.FontChange:
+            self._updateMetrics()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    # Painting --------------------------------------------------------------
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        palette = self.viewport().palette()
+        width = self.viewport().width()
+        painter.fillRect(self.viewport().rect(), palette.color(QPalette.Base))
+        first = self.verticalScrollBar().value()
+        column = self.horizontalScrollBar().value()
+        columns = self.pageColumns() + 1
+        selected = sorted(self._selection) if self._selection else (-1, -2)
+        header_font = QFont(self.font())
+        header_font.setBold(True)
+        max_columns = self._max_columns
+
+        rows = self._document.rows(first, self.pageRows() + 1, column + columns)
+        for offset, (index, line, text, length) in enumerate(rows):
+            top = offset * self._line_height
+            baseline = top + self._ascent
+            if line < 0:
+                section = self._document.sections[index]
+                painter.fillRect(0, top, width, self._line_height, palette.color(QPalette.AlternateBase))
+                painter.setFont(header_font)
+                painter.setPen(palette.color(QPalette.Text))
+                marker = '▸' if section.collapsed else '▾'
+                painter.drawText(self.MARGIN, baseline, f"{marker} {text}  ({section.line_count} lines)")
+                painter.setFont(self.font())
+                continue
+            max_columns = max(max_columns, length)
+            if selected[0] <= first + offset <= selected[1]:
+                painter.fillRect(0, top, width, self._line_height, palette.color(QPalette.Highlight))
+                painter.setPen(palette.color(QPalette.HighlightedText))
+            else:
+                painter.setPen(palette.color(QPalette.Text))
+            if '\t' in text:
+                text = text.expandtabs(TAB_WIDTH)
+            painter.drawText(self.MARGIN, baseline, text[column:column + columns])
+        painter.end()
+
+        if max_columns > self._max_columns:
+            # Lines are only measured once they are shown.
+            self._max_columns = max_columns
+            QTimer.singleShot(0, self._updateScrollBars)
+
+    # Interaction -----------------------------------------------------------
+
+    def mousePressEvent(self, event):
+        if event.button() != Qt.LeftButton:
+            super().mousePressEvent(event)
+            return
+        row = self.rowAt(event.pos().y())
+        rows = self._document.rows(row, 1)
+        if rows and rows[0][1] < 0:
+            self._selection = None
+            section = self._document.sections[rows[0][0]]
+            self._document.setCollapsed(rows[0][0], not section.collapsed)
+            return
+        self._selection = (row, row) if rows else None
+        self.viewport().update()
+
+    def mouseMoveEvent(self, event):
+        if not self._selection or not event.buttons() & Qt.LeftButton:
+            return
+        y = event.pos().y()
+        v_bar = self.verticalScrollBar()
+        if y < 0:
+            v_bar.setValue(v_bar.value() - 1)
+        elif y > self.viewport().height():
+            v_bar.setValue(v_bar.value() + 1)
+        row = min(max(0, self.rowAt(y)), self._document.rowCount() - 1)
+        self._selection = (self._selection[0], row)
+        self.viewport().update()
+
+    def keyPressEvent(self, event):
+        v_bar = self.verticalScrollBar()
+        if event.matches(QKeySequence.Copy):
+            self.copy()
+        elif event.matches(QKeySequence.SelectAll):
+            self.selectAll()
+        elif event.matches(QKeySequence.MoveToStartOfDocument):
+            v_bar.setValue(0)
+        elif event.matches(QKeySequence.MoveToEndOfDocument):
+            v_bar.setValue(v_bar.maximum())
+        else:
+            super().keyPressEvent(event)
+
+    def contextMenuEvent(self, event):
+        index = self._document.sectionAt(self.rowAt(event.pos().y()))
+        menu = QMenu(self)
+        copy_action = menu.addAction("Copy", self.copy)
+        copy_action.setEnabled(self._selection is not None)
+        if index >= 0:
+            menu.addAction("Copy Section", lambda: QApplication.clipboard().setText(
+                self._document.sections[index].text))
+            section = self._document.sections[index]
+            if section.titled:
+                menu.addAction("Expand Section" if section.collapsed else "Collapse Section",
+                               lambda: self._document.setCollapsed(index, not section.collapsed))
+        menu.addSeparator()
+        menu.addAction("Collapse All", lambda: self._document.setAllCollapsed(True))
+        menu.addAction("Expand All", lambda: self._document.setAllCollapsed(False))
+        menu.exec_(event.globalPos())
+
+    def selectAll(self):
+        if self._document.rowCount():
+            self._selection = (0, self._document.rowCount() - 1)
+            self.viewport().update()
+
+    def selectedText(self):
+        if not self._selection:
+            return ''
+        first, last = sorted(self._selection)
+        return self._document.rowsText(first, last)
+
+    def copy(self):
+        if self._selection:
+            QApplication.clipboard().setText(self.selectedText())
+
+
+class PreviewOutlineModel(QAbstractListModel):
+    """!
+    @brief List of the file sections of a PreviewDocument.
+
+    Rows show the file name; the full path is the tool tip and is returned
+    for Qt.UserRole.
+    """
+
+    def __init__(self, document, parent=None):
+        super().__init__(parent)
+        self.document = document
+        document.sectionsReset.connect(self._reset)
+
+    def _reset(self):
+        self.beginResetModel()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.document.fileSections())
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        section = self.document.sections[self.document.fileSections()[index.row()]]
+        if role == Qt.DisplayRole:
+            return os.path.basename(section.key) or section.key
+        if role == Qt.ToolTipRole:
+            return f"{section.key}\n{section.line_count} lines"
+        if role == Qt.UserRole:
+            return section.key
+        return None
@@ -0,0 +1,506 @@
+"""!
+@file search.py
+@brief Trigram index over file contents for substring and regex search.
+
+Every indexed file is split into the overlapping three byte sequences of
+its lower cased content. A query is turned into the trigrams any match has
+to contain, so only the files holding all of them are read and checked
+against the actual pattern. The index is kept in memory, updated file by
+file and saved to disk, so a restart only has to stat the files again.
+
+Only the first MAX_FILE_BYTES of a file are indexed and searched, matching
+the default size cap of the GUI. Binary files are not indexed. Letters are
+folded as ASCII, so case insensitive queries with other letters fall back
+to checking more files rather than missing matches.
+"""
+import json
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from .cache import file_signature
+from .ignore import IgnoreMatcher
+from .instrument import profiler
+from .textfile import SNIFF_BYTES, is_binary
+from .walker import iter_walk
+
+INDEX_VERSION = 1
+MAX_FILE_BYTES = 1024 * 1024
+
+_MAGIC = b'PGSI'
+_HEADER = struct.Struct('<4sII')
+
+## Characters that are not folded like the index folds them when IGNORECASE
+## applies: non-ASCII letters and the letters that also match one outside
+## ASCII (e.g. 'k' and the Kelvin sign). They end a literal run.
+_UNFOLDABLE = re.compile('[^\x00-\x7f]|[iksIKS]')
+
+
+def trigrams(data):
+    """!
+    @brief Trigrams of the lower cased bytes data as a set of ints.
+    """
+    data = data.lower()
+    return {a | (b << 8) | (c << 16) for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+
+def _literal_terms(text, ignore_case):
+    """!
+    @brief Split a literal into the runs that can be looked up in the index.
+    """
+    if not ignore_case:
+        return [text]
+    return [run for run in _UNFOLDABLE.split(text) if run]
+
+
+def pattern_query(pattern, flags=0):
+    """!
+    @brief Literals a regular expression requires, as a query tree.
+
+    The tree is a str that has to occur, ('and', [trees]), ('or', [trees])
+    or None if the pattern requires nothing that can be looked up. Only
+    literal runs, groups, alternations and repetitions of at least once are
+    considered; everything else just ends the current literal.
+
+    @throws re.error if the pattern is invalid.
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    return _subpattern_query(parsed, parsed.state.flags)
+
+
+def _subpattern_query(subpattern, flags):
+    parts = []
+    run = []
+
+    def flush():
+        if run:
+            parts.extend(_literal_terms(''.join(run), flags & re.IGNORECASE))
+            run.clear()
+
+    for op, av in subpattern:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, item = av
+            parts.append(_subpattern_query(item, (flags | add_flags) & ~del_flags))
+        elif op is sre_parse.BRANCH:
+            branches = [_subpattern_query(item, flags) for item in av[1]]
+            parts.append(None if None in branches else ('or', branches))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            parts.append(_subpattern_query(av[2], flags))
+    flush()
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else ('and', parts)
+
+
+def compile_query(text, regex=False, case_sensitive=False):
+    """!
+    @brief Compile a search query into a pattern.
+
+    @param text Substring to look for, or a regular expression with regex.
+    @throws re.error if a regular expression is invalid.
+    """
+    return re.compile(text if regex else re.escape(text), 0 if case_sensitive else re.IGNORECASE)
+
+
+def read_indexable(path, max_bytes=MAX_FILE_BYTES):
+    """!
+    @brief The bytes of path that are indexed and searched, None for binary files.
+
+    @throws OSError if the file cannot be read.
+    """
+    with open(path, 'rb') as f:
+        data = f.read(max_bytes)
+    return None if is_binary(data[:SNIFF_BYTES]) else data
+
+
+class SearchIndex:
+    """!
+    @brief Trigram index over the text files below a set of roots.
+
+    Files get a document id when they are indexed. Postings are arrays of
+    ids in ascending order, so a changed file gets a new id and its old id
+    is only marked dead; dead ids are dropped once they outnumber the live
+    ones. Directories are walked with the ignore rules (see walker.iter_walk()).
+    All methods are thread-safe.
+    """
+
+    def __init__(self, max_bytes=MAX_FILE_BYTES):
+        self.max_bytes = max_bytes
+        self.roots = []
+        self._paths = []  # id -> path, None once dead
+        self._signatures = []  # id -> (mtime_ns, size)
+        self._ids = {}  # path -> live id
+        self._directories = {}  # walked directory -> names of its indexed files
+        self._postings = {}  # trigram -> array of ids
+        self._dead = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def trigram_count(self):
+        return len(self._postings)
+
+    def covers(self, path):
+        """!
+        @brief Whether path lies within one of the roots.
+        """
+        return any(path == root or path.startswith(os.path.join(root, '')) for root in self.roots)
+
+    def set_roots(self, roots):
+        """!
+        @brief Change the indexed roots; files outside all of them are removed.
+
+        New roots are only indexed by the next sync().
+        """
+        with self._lock:
+            self.roots = list(roots)
+            for directory in [d for d in self._directories if not self.covers(d)]:
+                self._remove_directory(directory)
+
+    # Updates ---------------------------------------------------------------
+
+    def update_file(self, path, signature=None):
+        """!
+        @brief Index path unless it is indexed with an unchanged signature.
+
+        Files that cannot be read are removed from the index. Binary files
+        are kept without any trigrams, so they are not read again until they
+        change.
+
+        @return Whether the index changed.
+        """
+        try:
+            signature = signature or file_signature(path)[:2]
+            with self._lock:
+                doc = self._ids.get(path)
+                if doc is not None and self._signatures[doc] == signature:
+                    return False
+            data = read_indexable(path, self.max_bytes)
+        except OSError:
+            return self.remove_file(path)
+        with profiler.stage('search.index'):
+            grams = trigrams(data) if data is not None else ()
+        profiler.count('search_files_indexed')
+        with self._lock:
+            self._kill(path)
+            doc = len(self._paths)
+            self._paths.append(path)
+            self._signatures.append(signature)
+            self._ids[path] = doc
+            directory, name = os.path.split(path)
+            self._directories.setdefault(directory, set()).add(name)
+            postings = self._postings
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids is None:
+                    ids = postings[gram] = array('I')
+                ids.append(doc)
+        return True
+
+    def remove_file(self, path):
+        with self._lock:
+            if not self._kill(path):
+                return False
+            directory, name = os.path.split(path)
+            self._directories.get(directory, set()).discard(name)
+            self._compact_if_needed()
+        return True
+
+    def _kill(self, path):
+        doc = self._ids.pop(path, None)
+        if doc is None:
+            return False
+        self._paths[doc] = None
+        self._dead += 1
+        return True
+
+    def _remove_directory(self, directory):
+        prefix = os.path.join(directory, '')
+        for path in [d for d in self._directories if d == directory or d.startswith(prefix)]:
+            for name in self._directories.pop(path):
+                self._kill(os.path.join(path, name))
+        self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        if self._dead > 1024 and self._dead > len(self._ids):
+            self.compact()
+
+    def compact(self):
+        """!
+        @brief Renumber the live documents and drop dead ids from the postings.
+        """
+        with self._lock, profiler.stage('search.compact'):
+            remap = array('i', [-1]) * len(self._paths)
+            paths, signatures = [], []
+            for doc, path in enumerate(self._paths):
+                if path is not None:
+                    remap[doc] = len(paths)
+                    self._ids[path] = len(paths)
+                    paths.append(path)
+                    signatures.append(self._signatures[doc])
+            postings = {}
+            for gram, ids in self._postings.items():
+                live = array('I', [remap[doc] for doc in ids if remap[doc] >= 0])
+                if live:
+                    postings[gram] = live
+            self._paths, self._signatures, self._postings = paths, signatures, postings
+            self._dead = 0
+
+    def sync(self, root, cancel=None, progress=None):
+        """!
+        @brief Bring the index in line with everything below root.
+
+        New and modified files are indexed, files that disappeared are
+        removed. Unchanged files only cost a stat call.
+
+        @param cancel Optional threading.Event that stops the walk.
+        @param progress Optional callable invoked with the number of files
+        seen so far each time a directory has been read.
+        @return Number of files that were indexed or removed.
+        """
+        seen = {}
+        changed = 0
+
+        def on_enter(path):
+            seen[path] = set()
+            if progress:
+                progress(sum(len(names) for names in seen.values()))
+
+        with profiler.stage('search.sync', root=root):
+            for path in iter_walk(root, None, True, cancel, on_enter):
+                directory, name = os.path.split(path)
+                seen[directory].add(name)
+                changed += self.update_file(path)
+            if cancel is not None and cancel.is_set():
+                return changed
+            with self._lock:
+                prefix = os.path.join(root, '')
+                for directory in [d for d in self._directories if d == root or d.startswith(prefix)]:
+                    if directory not in self._directories:
+                        continue  # Removed along with a vanished parent.
+                    names = seen.get(directory)
+                    if names is None:
+                        changed += len(self._directories[directory])
+                        self._remove_directory(directory)
+                        continue
+                    for name in self._directories[directory] - names:
+                        changed += self.remove_file(os.path.join(directory, name))
+                for directory in seen:
+                    self._directories.setdefault(directory, set())
+        return changed
+
+    def refresh_directory(self, directory):
+        """!
+        @brief Apply a change of the entries of one directory.
+
+        Files of the directory are compared by signature, new sub
+        directories are synced and vanished ones removed.
+
+        @return Number of files that were indexed or removed.
+        """
+        if directory not in self._directories:
+            return 0
+        try:
+            with os.scandir(directory) as it:
+                entries = [(entry.name, entry.is_dir()) for entry in it]
+        except OSError:
+            entries = []
+        matcher = IgnoreMatcher.for_directory(directory)
+        entries = [(name, is_dir) for name, is_dir in entries
+                   if not matcher.is_ignored(os.path.join(directory, name), is_dir)]
+        changed = 0
+        files = {name for name, is_dir in entries if not is_dir}
+        for name in files:
+            changed += self.update_file(os.path.join(directory, name))
+        for name in self._directories.get(directory, set()) - files:
+            changed += self.remove_file(os.path.join(directory, name))
+        subdirectories = {os.path.join(directory, name) for name, is_dir in entries if is_dir}
+        for path in subdirectories:
+            if path not in self._directories:
+                changed += self.sync(path)
+        with self._lock:
+            for path in [d for d in self._directories if os.path.dirname(d) == directory]:
+                if path not in subdirectories:
+                    changed += len(self._directories[path])
+                    self._remove_directory(path)
+        return changed
+
+    # Queries ---------------------------------------------------------------
+
+    def candidates(self, query):
+        """!
+        @brief Ids of the live documents that may match a query tree.
+
+        @param query Tree as returned by pattern_query().
+        @return Set of ids, or None if every document is a candidate.
+        """
+        with self._lock:
+            return self._evaluate(query)
+
+    def _evaluate(self, query):
+        if query is None:
+            return None
+        if isinstance(query, str):
+            data = query.encode('utf-8')
+            if len(data) < 3:
+                return None
+            lists = []
+            for gram in trigrams(data):
+                ids = self._postings.get(gram)
+                if ids is None:
+                    return set()
+                lists.append(ids)
+            lists.sort(key=len)
+            result = set(lists[0])
+            for ids in lists[1:]:
+                result.intersection_update(ids)
+                if not result:
+                    break
+            return result
+        op, terms = query
+        results = [self._evaluate(term) for term in terms]
+        if op == 'or':
+            if None in results:
+                return None
+            return set().union(*results)
+        results = [result for result in results if result is not None]
+        if not results:
+            return None
+        results.sort(key=len)
+        return results[0].intersection(*results[1:])
+
+    def search(self, pattern, cancel=None):
+        """!
+        @brief Paths of the indexed files that contain a match of pattern.
+
+        The candidates from the index are read again and checked, so files
+        modified since they were indexed only appear if they still match.
+
+        @param pattern Compiled pattern, e.g. from compile_query().
+        @param cancel Optional threading.Event; a cancelled search returns
+        the matches found so far.
+        @return Sorted list of paths.
+        """
+        with profiler.stage('search.query', pattern=pattern.pattern):
+            query = pattern_query(pattern.pattern, pattern.flags)
+            with self._lock:
+                docs = self._evaluate(query)
+                if docs is None:
+                    paths = list(self._ids)
+                else:
+                    paths = [path for doc in docs if (path := self._paths[doc]) is not None]
+            profiler.count('search_candidates', len(paths))
+            matches = []
+            for path in paths:
+                if cancel is not None and cancel.is_set():
+                    break
+                try:
+                    data = read_indexable(path, self.max_bytes)
+                except OSError:
+                    continue
+                if data is not None and pattern.search(data.decode('utf-8', errors='replace')):
+                    matches.append(path)
+        matches.sort()
+        return matches
+
+    # Persistence -----------------------------------------------------------
+
+    def save(self, path):
+        """!
+        @brief Atomically write the index to path.
+        """
+        with self._lock:
+            if self._dead:
+                self.compact()
+            header = json.dumps({
+                'max_bytes': self.max_bytes,
+                'roots': self.roots,
+                'paths': self._paths,
+                'signatures': self._signatures,
+                'directories': sorted(self._directories),
+            }, separators=(',', ':')).encode('utf-8')
+            grams = array('I', self._postings)
+            lengths = array('I', map(len, self._postings.values()))
+            postings = list(self._postings.values())
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, INDEX_VERSION, len(header)))
+                f.write(header)
+                f.write(struct.pack('<I', len(grams)))
+                for values in (grams, lengths, *postings):
+                    f.write(_little_endian(values).tobytes())
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def load(self, path):
+        """!
+        @brief Replace the index with one written by save().
+
+        @return False if the file is missing, unreadable, of another version
+        or was built with another max_bytes; the index is left empty then.
+        """
+        try:
+            with open(path, 'rb') as f:
+                magic, version, header_size = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or version != INDEX_VERSION:
+                    return False
+                header = json.loads(f.read(header_size).decode('utf-8'))
+                if header['max_bytes'] != self.max_bytes:
+                    return False
+                count, = struct.unpack('<I', f.read(4))
+                grams = _read_array(f, count)
+                lengths = _read_array(f, count)
+                postings = {}
+                for gram, length in zip(grams, lengths):
+                    postings[gram] = _read_array(f, length)
+        except (OSError, ValueError, KeyError, struct.error, EOFError):
+            return False
+        with self._lock:
+            self.roots = header['roots']
+            self._paths = header['paths']
+            self._signatures = [tuple(signature) for signature in header['signatures']]
+            self._ids = {path: doc for doc, path in enumerate(self._paths)}
+            self._directories = {directory: set() for directory in header['directories']}
+            for file_path in self._paths:
+                directory, name = os.path.split(file_path)
+                self._directories.setdefault(directory, set()).add(name)
+            self._postings = postings
+            self._dead = 0
+        return True
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _read_array(f, count):
+    values = array('I')
+    values.fromfile(f, count)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
@@ -0,0 +1,165 @@
+"""!
+@file selection.py
+@brief Selections stored as include and exclude rules.
+
+A selection maps paths to whether they are included. A file is selected if
+the closest rule at or above it includes it, so "this directory, minus
+these sub directories" takes one rule per path rather than one entry per
+file. Included directories stand for the files below them that pass the
+filter and the ignore rules; explicit rules below them override the ignore
+rules. The files are only looked up when iter_files() walks the file
+system.
+
+The GUI derives the fewest rules that reproduce its check states (see
+tree_model.FileTreeModel.selectionRules()) and keeps named selections as
+profiles in the same format.
+"""
+import os
+
+from .engine import FileFilter, parse_extensions
+from .walker import iter_walk
+
+
+def tree_key(path, is_dir):
+    """!
+    @brief Sort key placing paths in file tree order.
+
+    Within a directory, sub directories come before files and both are
+    ordered case-insensitively, as in engine.sort_entries().
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    return [(False, part.lower()) for part in parts[:-1]] + [(not is_dir, parts[-1].lower())]
+
+
+class Selection:
+    """!
+    @brief Include and exclude rules plus the file filter they were made with.
+
+    @param rules Dict mapping paths to True (include) or False (exclude).
+    @param extensions Extension filter text, e.g. '.py, .md'.
+    """
+
+    __slots__ = ('rules', 'extensions', 'ignore_dot', 'ignore_dunder')
+
+    def __init__(self, rules=None, extensions='', ignore_dot=False, ignore_dunder=False):
+        self.rules = dict(rules or {})
+        self.extensions = extensions
+        self.ignore_dot = ignore_dot
+        self.ignore_dunder = ignore_dunder
+
+    def __eq__(self, other):
+        return isinstance(other, Selection) and self.to_dict() == other.to_dict()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def iter_rules(self):
+        """!
+        @brief Yield (path, include) pairs, every directory before the paths below it.
+        """
+        yield from sorted(self.rules.items())
+
+    def file_filter(self):
+        return FileFilter(parse_extensions(self.extensions), self.ignore_dot, self.ignore_dunder)
+
+    def to_dict(self):
+        """!
+        @brief JSON serializable form; settings at their defaults are left out.
+        """
+        data = {
+            'include': sorted(path for path, include in self.rules.items() if include),
+            'exclude': sorted(path for path, include in self.rules.items() if not include),
+        }
+        if self.extensions:
+            data['extensions'] = self.extensions
+        if self.ignore_dot:
+            data['ignore_dot'] = True
+        if self.ignore_dunder:
+            data['ignore_dunder'] = True
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """!
+        @brief Selection from the output of to_dict().
+
+        @throws ValueError if data is not a valid selection.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("a selection must be a JSON object")
+        include, exclude = data.get('include', []), data.get('exclude', [])
+        if not all(isinstance(paths, list) and all(isinstance(path, str) for path in paths)
+                   for paths in (include, exclude)):
+            raise ValueError("'include' and 'exclude' must be lists of paths")
+        rules = dict.fromkeys(include, True)
+        rules.update(dict.fromkeys(exclude, False))
+        return cls(rules, str(data.get('extensions', '')), bool(data.get('ignore_dot')),
+                   bool(data.get('ignore_dunder')))
+
+    def is_selected(self, path):
+        """!
+        @brief Whether the closest rule at or above path includes it.
+
+        Filters and ignore rules are not taken into account.
+        """
+        while True:
+            if (include := self.rules.get(path)) is not None:
+                return include
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def iter_files(self, file_filter=None, use_ignore=True, cancel=None):
+        """!
+        @brief Yield the selected files in file tree order.
+
+        Only directories that are included, or that contain rules further
+        down, are listed. Entries hidden by the filter are skipped along with
+        everything below them, like hidden rows of the tree.
+
+        @param file_filter FileFilter to apply, by default the one of the selection.
+        @param use_ignore Whether ignore files and default pruning apply to
+        entries without a rule of their own.
+        @param cancel Optional threading.Event; the walk stops once it is set.
+        """
+        file_filter = file_filter or self.file_filter()
+        branches = set()
+        for path in self.rules:
+            parent = os.path.dirname(path)
+            while parent not in branches and parent != path:
+                branches.add(parent)
+                path, parent = parent, os.path.dirname(parent)
+        starts = [path for path in self.rules if not self._has_rule_above(path)]
+        starts = sorted(((path, os.path.isdir(path)) for path in starts), key=lambda start: tree_key(*start))
+        for path, is_dir in starts:
+            if not self._visible(path, is_dir, file_filter):
+                continue
+            include = self.rules[path]
+            if not is_dir:
+                if include and os.path.isfile(path):
+                    yield path
+            elif include or path in branches:
+                yield from iter_walk(path, file_filter, use_ignore, cancel, rules=self.rules,
+                                     enter_excluded=branches.__contains__)
+
+    def _has_rule_above(self, path):
+        parent = os.path.dirname(path)
+        while parent != path:
+            if parent in self.rules:
+                return True
+            path, parent = parent, os.path.dirname(parent)
+        return False
+
+    @staticmethod
+    def _visible(path, is_dir, file_filter):
+        """!
+        @brief Whether path and its ancestors pass the filter; top-level entries always do.
+        """
+        while True:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return True
+            if not file_filter.matches(os.path.basename(path), is_dir):
+                return False
+            path, is_dir = parent, True
@@ -0,0 +1,50 @@
+"""!
+@file snapshot.py
+@brief On-disk snapshot of the loaded file tree.
+
+The snapshot holds the directories that were listed, the rows that were
+materialized, their check states and which directories were expanded (see
+tree_model.FileTreeModel.snapshot()). It lets the GUI paint the previous
+tree immediately on startup and revalidate it against the file system
+afterwards.
+"""
+import json
+import os
+
+SNAPSHOT_VERSION = 2
+
+
+def load_snapshot(path):
+    """!
+    @brief Read a snapshot written by save_snapshot().
+
+    @return The saved roots, or None if the file is missing, unreadable or
+    of another version.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        return None
+    roots = data.get('roots')
+    return roots if isinstance(roots, dict) else None
+
+
+def save_snapshot(path, roots):
+    """!
+    @brief Atomically write the roots of a snapshot to path.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': SNAPSHOT_VERSION, 'roots': roots}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,195 @@
+"""!
+@file textfile.py
+@brief Binary-safe reading of text files with size and line caps.
+
+Files are opened in binary mode. The first block decides whether a file is
+binary, in which case only a marker is returned. Text files larger than
+MMAP_THRESHOLD are memory mapped, so only the part that ends up in the
+prompt is copied into memory.
+"""
+import mmap
+import os
+
+from .instrument import profiler
+
+SNIFF_BYTES = 8192
+MMAP_THRESHOLD = 1024 * 1024
+
+TRUNCATE_MODES = ('head', 'tail', 'both')
+
+## Control bytes that are common in text files.
+_TEXT_CONTROLS = frozenset(b'\t\n\r\f\b\x1b')
+
+## Every byte except the remaining controls, for counting those with translate().
+_NOT_CONTROLS = bytes(byte for byte in range(256) if byte >= 32 or byte in _TEXT_CONTROLS)
+
+
+def is_binary(block):
+    """!
+    @brief Guess from the first block of a file whether it is binary.
+
+    A NUL byte or more than 30% control bytes mark the file as binary.
+    """
+    if not block:
+        return False
+    if b'\0' in block:
+        return True
+    controls = len(block.translate(None, _NOT_CONTROLS))
+    return controls * 10 > len(block) * 3
+
+
+class ReadLimits:
+    """!
+    @brief Caps applied to the content of a single file.
+
+    @param max_bytes Maximum number of bytes kept, None for no limit.
+    @param max_lines Maximum number of lines kept, None for no limit.
+    @param mode 'head' keeps the start, 'tail' the end and 'both' half of
+    each.
+    """
+
+    __slots__ = ('max_bytes', 'max_lines', 'mode')
+
+    def __init__(self, max_bytes=None, max_lines=None, mode='head'):
+        if mode not in TRUNCATE_MODES:
+            raise ValueError(f"unknown truncation mode: {mode!r}")
+        self.max_bytes = max_bytes or None
+        self.max_lines = max_lines or None
+        self.mode = mode
+
+    def __eq__(self, other):
+        return isinstance(other, ReadLimits) and (
+            (self.max_bytes, self.max_lines, self.mode) == (other.max_bytes, other.max_lines, other.mode))
+
+    def __hash__(self):
+        return hash((self.max_bytes, self.max_lines, self.mode))
+
+    def __bool__(self):
+        return self.max_bytes is not None or self.max_lines is not None
+
+
+def binary_marker(size):
+    return f"[binary file skipped: {size} bytes]"
+
+
+def truncation_marker(omitted, total):
+    return f"[... truncated: {omitted} of {total} bytes omitted ...]"
+
+
+def _head_end(data, start, end, max_bytes, max_lines):
+    """!
+    @brief End offset of the first max_bytes / max_lines of data[start:end].
+    """
+    if max_bytes is not None and start + max_bytes < end:
+        end = start + max_bytes
+        # Cut at a line boundary unless the first line alone is too long.
+        if (newline := data.rfind(b'\n', start, end)) != -1:
+            end = newline + 1
+    if max_lines is not None:
+        pos = start
+        for _ in range(max_lines):
+            pos = data.find(b'\n', pos, end)
+            if pos == -1:
+                return end
+            pos += 1
+        return pos
+    return end
+
+
+def _tail_start(data, start, end, max_bytes, max_lines):
+    """!
+    @brief Start offset of the last max_bytes / max_lines of data[start:end].
+    """
+    if max_bytes is not None and end - max_bytes > start:
+        start = end - max_bytes
+        if (newline := data.find(b'\n', start, end - 1)) != -1:
+            start = newline + 1
+    if max_lines is not None:
+        pos = end
+        # A trailing newline terminates the last line rather than starting
+        # a new one.
+        if pos > start and data[pos - 1:pos] == b'\n':
+            pos -= 1
+        for _ in range(max_lines):
+            pos = data.rfind(b'\n', start, pos)
+            if pos == -1:
+                return start
+        return pos + 1
+    return start
+
+
+def _decode(data):
+    text = data.decode('utf-8', errors='ignore')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def slice_content(data, limits):
+    """!
+    @brief Cut bytes (or an mmap) down to limits, with truncation markers.
+
+    @return The decoded text.
+    """
+    size = len(data)
+    if not limits:
+        return _decode(data[:])
+    max_bytes, max_lines = limits.max_bytes, limits.max_lines
+    if limits.mode == 'both':
+        max_bytes = max_bytes and (max_bytes + 1) // 2
+        max_lines = max_lines and (max_lines + 1) // 2
+    head = tail = size
+    if limits.mode != 'tail':
+        head = _head_end(data, 0, size, max_bytes, max_lines)
+    if limits.mode != 'head':
+        tail = _tail_start(data, head if limits.mode == 'both' else 0, size, max_bytes, max_lines)
+    if limits.mode == 'tail':
+        head = 0
+    omitted = tail - head
+    if omitted <= 0:
+        return _decode(data[:])
+    marker = truncation_marker(omitted, size)
+    parts = []
+    if head:
+        parts.append(_decode(data[:head]).rstrip('\n'))
+    parts.append(marker)
+    if tail < size:
+        parts.append(_decode(data[tail:]))
+    return '\n'.join(parts)
+
+
+def truncate_text(text, limits):
+    """!
+    @brief Apply limits to text that is already in memory, e.g. PDF text.
+    """
+    if not limits:
+        return text
+    return slice_content(text.encode('utf-8'), limits)
+
+
+def read_text(file_path, limits=None):
+    """!
+    @brief Read a text file as UTF-8, honouring limits.
+
+    Undecodable bytes are dropped and line endings are normalized to \\n.
+    Binary files are not read beyond the first block; a marker is returned
+    in their place.
+
+    @param file_path File to read.
+    @param limits Optional ReadLimits.
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        block = f.read(SNIFF_BYTES)
+        if is_binary(block):
+            profiler.count('bytes_read', len(block))
+            profiler.count('binary_files')
+            return binary_marker(size)
+        if size <= MMAP_THRESHOLD:
+            data = block + f.read()
+            profiler.count('bytes_read', len(data))
+            return slice_content(data, limits)
+        # Only the kept part of a mapped file is paged in.
+        profiler.count('bytes_read', min(size, limits.max_bytes or size) if limits else size)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return slice_content(data, limits)
@@ -0,0 +1,276 @@
+"""!
+@file tokens.py
+@brief Token estimates, a per-file count cache and token budgets.
+
+Counting goes through a tokenizer object with a name and a count(text)
+method. CharTokenizer is always available and estimates one token per four
+characters. Real tokenizers are optional dependencies: tiktoken encodings
+and tokenizer.json files of the tokenizers library are loaded by
+make_tokenizer(), which falls back to CharTokenizer when they are missing.
+"""
+import os
+import sys
+import threading
+
+from .instrument import profiler
+from .textfile import ReadLimits, slice_content, truncation_marker
+
+CHARS_PER_TOKEN = 4
+
+## File priorities for the budget, lowest first.
+PRIORITIES = ('low', 'normal', 'high')
+
+## 'report' only shows the counts; 'truncate' and 'drop' shrink the prompt.
+BUDGET_MODES = ('report', 'truncate', 'drop')
+
+
+class CharTokenizer:
+    """!
+    @brief Estimate of chars_per_token characters per token.
+    """
+
+    def __init__(self, chars_per_token=CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+        self.name = 'chars' if chars_per_token == CHARS_PER_TOKEN else f'chars:{chars_per_token}'
+
+    def count(self, text):
+        return -(-len(text) // self.chars_per_token)
+
+
+class TiktokenTokenizer:
+    """!
+    @brief Exact counts for OpenAI style BPE encodings.
+
+    @throws ImportError if tiktoken is not installed.
+    """
+
+    def __init__(self, encoding='cl100k_base'):
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f'tiktoken:{encoding}'
+
+    def count(self, text):
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class HuggingFaceTokenizer:
+    """!
+    @brief Counts of a local tokenizer.json file, e.g. from a model checkout.
+
+    @throws ImportError if the tokenizers package is not installed.
+    """
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer
+        self._tokenizer = Tokenizer.from_file(path)
+        self.name = f'hf:{path}'
+
+    def count(self, text):
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def make_tokenizer(spec):
+    """!
+    @brief Create a tokenizer from a specification.
+
+    'chars' or 'chars:N' estimate N characters per token, 'tiktoken' or
+    'tiktoken:ENCODING' use tiktoken and 'hf:PATH' a tokenizer.json file.
+    Tokenizers that cannot be loaded are reported on stderr and replaced by
+    CharTokenizer.
+
+    @throws ValueError for unknown specifications.
+    """
+    kind, _, arg = (spec or 'chars').partition(':')
+    try:
+        if kind == 'chars':
+            return CharTokenizer(int(arg) if arg else CHARS_PER_TOKEN)
+        if kind == 'tiktoken':
+            return TiktokenTokenizer(arg or 'cl100k_base')
+        if kind == 'hf':
+            return HuggingFaceTokenizer(arg)
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Tokenizer {spec!r} is not available ({e}); estimating from characters.", file=sys.stderr)
+        return CharTokenizer()
+    raise ValueError(f"unknown tokenizer: {spec!r}")
+
+
+class TokenCounter:
+    """!
+    @brief Token counts per file, cached on the file content.
+
+    An entry is reused while the length and hash of the text are unchanged,
+    so rebuilding the prompt only tokenizes files whose content changed.
+    Python caches the hash on the string, which makes repeated lookups of
+    the same content object cheap. All methods are thread-safe.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer or CharTokenizer()
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # path -> ((length, hash, layout name), tokens)
+        self._lock = threading.Lock()
+
+    def count(self, path, text, layout=None):
+        """!
+        @brief Tokens of a file, cached on its text.
+
+        @param layout Optional export.Layout; the whole block of the file in
+        that layout is counted, escaping and markup included.
+        """
+        key = (len(text), hash(text), layout and layout.name)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        with profiler.stage('tokens.count'):
+            tokens = self.tokenizer.count(text if layout is None else layout.file_block(path, text))
+        with self._lock:
+            self._entries[path] = (key, tokens)
+        return tokens
+
+    def count_text(self, text):
+        """!
+        @brief Uncached count for text that is not the content of a file.
+        """
+        return self.tokenizer.count(text)
+
+    def set_tokenizer(self, tokenizer):
+        with self._lock:
+            self.tokenizer = tokenizer
+            self._entries.clear()
+
+    def discard(self, paths):
+        """!
+        @brief Forget the counts of files that are no longer selected.
+        """
+        with self._lock:
+            for path in paths:
+                self._entries.pop(path, None)
+
+
+def path_priority(path, priorities):
+    """!
+    @brief Priority of a file as an index into PRIORITIES.
+
+    @param priorities Dict mapping files and directories to priority names;
+    a file inherits the priority of its closest listed ancestor.
+    """
+    if priorities:
+        while True:
+            if (name := priorities.get(path)) in PRIORITIES:
+                return PRIORITIES.index(name)
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+    return PRIORITIES.index('normal')
+
+
+def plan_budget(entries, budget, mode='drop'):
+    """!
+    @brief Decide which files to shrink so that their total fits a budget.
+
+    Files are given up lowest priority first; within a priority the largest
+    files go first, and later files before earlier ones of the same size.
+    In 'drop' mode those files are left out entirely. In 'truncate' mode the
+    last file needed to get under the budget is cut down instead of being
+    dropped.
+
+    @param entries Iterable of (path, tokens, priority) tuples.
+    @param budget Tokens available for all entries together.
+    @param mode 'truncate' or 'drop'.
+    @return Dict mapping the paths that change to the number of tokens
+    kept, 0 for dropped files.
+    """
+    entries = list(entries)
+    excess = sum(tokens for _, tokens, _ in entries) - budget
+    plan = {}
+    if excess <= 0:
+        return plan
+    order = sorted(range(len(entries)), key=lambda i: (entries[i][2], -entries[i][1], -i))
+    for i in order:
+        path, tokens, _ = entries[i]
+        if mode == 'truncate' and tokens > excess:
+            plan[path] = tokens - excess
+            break
+        plan[path] = 0
+        excess -= tokens
+        if excess <= 0:
+            break
+    return plan
+
+
+def truncate_to_tokens(text, tokens, keep, count, mode='head'):
+    """!
+    @brief Cut text with tokens tokens down to at most keep tokens.
+
+    The cut is proportional to the UTF-8 size and snaps to line boundaries
+    like textfile.ReadLimits, with the same truncation marker. The marker
+    counts towards keep, and cuts that still come out too large are made
+    again with the excess taken off.
+
+    @param count Callable returning the tokens that a text costs, e.g. of
+    its file block.
+    @return The cut text, or None if keep does not even cover the marker.
+    """
+    if keep >= tokens:
+        return text
+    data = text.encode('utf-8')
+    available = keep - count(truncation_marker(len(data), len(data)))
+    while available > 0:
+        cut = slice_content(data, ReadLimits(max(1, len(data) * available // tokens), mode=mode))
+        if (cut_tokens := count(cut)) <= keep:
+            return cut
+        available -= cut_tokens - keep
+    return None
+
+
+def fit_plan(plan, reader, tokens, count_block, mode='head'):
+    """!
+    @brief Cut the files that a budget plan truncates.
+
+    The block of the cut text is counted again and plan is updated with the
+    tokens actually kept, so totals computed from it hold. A file whose
+    kept tokens do not cover the layout around it and the truncation marker
+    is dropped instead.
+
+    @param plan Result of plan_budget(); updated in place.
+    @param reader Callable returning the text of a file.
+    @param tokens Dict mapping paths to the tokens used for planning.
+    @param count_block Callable taking a path and a text, returning the
+    tokens of the file block with that text.
+    @param mode Truncation mode, see textfile.ReadLimits.
+    @return Dict mapping the truncated paths to their cut text, for budget_reader().
+    """
+    cuts = {}
+    for path, keep in plan.items():
+        if not keep:
+            continue
+        text = truncate_to_tokens(reader(path), tokens[path], keep, lambda text: count_block(path, text), mode)
+        if text is None:
+            plan[path] = 0
+        else:
+            cuts[path] = text
+            plan[path] = count_block(path, text)
+    return cuts
+
+
+def budget_reader(reader, cuts):
+    """!
+    @brief Wrap a file reader so that it returns the cuts of fit_plan().
+
+    Dropped files have to be left out by the caller.
+    """
+    if not cuts:
+        return reader
+
+    def read(file_path):
+        if (text := cuts.get(file_path)) is not None:
+            return text
+        return reader(file_path)
+    return read
@@ -0,0 +1,807 @@
+"""!
+@file tree_model.py
+@brief Lazily populated file system model for the selection tree.
+
+Directories are listed with a single os.scandir() pass. The sorted names
+are kept as a compact pending list and turned into FileNode rows in
+batches through canFetchMore()/fetchMore(), so memory grows with the rows
+that are actually shown rather than with the size of the directory.
+"""
+import bisect
+import os
+
+from PyQt5.QtCore import (
+    QAbstractItemModel, QModelIndex, QPoint, QSortFilterProxyModel, Qt, pyqtSignal
+)
+from PyQt5.QtGui import QBrush, QColor, QFont
+from PyQt5.QtWidgets import QTreeView
+
+from . import engine
+from .ignore import IgnoreMatcher
+from .instrument import profiler
+
+RolePath = Qt.UserRole + 2
+
+COLUMN_NAME = 0
+COLUMN_TOKENS = 1
+
+
+def sort_key(name, is_dir):
+    return (not is_dir, name.lower())
+
+
+def bisect_names(names, name, lo, hi):
+    """!
+    @brief Insertion point for name in the case-insensitively sorted names[lo:hi].
+    """
+    key = name.lower()
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if names[mid].lower() < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _blocks(items, row_of, step):
+    """!
+    @brief Group sorted items into runs for a single begin/end rows pair.
+
+    @param row_of Callable returning the row of an item.
+    @param step Row distance between neighbours of a run: 0 for inserts,
+    which share the row they are inserted at, 1 for removed rows.
+    @return List of (first row, items) in ascending order.
+    """
+    blocks = []
+    for item in items:
+        row = row_of(item)
+        if blocks and row == row_of(blocks[-1][1][-1]) + step:
+            blocks[-1][1].append(item)
+        else:
+            blocks.append((row, [item]))
+    return blocks
+
+
+class FileNode:
+    """!
+    @brief One row of the file tree.
+
+    children holds the materialized rows in display order, or None while the
+    directory has not been listed. pending holds the sorted names that have
+    been listed but not materialized yet; its first pending_dirs entries are
+    directories. pending_state is the check state those names inherit.
+    ext and flags cache the filter relevant parts of the name (see
+    engine.FileFilter.matches_parts()).
+    """
+    __slots__ = ('name', 'path', 'parent', 'row', 'is_dir', 'ext', 'flags', 'check_state',
+                 'children', 'pending', 'pending_dirs', 'pending_state')
+
+    def __init__(self, name, path, parent, row, is_dir, check_state=Qt.Unchecked):
+        self.name = name
+        self.path = path
+        self.parent = parent
+        self.row = row
+        self.is_dir = is_dir
+        self.ext = '' if is_dir else engine.name_extension(name)
+        self.flags = engine.name_flags(name)
+        self.check_state = check_state
+        self.children = None
+        self.pending = None
+        self.pending_dirs = 0
+        self.pending_state = check_state
+
+    @property
+    def is_listed(self):
+        return self.children is not None
+
+    def iter_pending(self):
+        """!
+        @brief Yield (name, is_dir) for the names not materialized yet.
+        """
+        for i, name in enumerate(self.pending or ()):
+            yield name, i < self.pending_dirs
+
+
+class FileTreeModel(QAbstractItemModel):
+    """!
+    @brief Checkable tree of FileNode rows.
+
+    Check states propagate like a tristate QTreeWidgetItem: setting a
+    directory applies the state to all of its loaded descendants and to the
+    names that are still pending, and ancestors become partially checked as
+    needed. checkStateChanged is emitted once per call to setCheckState().
+
+    The second column shows the token counts set with setTokenCounts().
+    Files found by a content search and the directories containing them are
+    highlighted (see setSearchMatches()).
+
+    With use_ignore set, rows that would inherit the checked state but are
+    excluded by ignore rules or pruned (see ignore.IgnoreMatcher) start
+    unchecked instead, without making their directory partially checked.
+    """
+
+    checkStateChanged = pyqtSignal(object)  # FileNode
+
+    FETCH_BATCH = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root = FileNode('', '', None, 0, True)
+        self.root.children = []
+        self.nodes_by_path = {}
+        self.use_ignore = True
+        self._file_tokens = {}
+        self._tokens = {}  # files and directories -> tokens of the selected files below
+        self._budget_plan = {}
+        self._top_files = frozenset()
+        self._matches = frozenset()
+        self._match_dirs = frozenset()
+
+    # Structure -------------------------------------------------------------
+
+    def setRoots(self, paths):
+        self.beginResetModel()
+        self.nodes_by_path.clear()
+        self.root.children = []
+        for row, path in enumerate(paths):
+            node = FileNode(path, path, self.root, row, True)
+            self.root.children.append(node)
+            self.nodes_by_path[path] = node
+        self.endResetModel()
+
+    def topLevelNodes(self):
+        return self.root.children
+
+    def nodeForPath(self, path):
+        return self.nodes_by_path.get(path)
+
+    def nodeFromIndex(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def indexFromNode(self, node):
+        if node is self.root or node is None:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def listChildren(self, node):
+        """!
+        @brief List a directory into its pending names without adding rows.
+        """
+        if node.is_listed:
+            return
+        profiler.count('dir_scans')
+        with profiler.stage('tree.list'):
+            try:
+                with os.scandir(node.path) as it:
+                    entries = [(entry.name, entry.is_dir()) for entry in it]
+            except OSError:
+                entries = []
+            entries = engine.sort_entries(entries)
+        node.children = []
+        node.pending = [name for name, _ in entries]
+        node.pending_dirs = sum(1 for _, is_dir in entries if is_dir)
+        node.pending_state = Qt.Checked if node.check_state == Qt.Checked else Qt.Unchecked
+
+    @profiler.timed('tree.materialize')
+    def materialize(self, node, count):
+        """!
+        @brief Turn up to count pending names of node into rows.
+        """
+        if not node.pending:
+            return
+        names = node.pending[:count]
+        first = len(node.children)
+        profiler.count('rows_created', len(names))
+        self.beginInsertRows(self.indexFromNode(node), first, first + len(names) - 1)
+        del node.pending[:len(names)]
+        dir_count = min(node.pending_dirs, len(names))
+        node.pending_dirs -= dir_count
+        matcher = self.ignoreMatcher(node) if node.pending_state == Qt.Checked else None
+        for offset, name in enumerate(names):
+            is_dir = offset < dir_count
+            state = node.pending_state
+            if matcher is not None and matcher.is_ignored(os.path.join(node.path, name), is_dir):
+                state = Qt.Unchecked
+            self._addNode(node, first + offset, name, is_dir, state)
+        self.endInsertRows()
+
+    def ignoreMatcher(self, node):
+        """!
+        @brief IgnoreMatcher for the children of node, or None if disabled.
+        """
+        return IgnoreMatcher.for_directory(node.path) if self.use_ignore else None
+
+    def materializeAll(self, node):
+        self.listChildren(node)
+        self.materialize(node, len(node.pending or ()))
+
+    def childForName(self, node, name):
+        """!
+        @brief Return the child row called name, materializing up to it.
+        """
+        self.listChildren(node)
+        child = self.nodes_by_path.get(os.path.join(node.path, name))
+        if child is not None:
+            return child
+        if node.pending and name in node.pending:
+            self.materialize(node, node.pending.index(name) + 1)
+            return self.nodes_by_path.get(os.path.join(node.path, name))
+        return None
+
+    def insertChildren(self, node, entries):
+        """!
+        @brief Add new entries to a listed directory in sorted position.
+
+        Entries that sort after the materialized rows are added to the
+        pending names instead of becoming rows immediately. Entries that land
+        between the same two rows are inserted as one block, back to front;
+        the rows behind a block are renumbered before endInsertRows() so
+        views see a consistent parent() while handling each insertion.
+
+        @param entries Iterable of (name, is_dir) not yet in the directory.
+        """
+        children = node.children
+        keys = [sort_key(child.name, child.is_dir) for child in children]
+        inserts = []
+        for name, is_dir in engine.sort_entries(entries):
+            key = sort_key(name, is_dir)
+            if node.pending and (not keys or key > keys[-1]):
+                if is_dir:
+                    node.pending.insert(bisect_names(node.pending, name, 0, node.pending_dirs), name)
+                    node.pending_dirs += 1
+                else:
+                    node.pending.insert(bisect_names(node.pending, name, node.pending_dirs, len(node.pending)), name)
+            else:
+                inserts.append((bisect.bisect_left(keys, key), name, is_dir))
+        if not inserts:
+            return
+        parent_index = self.indexFromNode(node)
+        for row, block in reversed(_blocks(inserts, lambda insert: insert[0], 0)):
+            self.beginInsertRows(parent_index, row, row + len(block) - 1)
+            for offset, (_, name, is_dir) in enumerate(block):
+                self._addNode(node, row + offset, name, is_dir, Qt.Unchecked)
+            self._renumber(node, row + len(block))
+            self.endInsertRows()
+        self._updateAncestors(node)
+
+    def removeChildren(self, node, names):
+        """!
+        @brief Remove entries from a listed directory.
+        """
+        names = set(names)
+        if node.pending and names.intersection(node.pending):
+            dirs = node.pending[:node.pending_dirs]
+            node.pending = [name for name in node.pending if name not in names]
+            node.pending_dirs -= sum(1 for name in dirs if name in names)
+        rows = [child.row for child in node.children if child.name in names]
+        if not rows:
+            return
+        parent_index = self.indexFromNode(node)
+        # Contiguous rows go in one block, removed back to front like inserts.
+        for row, block in reversed(_blocks(rows, lambda row: row, 1)):
+            self.beginRemoveRows(parent_index, row, row + len(block) - 1)
+            for child in node.children[row:row + len(block)]:
+                self._unindex(child)
+            del node.children[row:row + len(block)]
+            self._renumber(node, row)
+            self.endRemoveRows()
+        self._updateAncestors(node)
+
+    @staticmethod
+    def _renumber(node, first):
+        children = node.children
+        for i in range(first, len(children)):
+            children[i].row = i
+
+    def _addNode(self, parent, row, name, is_dir, check_state):
+        path = os.path.join(parent.path, name)
+        node = FileNode(name, path, parent, row, is_dir, check_state)
+        parent.children.insert(row, node)
+        self.nodes_by_path[path] = node
+        return node
+
+    def _unindex(self, node):
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self.nodes_by_path.pop(current.path, None)
+            if current.children:
+                stack.extend(current.children)
+
+    def iterNodes(self, node=None):
+        """!
+        @brief Yield the materialized descendants of node in pre-order.
+        """
+        stack = list(reversed((node or self.root).children or ()))
+        while stack:
+            current = stack.pop()
+            yield current
+            if current.children:
+                stack.extend(reversed(current.children))
+
+    def applyListing(self, node, entries):
+        """!
+        @brief Bring a listed directory in line with a fresh listing.
+
+        @param entries Dict mapping the names now in the directory to
+        whether they are directories.
+        @return Whether any entry was added or removed.
+        """
+        existing = {child.name for child in node.children}
+        existing.update(node.pending or ())
+        removed = existing - entries.keys()
+        added = [(name, is_dir) for name, is_dir in entries.items() if name not in existing]
+        if removed:
+            self.removeChildren(node, removed)
+        if added:
+            self.insertChildren(node, added)
+        return bool(removed or added)
+
+    # Snapshots -------------------------------------------------------------
+
+    def snapshot(self, expanded=()):
+        """!
+        @brief JSON serializable copy of the loaded tree (see snapshot.py).
+
+        Each top-level node and its materialized descendants are stored as a
+        flat pre-order list, so deep trees do not nest. Every row becomes
+        [depth, name, is_dir, check_state]; listed directories add
+        [pending_state, is_expanded, pending, pending_dirs].
+
+        @param expanded Paths of the directories expanded in the view.
+        @return Dict mapping the top-level paths to their record lists.
+        """
+        roots = {}
+        for top in self.root.children:
+            records = roots[top.path] = []
+            stack = [(top, 0)]
+            while stack:
+                node, depth = stack.pop()
+                record = [depth, node.name, node.is_dir, int(node.check_state)]
+                if node.is_listed:
+                    record += [int(node.pending_state), node.path in expanded, node.pending or [], node.pending_dirs]
+                    stack.extend((child, depth + 1) for child in reversed(node.children))
+                records.append(record)
+        return roots
+
+    def restoreSnapshot(self, roots):
+        """!
+        @brief Rebuild the rows below the top-level nodes from a snapshot.
+
+        Check states are taken over as saved, without propagation. The model
+        is reset once.
+
+        @param roots Dict as returned by snapshot().
+        @return Paths of the directories that were expanded, in pre-order.
+        """
+        expanded = []
+        self.beginResetModel()
+        try:
+            for top in self.root.children:
+                records = roots.get(top.path)
+                if not records:
+                    continue
+                for child in top.children or ():
+                    self._unindex(child)
+                top.children = None
+                parents = []
+                for record in records:
+                    depth, name, is_dir, state = record[:4]
+                    if depth == 0:
+                        node = top
+                    else:
+                        parent = parents[depth - 1]
+                        node = self._addNode(parent, len(parent.children), name, bool(is_dir), Qt.CheckState(state))
+                    del parents[depth:]
+                    parents.append(node)
+                    node.check_state = node.pending_state = Qt.CheckState(state)
+                    if len(record) > 4:
+                        pending_state, is_expanded, pending, pending_dirs = record[4:]
+                        node.pending_state = Qt.CheckState(pending_state)
+                        node.pending = list(pending)
+                        node.pending_dirs = int(pending_dirs)
+                        node.children = []
+                        if is_expanded:
+                            expanded.append(node.path)
+        finally:
+            self.endResetModel()
+        return expanded
+
+    # Check state -----------------------------------------------------------
+
+    def setCheckState(self, node, state):
+        state = Qt.CheckState(state)
+        self._setSubtreeState(node, state)
+        self._updateAncestors(node.parent)
+        self.checkStateChanged.emit(node)
+
+    def _setSubtreeState(self, node, state):
+        node.check_state = state
+        index = self.indexFromNode(node)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        stack = [(node, state)]
+        while stack:
+            current, current_state = stack.pop()
+            current.pending_state = current_state
+            if not current.children:
+                continue
+            matcher = self.ignoreMatcher(current) if current_state == Qt.Checked else None
+            for child in current.children:
+                child_state = current_state
+                if matcher is not None and matcher.is_ignored(child.path, child.is_dir):
+                    child_state = Qt.Unchecked
+                child.check_state = child_state
+                if child.is_dir:
+                    stack.append((child, child_state))
+            self.dataChanged.emit(self.indexFromNode(current.children[0]),
+                                  self.indexFromNode(current.children[-1]),
+                                  [Qt.CheckStateRole])
+
+    def _aggregateState(self, node):
+        """!
+        @brief Check state of node derived from its rows and pending names.
+
+        Unchecked rows that are excluded by the ignore rules do not count:
+        a checked directory leaves them out anyway, so a directory whose
+        other rows are all checked stays checked and can be unchecked with
+        a single click.
+        """
+        seen_checked = seen_unchecked = False
+        if node.children is None or node.pending:
+            seen_checked = node.pending_state == Qt.Checked
+            seen_unchecked = not seen_checked
+        unchecked = []  # unchecked rows not yet compared with the ignore rules
+        matcher = None
+        for child in node.children or ():
+            if child.check_state == Qt.PartiallyChecked:
+                return Qt.PartiallyChecked
+            if child.check_state == Qt.Checked:
+                seen_checked = True
+            else:
+                unchecked.append(child)
+            if seen_checked and unchecked:
+                matcher = matcher or self.ignoreMatcher(node)
+                if not self._allIgnored(matcher, unchecked):
+                    return Qt.PartiallyChecked
+                unchecked.clear()
+            if seen_checked and seen_unchecked:
+                return Qt.PartiallyChecked
+        if seen_checked:
+            return Qt.Checked
+        if unchecked and not seen_unchecked and node.check_state == Qt.Checked \
+                and self._allIgnored(self.ignoreMatcher(node), unchecked):
+            # Every row is ignored, e.g. a directory holding only .git.
+            return Qt.Checked
+        if seen_unchecked or unchecked:
+            return Qt.Unchecked
+        return node.check_state
+
+    @staticmethod
+    def _allIgnored(matcher, nodes):
+        return matcher is not None and all(matcher.is_ignored(node.path, node.is_dir) for node in nodes)
+
+    def _updateAncestors(self, node):
+        while node is not None and node is not self.root:
+            state = self._aggregateState(node)
+            if state == node.check_state:
+                break
+            node.check_state = state
+            if state != Qt.PartiallyChecked:
+                node.pending_state = state
+            index = self.indexFromNode(node)
+            self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+            node = node.parent
+
+    def selectionRules(self):
+        """!
+        @brief Fewest include and exclude rules that reproduce the check states.
+
+        Rules follow selection.Selection: a path is selected if the closest
+        rule at or above it includes it. Fully checked and unchecked rows
+        need a rule only where they differ from what they inherit. For a
+        partially checked directory both choices are costed, a rule that
+        flips its state or none, with its children and pending names
+        evaluated under each; the cheaper one is kept. Rows left unchecked
+        by the ignore rules agree with either choice, since walks skip them.
+
+        @return Dict mapping paths to True (include) or False (exclude).
+        """
+        partial = []
+        stack = [node for node in self.root.children if node.check_state == Qt.PartiallyChecked]
+        while stack:
+            node = stack.pop()
+            partial.append(node)
+            stack.extend(child for child in node.children if child.check_state == Qt.PartiallyChecked)
+
+        ignored = set()
+        pending_rules = {}  # partial directory -> pending paths that need a rule if it flips
+        costs = {}  # partial directory -> (rules below it if excluded, if included)
+
+        def cost(node, inherited):
+            if node.check_state == Qt.PartiallyChecked:
+                excluded, included = costs[node.path]
+                same, flipped = (included, excluded) if inherited else (excluded, included)
+                return min(same, flipped + 1)
+            selected = node.check_state == Qt.Checked
+            if inherited and node.path in ignored:
+                # Walks skip the row, so only an explicit include restores it.
+                return int(selected)
+            return int(selected != inherited)
+
+        # Children are appended after their parents, so reversing settles
+        # every directory after the partial directories inside it.
+        for node in reversed(partial):
+            matcher = self.ignoreMatcher(node)
+            if matcher is not None:
+                ignored.update(child.path for child in node.children if matcher.is_ignored(child.path, child.is_dir))
+            paths = [os.path.join(node.path, name) for name, _ in node.iter_pending()]
+            if matcher is not None:
+                paths = [path for path, (_, is_dir) in zip(paths, node.iter_pending())
+                         if not matcher.is_ignored(path, is_dir)]
+            pending_rules[node.path] = paths
+            pending_selected = node.pending_state == Qt.Checked
+            costs[node.path] = tuple(
+                sum(cost(child, state) for child in node.children) + (len(paths) if state != pending_selected else 0)
+                for state in (False, True))
+
+        rules = {}
+        stack = [(node, False) for node in reversed(self.root.children)]
+        while stack:
+            node, inherited = stack.pop()
+            if node.check_state != Qt.PartiallyChecked:
+                if cost(node, inherited):
+                    rules[node.path] = node.check_state == Qt.Checked
+                continue
+            excluded, included = costs[node.path]
+            same, flipped = (included, excluded) if inherited else (excluded, included)
+            state = inherited if same <= flipped + 1 else not inherited
+            if state != inherited:
+                rules[node.path] = state
+            pending_selected = node.pending_state == Qt.Checked
+            if state != pending_selected:
+                rules.update(dict.fromkeys(pending_rules[node.path], pending_selected))
+            stack.extend((child, state) for child in reversed(node.children))
+        return rules
+
+    # Token counts ----------------------------------------------------------
+
+    def setTokenCounts(self, counts, plan=None, top=()):
+        """!
+        @brief Show the token counts of the selected files.
+
+        Directories show the sum of the selected files below them. Only the
+        rows whose values changed are updated.
+
+        @param counts Dict mapping file paths to tokens.
+        @param plan Dict mapping files shrunk by the token budget to the
+        tokens kept (see tokens.plan_budget()); they are shown in red.
+        @param top Paths of the largest contributors; they are shown in bold.
+        """
+        changed = set()
+        old = self._file_tokens
+        deltas = {path: tokens - old.get(path, 0) for path, tokens in counts.items() if tokens != old.get(path)}
+        deltas.update((path, -tokens) for path, tokens in old.items() if path not in counts)
+        # Propagate the changes one directory level at a time, so each
+        # directory is updated once per level rather than once per file.
+        while deltas:
+            parents = {}
+            for path, delta in deltas.items():
+                total = self._tokens.get(path, 0) + delta
+                if total:
+                    self._tokens[path] = total
+                else:
+                    self._tokens.pop(path, None)
+                changed.add(path)
+                parent = os.path.dirname(path)
+                if parent != path:
+                    parents[parent] = parents.get(parent, 0) + delta
+            deltas = {path: delta for path, delta in parents.items() if delta}
+        self._file_tokens = dict(counts)
+
+        plan = plan or {}
+        top = frozenset(top)
+        changed.update(path for path in plan.keys() | self._budget_plan.keys()
+                       if plan.get(path) != self._budget_plan.get(path))
+        changed.update(top ^ self._top_files)
+        self._budget_plan = dict(plan)
+        self._top_files = top
+
+        for path in changed:
+            if node := self.nodes_by_path.get(path):
+                self.dataChanged.emit(self.createIndex(node.row, COLUMN_NAME, node),
+                                      self.createIndex(node.row, COLUMN_TOKENS, node))
+
+    def tokenText(self, path):
+        tokens = self._tokens.get(path)
+        if tokens is None:
+            return None
+        kept = self._budget_plan.get(path)
+        if kept is None:
+            return f"{tokens:,}"
+        return f"{tokens:,} (dropped)" if kept == 0 else f"{tokens:,} \u2192 {kept:,}"
+
+    # Search matches --------------------------------------------------------
+
+    def setSearchMatches(self, paths):
+        """!
+        @brief Highlight the files in paths and the directories above them.
+
+        Only rows whose highlight changes are updated.
+        """
+        matches = frozenset(paths)
+        dirs = set()
+        for path in matches:
+            parent = os.path.dirname(path)
+            while parent not in dirs and parent != path:
+                dirs.add(parent)
+                path, parent = parent, os.path.dirname(parent)
+        dirs = frozenset(dirs)
+        changed = (matches ^ self._matches) | (dirs ^ self._match_dirs)
+        self._matches = matches
+        self._match_dirs = dirs
+        for path in changed:
+            if node := self.nodes_by_path.get(path):
+                self.dataChanged.emit(self.createIndex(node.row, COLUMN_NAME, node),
+                                      self.createIndex(node.row, COLUMN_TOKENS, node), [Qt.BackgroundRole])
+
+    def searchMatches(self):
+        return self._matches
+
+    # QAbstractItemModel ----------------------------------------------------
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.nodeFromIndex(parent)
+        if column not in (COLUMN_NAME, COLUMN_TOKENS) or not node.children or row < 0 or row >= len(node.children):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.indexFromNode(index.internalPointer().parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        children = self.nodeFromIndex(parent).children
+        return len(children) if children else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 2
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.nodeFromIndex(parent)
+        if node.is_listed:
+            return bool(node.children or node.pending)
+        return node.is_dir
+
+    def canFetchMore(self, parent):
+        node = self.nodeFromIndex(parent)
+        return node.is_dir and (not node.is_listed or bool(node.pending))
+
+    def fetchMore(self, parent):
+        node = self.nodeFromIndex(parent)
+        self.listChildren(node)
+        self.materialize(node, self.FETCH_BATCH)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.ForegroundRole:
+            return QBrush(QColor(217, 83, 79)) if node.path in self._budget_plan else None
+        if role == Qt.BackgroundRole:
+            if node.path in self._matches:
+                return QBrush(QColor(255, 193, 7, 110))
+            if node.path in self._match_dirs:
+                return QBrush(QColor(255, 193, 7, 40))
+            return None
+        if role == Qt.FontRole:
+            if node.path in self._top_files:
+                font = QFont()
+                font.setBold(True)
+                return font
+            return None
+        if index.column() == COLUMN_TOKENS:
+            if role == Qt.DisplayRole:
+                return self.tokenText(node.path)
+            if role == Qt.TextAlignmentRole:
+                return Qt.AlignRight | Qt.AlignVCenter
+            return None
+        if role == Qt.DisplayRole:
+            return node.name
+        if role == Qt.CheckStateRole:
+            return node.check_state
+        if role == RolePath:
+            return node.path
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        self.setCheckState(index.internalPointer(), value)
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if index.column() == COLUMN_TOKENS:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return {COLUMN_NAME: "File System", COLUMN_TOKENS: "Tokens"}.get(section)
+        return None
+
+
+class FileFilterProxyModel(QSortFilterProxyModel):
+    """!
+    @brief Hides rows of a FileTreeModel that do not pass a FileFilter.
+
+    Rows are judged from the extension and name flags cached on each
+    FileNode, so filtering never touches the file system. Top-level rows are
+    always shown. Newly inserted rows are filtered as they arrive; changing
+    the filter re-evaluates the rows that are already mapped.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.file_filter = engine.FileFilter()
+        self.setDynamicSortFilter(False)
+
+    def setFileFilter(self, file_filter):
+        if file_filter == self.file_filter:
+            return False
+        self.file_filter = file_filter
+        self.invalidateFilter()
+        return True
+
+    def acceptsNode(self, node):
+        return node.parent is None or node.parent.parent is None or \
+            self.file_filter.matches_parts(node.ext, node.is_dir, node.flags)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        parent = self.sourceModel().nodeFromIndex(source_parent)
+        return self.acceptsNode(parent.children[source_row])
+
+    def nodeFromIndex(self, index):
+        return self.sourceModel().nodeFromIndex(self.mapToSource(index))
+
+    def indexFromNode(self, node):
+        return self.mapFromSource(self.sourceModel().indexFromNode(node))
+
+
+class FileTreeView(QTreeView):
+    """!
+    @brief Tree view that fetches further batches of rows while scrolling.
+
+    QTreeView only fetches a directory once when it is expanded; this view
+    also fetches more rows of a directory when its last loaded rows scroll
+    into view.
+    """
+
+    FETCH_MARGIN = 50
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setUniformRowHeights(True)
+        self.verticalScrollBar().valueChanged.connect(self.fetchVisible)
+        self.expanded.connect(self.fetchVisible)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.fetchVisible()
+
+    def fetchVisible(self, *args):
+        model = self.model()
+        if model is None:
+            return
+        height = self.viewport().height()
+        index = self.indexAt(QPoint(1, 0))
+        while index.isValid() and self.visualRect(index).top() < height:
+            parent = index.parent()
+            if index.row() >= model.rowCount(parent) - self.FETCH_MARGIN and model.canFetchMore(parent):
+                model.fetchMore(parent)
+            index = self.indexBelow(index)
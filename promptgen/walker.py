@@ -0,0 +1,127 @@
+"""!
+@file walker.py
+@brief Recursive, cancellable directory walk in file tree order.
+"""
+import os
+
+from .engine import FileFilter, sort_entries
+from .ignore import IgnoreMatcher
+
+
+class WalkResult:
+    """!
+    @brief Files found by walk_tree().
+
+    files lists the files in tree order. spans maps every visited directory
+    to the (start, end) slice of files that lie below it, so the selection
+    of any sub directory can be taken from the result of an ancestor.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = []
+        self.spans = {}
+        self.cancelled = False
+
+    def files_below(self, path):
+        span = self.spans.get(path)
+        if span is None:
+            return None
+        return self.files[span[0]:span[1]]
+
+
+def iter_walk(root, file_filter=None, use_ignore=True, cancel=None, on_enter=None, on_leave=None,
+              rules=None, enter_excluded=None):
+    """!
+    @brief Yield the files below root in file tree order.
+
+    Sub directories are visited before the files of a directory, matching
+    the order in which checked items are collected from the tree. Entries
+    rejected by the filter are skipped. With use_ignore, .gitignore and
+    .promptignore rules apply and directories such as .git or node_modules
+    are pruned before they are descended into.
+
+    @param root Directory to walk.
+    @param file_filter Optional FileFilter applied to every entry below root.
+    @param use_ignore Whether ignore files and default pruning apply.
+    @param cancel Optional threading.Event; the walk stops once it is set.
+    @param on_enter Optional callable invoked with each directory entered.
+    @param on_leave Optional callable invoked with each directory left.
+    @param rules Optional dict mapping paths to True (include) or False
+    (exclude), as in selection.Selection. Entries with a rule follow it
+    regardless of the ignore rules; other entries inherit the state of their
+    directory. root is included unless a rule excludes it.
+    @param enter_excluded Optional predicate for excluded directories; those
+    it accepts are still descended into, e.g. to reach rules below them.
+    """
+    file_filter = file_filter or FileFilter()
+    seen = set()
+    stack = []
+
+    def enter(path, matcher, included):
+        real = os.path.realpath(path)
+        if real in seen:
+            return False
+        seen.add(real)
+        try:
+            with os.scandir(path) as it:
+                entries = [(entry.name, entry.is_dir()) for entry in it]
+        except OSError:
+            entries = []
+        if matcher is not None:
+            matcher = matcher.child(path, {name for name, _ in entries})
+        if on_enter:
+            on_enter(path)
+        stack.append((path, matcher, included, iter(sort_entries(entries))))
+        return True
+
+    matcher = None
+    if use_ignore:
+        parent = os.path.dirname(os.path.abspath(root))
+        matcher = IgnoreMatcher.for_directory(parent) if parent != os.path.abspath(root) else IgnoreMatcher()
+    enter(root, matcher, rules is None or rules.get(root, True))
+    while stack:
+        if cancel is not None and cancel.is_set():
+            return
+        path, matcher, included, entries = stack[-1]
+        for name, is_dir in entries:
+            if not file_filter.matches(name, is_dir):
+                continue
+            child_path = os.path.join(path, name)
+            child_included = None if rules is None else rules.get(child_path)
+            if child_included is None:
+                child_included = included and not (matcher is not None and matcher.is_ignored(child_path, is_dir))
+            if is_dir:
+                if (child_included or (enter_excluded is not None and enter_excluded(child_path))) \
+                        and enter(child_path, matcher, child_included):
+                    break
+                continue
+            if child_included:
+                yield child_path
+        else:
+            stack.pop()
+            if on_leave:
+                on_leave(path)
+
+
+def walk_tree(root, file_filter=None, use_ignore=True, cancel=None, progress=None):
+    """!
+    @brief Collect the files below root into a WalkResult.
+
+    @param progress Optional callable invoked with the number of files found
+    so far each time a directory has been read.
+    """
+    result = WalkResult(root)
+    starts = {}
+
+    def on_enter(path):
+        starts[path] = len(result.files)
+        if progress:
+            progress(len(result.files))
+
+    def on_leave(path):
+        result.spans[path] = (starts.pop(path), len(result.files))
+
+    result.files.extend(iter_walk(root, file_filter, use_ignore, cancel, on_enter, on_leave))
+    result.cancelled = cancel is not None and cancel.is_set()
+    return result
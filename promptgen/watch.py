@@ -0,0 +1,190 @@
+"""!
+@file watch.py
+@brief Change notification for the selected files with a bounded watch count.
+
+Operating system watches are a limited resource (on Linux the inotify limit
+is shared by all applications of a user). WatchManager therefore only adds
+and removes the watches that differ between two selections, watches the
+parent directory instead of the files once many selected files share one
+directory, and polls modification times for everything it could not watch.
+"""
+import os
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+from .cache import file_signature
+
+
+def _signature(path):
+    try:
+        return file_signature(path)
+    except OSError:
+        return None
+
+
+class WatchManager(QObject):
+    """!
+    @brief Reports changes to a set of files through fileChanged.
+
+    Files are watched individually until dir_threshold selected files share
+    a directory. From then on the directory is watched, which catches files
+    being replaced, created or deleted, and the files themselves are checked
+    by polling. Files whose watch cannot be added, because max_watches is
+    reached or the operating system refuses it, are polled as well.
+
+    @param dir_threshold Number of selected files in one directory from
+    which the directory is watched instead of the files.
+    @param poll_interval_ms Interval of the modification time polling.
+    @param max_watches Maximum number of operating system watches used, 0
+    for no limit other than the one of the operating system.
+    """
+
+    fileChanged = pyqtSignal(str)
+
+    def __init__(self, dir_threshold=32, poll_interval_ms=2000, max_watches=4096, parent=None):
+        super().__init__(parent)
+        self.dir_threshold = dir_threshold
+        self.max_watches = max_watches
+        self.files = set()
+        self._by_dir = {}
+        self._file_watches = set()
+        self._dir_watches = set()
+        self._polled = {}  # path -> last seen signature
+        self._counters = {'events': 0, 'polls': 0, 'watch_failures': 0}
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._onFileChanged)
+        self._watcher.directoryChanged.connect(self._onDirectoryChanged)
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(poll_interval_ms)
+        self._poll_timer.timeout.connect(self.poll)
+
+    def setPollInterval(self, interval_ms):
+        self._poll_timer.setInterval(interval_ms)
+
+    def setFiles(self, paths):
+        """!
+        @brief Watch exactly paths, touching only what changed.
+        """
+        new_files = set(paths)
+        removed = self.files - new_files
+        added = new_files - self.files
+        self.files = new_files
+        touched = set()
+        for path in removed:
+            directory = os.path.dirname(path)
+            self._by_dir[directory].discard(path)
+            touched.add(directory)
+            if path in self._file_watches:
+                self._unwatch(path)
+                self._file_watches.discard(path)
+            self._polled.pop(path, None)
+        for path in added:
+            directory = os.path.dirname(path)
+            self._by_dir.setdefault(directory, set()).add(path)
+            touched.add(directory)
+        for directory in touched:
+            self._syncDirectory(directory)
+        self._updatePollTimer()
+
+    def stats(self):
+        """!
+        @brief Counters for tuning the thresholds.
+
+        @return Dict with the number of files, file and directory watches,
+        polled files, delivered change events, polling rounds and watches
+        that could not be added.
+        """
+        return {
+            'files': len(self.files),
+            'file_watches': len(self._file_watches),
+            'dir_watches': len(self._dir_watches),
+            'polled': len(self._polled),
+            **self._counters,
+        }
+
+    def poll(self):
+        """!
+        @brief Compare the signatures of all polled files with the last seen ones.
+        """
+        self._counters['polls'] += 1
+        for path in list(self._polled):
+            self._checkSignature(path)
+
+    # Internals -------------------------------------------------------------
+
+    def _syncDirectory(self, directory):
+        files = self._by_dir.get(directory)
+        count = len(files) if files else 0
+        # Switch back to file watches only well below the threshold, so a
+        # selection hovering around it does not flip between the modes.
+        use_dir = count >= self.dir_threshold or (directory in self._dir_watches and 2 * count > self.dir_threshold)
+        if use_dir and directory not in self._dir_watches:
+            if self._watch(directory):
+                self._dir_watches.add(directory)
+            else:
+                use_dir = False
+        if not use_dir and directory in self._dir_watches:
+            self._unwatch(directory)
+            self._dir_watches.discard(directory)
+        for path in files or ():
+            if use_dir:
+                if path in self._file_watches:
+                    self._unwatch(path)
+                    self._file_watches.discard(path)
+                if path not in self._polled:
+                    self._polled[path] = _signature(path)
+            elif path not in self._file_watches:
+                if self._watch(path):
+                    self._file_watches.add(path)
+                    self._polled.pop(path, None)
+                elif path not in self._polled:
+                    self._polled[path] = _signature(path)
+        if not files:
+            self._by_dir.pop(directory, None)
+
+    def _watch(self, path):
+        if self.max_watches and len(self._file_watches) + len(self._dir_watches) >= self.max_watches:
+            self._counters['watch_failures'] += 1
+            return False
+        if not os.path.exists(path) or not self._watcher.addPath(path):
+            self._counters['watch_failures'] += 1
+            return False
+        return True
+
+    def _unwatch(self, path):
+        self._watcher.removePath(path)
+
+    def _updatePollTimer(self):
+        if self._polled and not self._poll_timer.isActive():
+            self._poll_timer.start()
+        elif not self._polled and self._poll_timer.isActive():
+            self._poll_timer.stop()
+
+    def _checkSignature(self, path):
+        signature = _signature(path)
+        if signature != self._polled.get(path):
+            self._polled[path] = signature
+            self._emitChange(path)
+
+    def _emitChange(self, path):
+        self._counters['events'] += 1
+        self.fileChanged.emit(path)
+
+    def _onFileChanged(self, path):
+        if path not in self._file_watches:
+            return
+        # Editors that save by replacing the file make the watch go away;
+        # watch the new file or fall back to polling.
+        if path not in self._watcher.files():
+            self._file_watches.discard(path)
+            if self._watch(path):
+                self._file_watches.add(path)
+            else:
+                self._polled[path] = _signature(path)
+                self._updatePollTimer()
+        self._emitChange(path)
+
+    def _onDirectoryChanged(self, directory):
+        for path in list(self._by_dir.get(directory, ())):
+            if path in self._polled:
+                self._checkSignature(path)
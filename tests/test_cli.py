@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from promptgen.__main__ import main
+from promptgen.engine import FileFilter, collect_files
+from promptgen.export import build_prompt, get_layout, iter_export
+
+
+@pytest.fixture
+def project(tmp_path):
+    for path, text in {"src/main.py": "print('hi')\n", "src/util.py": "x = 1\n", "src/.env": "SECRET=1\n",
+                       "docs/readme.md": "# Docs\n", "build/out.log": "log\n"}.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path if path.endswith(".log") else text)
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    return tmp_path
+
+
+def run(argv, capsys):
+    code = main(argv)
+    captured = capsys.readouterr()
+    return code, captured.out, captured.err
+
+
+def file_headers(text):
+    return [line[len("File: "):] for line in text.splitlines() if line.startswith("File: ")]
+
+
+def normalized(*paths):
+    return [os.path.abspath(path).replace("\\", "/") for path in paths]
+
+
+def test_directory_is_walked_in_tree_order(project, capsys):
+    code, out, _ = run(["-p", "Review", str(project)], capsys)
+    assert code == 0
+    assert out.startswith("Review")
+    assert file_headers(out) == normalized(project / "docs" / "readme.md", project / "src" / ".env",
+                                           project / "src" / "main.py", project / "src" / "util.py",
+                                           project / ".gitignore")
+
+
+def test_filters_and_no_ignore(project, capsys):
+    _, out, _ = run(["-e", ".py, .log", "--ignore-dot", "--no-ignore", str(project)], capsys)
+    assert file_headers(out) == normalized(project / "build" / "out.log", project / "src" / "main.py",
+                                           project / "src" / "util.py")
+
+
+def test_missing_path_is_an_error(project, capsys):
+    with pytest.raises(SystemExit) as exc:
+        main([str(project / "src"), str(project / "nope.py")])
+    assert exc.value.code == 2
+    assert "no such file or directory" in capsys.readouterr().err
+
+
+def test_paths_or_selection_are_required(capsys):
+    with pytest.raises(SystemExit) as exc:
+        main([])
+    assert exc.value.code == 2
+
+
+def test_selection_adds_its_files(project, tmp_path_factory, capsys):
+    selection = tmp_path_factory.mktemp("sel") / "selection.json"
+    selection.write_text(json.dumps({"include": [str(project / "src")], "exclude": [str(project / "src" / "util.py")],
+                                     "ignore_dot": True}))
+    code, out, _ = run(["--selection", str(selection)], capsys)
+    assert code == 0
+    assert file_headers(out) == normalized(project / "src" / "main.py")
+
+    _, out, _ = run(["--selection", str(selection), str(project / "docs"), str(project / "src" / "main.py")], capsys)
+    assert file_headers(out) == normalized(project / "docs" / "readme.md", project / "src" / "main.py")
+
+
+def test_invalid_selection_is_an_error(tmp_path, capsys):
+    selection = tmp_path / "selection.json"
+    selection.write_text("[]")
+    with pytest.raises(SystemExit) as exc:
+        main(["--selection", str(selection)])
+    assert exc.value.code == 2
+
+
+def test_gzip_output_and_layouts(project, tmp_path, capsys):
+    target = tmp_path / "prompt.jsonl.gz"
+    assert main(["-p", "P", "--layout", "jsonl", "-o", str(target), str(project / "src" / "main.py")]) == 0
+    with gzip.open(target, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert records == [{"type": "prompt", "text": "P"},
+                       {"type": "file", "path": normalized(project / "src" / "main.py")[0],
+                        "content": "print('hi')\n"}]
+
+
+def test_collect_files_globs_and_duplicates(project):
+    missing = []
+    files = collect_files([str(project / "src" / "*.py"), str(project / "src"), str(project / "gone")],
+                          FileFilter(ignore_dot=True), missing=missing)
+    assert files == [str(project / "src" / "main.py"), str(project / "src" / "util.py")]
+    assert missing == [str(project / "gone")]
+
+
+def test_export_reports_unreadable_files(tmp_path):
+    errors = []
+    segments = list(iter_export("P", [str(tmp_path / "gone.txt")], layout="xml",
+                                on_error=lambda path, message: errors.append(path)))
+    assert errors == [str(tmp_path / "gone.txt")]
+    assert 'error=' in segments[1][1]
+    assert segments[-1][1] == get_layout("xml").footer()
+
+
+def test_build_prompt_matches_the_markdown_layout(project):
+    path = str(project / "src" / "util.py")
+    assert build_prompt("P", [path]) == "P" + get_layout("markdown").file_block(path, "x = 1\n")
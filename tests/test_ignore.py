@@ -0,0 +1,65 @@
+import re
+
+import pytest
+
+from promptgen.ignore import IgnoreMatcher, parse_ignore_lines, translate_pattern
+
+
+def matches(pattern, path):
+    return re.fullmatch(translate_pattern(pattern), path) is not None
+
+
+@pytest.mark.parametrize("pattern, path, expected", [
+    ("*.log", "debug.log", True),
+    ("*.log", "logs/debug.log", True),
+    ("*.log", "debug.log.txt", False),
+    ("build", "src/build", True),
+    ("build", "build/out.o", True),
+    ("/build", "build", True),
+    ("/build", "src/build", False),
+    ("doc/*.txt", "doc/notes.txt", True),
+    ("doc/*.txt", "doc/sub/notes.txt", False),
+    ("doc/*.txt", "src/doc/notes.txt", False),
+    ("**/cache", "a/b/cache", True),
+    ("**/cache", "cache", True),
+    ("a/**/b", "a/b", True),
+    ("a/**/b", "a/x/y/b", True),
+    ("logs/**", "logs/x/y.log", True),
+    ("file?.py", "file1.py", True),
+    ("file?.py", "file10.py", False),
+    ("file?.py", "file/.py", False),
+    ("[abc].md", "b.md", True),
+    ("[!abc].md", "b.md", False),
+    ("[!abc].md", "d.md", True),
+    ("\\*.md", "*.md", True),
+    ("\\*.md", "x.md", False),
+    ("a+b.txt", "a+b.txt", True),
+])
+def test_translate_pattern(pattern, path, expected):
+    assert matches(pattern, path) is expected
+
+
+def test_translate_pattern_marks_paths_below_a_match():
+    match = re.fullmatch(translate_pattern("build"), "build/sub/out.o")
+    assert match.group("inside") == "/sub/out.o"
+
+
+def test_parse_ignore_lines_handles_comments_negation_and_escapes():
+    rules = parse_ignore_lines(["# comment\n", "\n", "*.log\n", "!keep.log\n", "\\#hash\n", "out/\n"])
+    assert [rule.negate for rule in rules] == [False, True, False, False]
+    assert [rule.dir_only for rule in rules] == [False, False, False, True]
+    assert rules[2].matches("#hash", False)
+
+
+def test_matcher_applies_nested_ignore_files_and_pruning(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\n!keep.log\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ".promptignore").write_text("generated/\n")
+    root = IgnoreMatcher.for_directory(str(tmp_path))
+    sub = root.child(str(tmp_path / "sub"))
+    assert root.is_ignored(str(tmp_path / "debug.log"), False)
+    assert not root.is_ignored(str(tmp_path / "keep.log"), False)
+    assert root.is_ignored(str(tmp_path / "node_modules"), True)
+    assert sub.is_ignored(str(tmp_path / "sub" / "generated"), True)
+    assert not sub.is_ignored(str(tmp_path / "sub" / "generated"), False)
+    assert sub.is_ignored(str(tmp_path / "sub" / "trace.log"), False)
@@ -0,0 +1,14 @@
+from promptgen import pdf
+
+
+def test_unwritable_cache_keeps_extracted_text(tmp_path, monkeypatch, capsys):
+    document = tmp_path / "doc.pdf"
+    document.write_bytes(b"%PDF-1.4")
+    blocker = tmp_path / "cache"
+    blocker.write_text("not a directory")
+    monkeypatch.setattr(pdf, "extract_pages", lambda file_path: ["one\n", "two\n"])
+    cache = pdf.PdfTextCache(str(blocker / "pdf"))
+
+    assert pdf.extract_text_from_pdf(str(document), cache=cache) == "one\ntwo\n"
+    assert "Could not cache PDF text" in capsys.readouterr().err
+    assert pdf.extract_text_from_pdf(str(document), pages=[(2, 2)], cache=cache) == "two\n"
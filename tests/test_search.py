@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+from promptgen.search import SearchIndex, compile_query, pattern_query, trigrams
+
+
+@pytest.mark.parametrize("pattern, flags, expected", [
+    ("hello", 0, "hello"),
+    ("foo.*bar", 0, ("and", ["foo", "bar"])),
+    ("foo|bar", 0, ("or", ["foo", "bar"])),
+    ("(foo|bar)baz", 0, ("and", [("or", ["foo", "bar"]), "baz"])),
+    ("foo|.*", 0, None),
+    ("(abc)+x", 0, ("and", ["abc", "x"])),
+    ("(abc)*", 0, None),
+    ("ab?c", 0, ("and", ["a", "c"])),
+    (r"\d+", 0, None),
+    ("def main", re.IGNORECASE, ("and", ["def ma", "n"])),
+    ("Kelvin", re.IGNORECASE, ("and", ["elv", "n"])),
+    ("straße", re.IGNORECASE, ("and", ["tra", "e"])),
+    ("(?i:Key)x", 0, ("and", ["ey", "x"])),
+])
+def test_pattern_query(pattern, flags, expected):
+    assert pattern_query(pattern, flags) == expected
+
+
+def test_pattern_query_rejects_invalid_patterns():
+    with pytest.raises(re.error):
+        pattern_query("(unclosed")
+
+
+def test_trigrams_are_case_folded():
+    assert trigrams(b"ABCd") == trigrams(b"abcd") == {
+        ord("a") | ord("b") << 8 | ord("c") << 16, ord("b") | ord("c") << 8 | ord("d") << 16}
+
+
+@pytest.fixture
+def index(tmp_path):
+    files = {
+        "src/app.py": "def main():\n    run_server(port=8080)\n",
+        "src/util.py": "def helper():\n    return 'Kelvin'\n",
+        "docs/readme.md": "Run the server with python -m app\n",
+        "blob.bin": "\0\1\2binary main\0",
+    }
+    for name, text in files.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(text)
+    index = SearchIndex()
+    index.set_roots([str(tmp_path)])
+    index.sync(str(tmp_path))
+    return index
+
+
+def relative(paths, root):
+    return [path[len(str(root)) + 1:].replace("\\", "/") for path in paths]
+
+
+def test_search_finds_substrings_case_insensitively(index, tmp_path):
+    assert relative(index.search(compile_query("RUN_SERVER")), tmp_path) == ["src/app.py"]
+    assert relative(index.search(compile_query("server")), tmp_path) == ["docs/readme.md", "src/app.py"]
+    assert index.search(compile_query("Server", case_sensitive=True)) == []
+
+
+def test_search_with_regex_and_short_queries(index, tmp_path):
+    assert relative(index.search(compile_query(r"def \w+\(\)", regex=True)), tmp_path) == ["src/app.py",
+                                                                                          "src/util.py"]
+    assert relative(index.search(compile_query("kelvin")), tmp_path) == ["src/util.py"]
+    assert relative(index.search(compile_query("py")), tmp_path) == ["docs/readme.md"]
+
+
+def test_binary_files_are_never_matched(index):
+    assert not any(path.endswith("blob.bin") for path in index.search(compile_query("main")))
+
+
+def test_search_rechecks_modified_files(index, tmp_path):
+    (tmp_path / "src" / "app.py").write_text("nothing to see\n")
+    assert index.search(compile_query("run_server")) == []
+
+
+def test_sync_picks_up_new_and_removed_files(index, tmp_path):
+    (tmp_path / "docs" / "readme.md").unlink()
+    (tmp_path / "docs" / "new.txt").write_text("run the server\n")
+    index.sync(str(tmp_path))
+    assert relative(index.search(compile_query("the server")), tmp_path) == ["docs/new.txt"]
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "index" / "search.idx")
+    index.save(path)
+    loaded = SearchIndex()
+    assert loaded.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.trigram_count == index.trigram_count
+    assert loaded.search(compile_query("helper")) == index.search(compile_query("helper"))
+    assert not SearchIndex(max_bytes=10).load(path)
@@ -0,0 +1,143 @@
+import os
+
+import pytest
+
+from promptgen.engine import FileFilter
+from promptgen.selection import Selection, tree_key
+
+
+@pytest.fixture
+def project(tmp_path):
+    for path in ("a/x/1.py", "a/x/2.md", "a/y/z/3.py", "a/y/w/4.py", "a/5.py", "b/6.py",
+                 "c/7.py", "c/__pycache__/8.pyc", "c/.hidden.py", "c/notes.log"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    (tmp_path / "c" / ".gitignore").write_text("*.log\n")
+    return str(tmp_path)
+
+
+def files(project, *names):
+    return [os.path.join(project, *name.split("/")) for name in names]
+
+
+def test_dict_round_trip():
+    selection = Selection({"/p": True, "/p/x": False}, ".py, .md", ignore_dunder=True)
+    data = selection.to_dict()
+    assert data == {"include": ["/p"], "exclude": ["/p/x"], "extensions": ".py, .md", "ignore_dunder": True}
+    assert Selection.from_dict(data) == selection
+    assert Selection().to_dict() == {"include": [], "exclude": []}
+
+
+@pytest.mark.parametrize("data", [[], {"include": "/p"}, {"exclude": [1]}])
+def test_from_dict_rejects_invalid_data(data):
+    with pytest.raises(ValueError):
+        Selection.from_dict(data)
+
+
+def test_closest_rule_decides():
+    selection = Selection({"/p": True, "/p/a": False, "/p/a/b": True})
+    assert selection.is_selected("/p/c/d.py")
+    assert not selection.is_selected("/p/a/c.py")
+    assert selection.is_selected("/p/a/b/c.py")
+    assert not selection.is_selected("/q/c.py")
+
+
+def test_rules_are_listed_parents_first():
+    rules = {"/p/a/b": True, "/p": True, "/p/a": False}
+    assert [path for path, _ in Selection(rules).iter_rules()] == ["/p", "/p/a", "/p/a/b"]
+
+
+def test_tree_key_orders_directories_before_files():
+    paths = [("/p/b.txt", False), ("/p/A", True), ("/p/a.txt", False), ("/p/c", True)]
+    assert [path for path, _ in sorted(paths, key=lambda p: tree_key(*p))] == ["/p/A", "/p/c", "/p/a.txt", "/p/b.txt"]
+
+
+def test_iter_files_applies_excludes_ignore_rules_and_filter(project):
+    selection = Selection({project: True, os.path.join(project, "a", "y", "z"): False,
+                           os.path.join(project, "a", "x", "2.md"): False})
+    assert list(selection.iter_files()) == files(
+        project, "a/x/1.py", "a/y/w/4.py", "a/5.py", "b/6.py", "c/.gitignore", "c/.hidden.py", "c/7.py")
+    assert list(selection.iter_files(FileFilter([".py"], ignore_dot=True))) == files(
+        project, "a/x/1.py", "a/y/w/4.py", "a/5.py", "b/6.py", "c/7.py")
+
+
+def test_iter_files_reaches_includes_below_excluded_directories(project):
+    selection = Selection({os.path.join(project, "a"): False, os.path.join(project, "a", "y", "w"): True,
+                           os.path.join(project, "c", "notes.log"): True})
+    assert list(selection.iter_files()) == files(project, "a/y/w/4.py", "c/notes.log")
+    assert list(selection.iter_files(use_ignore=False)) == files(project, "a/y/w/4.py", "c/notes.log")
+
+
+# Rules derived from the tree ---------------------------------------------------
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import Qt  # noqa: E402
+
+from promptgen.tree_model import FileTreeModel  # noqa: E402
+
+
+def make_model(project):
+    model = FileTreeModel()
+    model.setRoots([project])
+    return model
+
+
+def node_for(model, path):
+    """Load the rows down to path, like FilePromptApp.loadItemByPath()."""
+    root = model.topLevelNodes()[0]
+    node = root
+    for name in os.path.relpath(path, root.path).split(os.sep):
+        if name != ".":
+            node = model.childForName(node, name)
+    return node
+
+
+def check_states(model):
+    states = {}
+    stack = list(model.topLevelNodes())
+    while stack:
+        node = stack.pop()
+        states[node.path] = node.check_state
+        stack.extend(node.children or ())
+    return states
+
+
+def apply(model, selection):
+    for path, include in selection.iter_rules():
+        model.setCheckState(node_for(model, path), Qt.Checked if include else Qt.Unchecked)
+
+
+@pytest.mark.parametrize("clicks, expected", [
+    ([("", Qt.Checked)], {"": True}),
+    ([("a", Qt.Checked), ("a/y/z", Qt.Unchecked), ("a/x/2.md", Qt.Unchecked), ("b", Qt.Checked),
+      ("c", Qt.Checked)], {"": True, "a/y/z": False, "a/x/2.md": False}),
+    ([("a/y/w/4.py", Qt.Checked), ("a/5.py", Qt.Checked)], {"a/y/w": True, "a/5.py": True}),
+    ([("a", Qt.Checked), ("a/x", Qt.Unchecked), ("a/x/1.py", Qt.Checked)], {"a": True, "a/x/2.md": False}),
+    ([("c", Qt.Checked)], {"c": True}),
+])
+def test_selection_rules_are_minimal_and_round_trip(project, clicks, expected):
+    model = make_model(project)
+    for name, state in clicks:
+        model.setCheckState(node_for(model, os.path.join(project, name)), state)
+    rules = model.selectionRules()
+    assert rules == {os.path.normpath(os.path.join(project, name)): include for name, include in expected.items()}
+
+    restored = make_model(project)
+    apply(restored, Selection(rules))
+    original_states = check_states(model)
+    restored_states = check_states(restored)
+    common = original_states.keys() & restored_states.keys()
+    assert {path: original_states[path] for path in common} == {path: restored_states[path] for path in common}
+    assert restored.selectionRules() == rules
+
+
+def test_selection_rules_cover_pending_names(project):
+    model = make_model(project)
+    root = model.topLevelNodes()[0]
+    model.setCheckState(root, Qt.Checked)
+    a = node_for(model, os.path.join(project, "a"))
+    model.listChildren(a)
+    model.materialize(a, 1)  # only a/x becomes a row, a/y and a/5.py stay pending
+    model.setCheckState(model.nodeForPath(os.path.join(project, "a", "x")), Qt.Unchecked)
+    assert model.selectionRules() == {project: True, os.path.join(project, "a", "x"): False}
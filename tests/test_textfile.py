@@ -0,0 +1,56 @@
+import pytest
+
+from promptgen.textfile import (
+    ReadLimits, binary_marker, is_binary, read_text, slice_content, truncate_text, truncation_marker)
+
+DATA = b"".join(b"line %d\n" % i for i in range(10))  # 70 bytes, 7 per line
+
+
+def test_slice_content_without_limits_decodes_and_normalizes():
+    assert slice_content(b"a\r\nb\rc\xff\n", ReadLimits()) == "a\nb\nc\n"
+
+
+def test_slice_content_keeps_head_at_line_boundary():
+    text = slice_content(DATA, ReadLimits(max_bytes=17))
+    assert text == "line 0\nline 1\n" + truncation_marker(56, 70)
+
+
+def test_slice_content_cuts_inside_a_first_line_that_is_too_long():
+    assert slice_content(b"abcdefghij\n", ReadLimits(max_bytes=4)) == "abcd\n" + truncation_marker(7, 11)
+
+
+def test_slice_content_keeps_tail():
+    text = slice_content(DATA, ReadLimits(max_lines=2, mode='tail'))
+    assert text == truncation_marker(56, 70) + "\nline 8\nline 9\n"
+
+
+def test_slice_content_keeps_both_ends():
+    text = slice_content(DATA, ReadLimits(max_lines=4, mode='both'))
+    assert text == "line 0\nline 1\n" + truncation_marker(42, 70) + "\nline 8\nline 9\n"
+
+
+def test_slice_content_within_limits_is_unchanged():
+    assert slice_content(DATA, ReadLimits(max_bytes=70, max_lines=10)) == DATA.decode()
+
+
+def test_truncate_text_counts_utf8_bytes():
+    text = truncate_text("äöü\n" * 4, ReadLimits(max_lines=1))
+    assert text == "äöü\n" + truncation_marker(21, 28)
+
+
+def test_read_limits_rejects_unknown_modes():
+    with pytest.raises(ValueError):
+        ReadLimits(mode='middle')
+
+
+def test_is_binary():
+    assert not is_binary(b"")
+    assert not is_binary(b"plain text\twith tabs\n")
+    assert is_binary(b"text\0more")
+    assert is_binary(bytes(range(1, 32)) * 4)
+
+
+def test_read_text_replaces_binary_files_by_a_marker(tmp_path):
+    path = tmp_path / "blob.bin"
+    path.write_bytes(b"\0\1\2" * 100)
+    assert read_text(str(path)) == binary_marker(300)
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from promptgen.export import get_layout
+from promptgen.tokens import (
+    CharTokenizer, TokenCounter, budget_reader, fit_plan, path_priority, plan_budget, truncate_to_tokens)
+
+
+def test_plan_budget_fits_without_changes():
+    assert plan_budget([("a", 10, 1), ("b", 20, 1)], 30) == {}
+
+
+def test_plan_budget_drops_largest_lowest_priority_first():
+    entries = [("a", 10, 1), ("b", 30, 1), ("c", 50, 2), ("d", 5, 0)]
+    assert plan_budget(entries, 60) == {"d": 0, "b": 0}
+
+
+def test_plan_budget_prefers_later_files_of_the_same_size():
+    assert plan_budget([("a", 10, 1), ("b", 10, 1)], 15) == {"b": 0}
+
+
+def test_plan_budget_truncates_the_last_file_needed():
+    assert plan_budget([("a", 10, 1), ("b", 30, 1)], 35, "truncate") == {"b": 25}
+
+
+def test_path_priority_inherits_from_directories():
+    priorities = {"/src": "low", "/src/main.py": "high"}
+    assert path_priority("/src/main.py", priorities) == 2
+    assert path_priority("/src/util/io.py", priorities) == 0
+    assert path_priority("/docs/index.md", priorities) == 1
+
+
+def test_truncate_to_tokens_counts_the_marker():
+    count = CharTokenizer().count
+    text = "".join(f"line {i}\n" for i in range(500))
+    cut = truncate_to_tokens(text, count(text), 40, count)
+    assert "truncated" in cut
+    assert count(cut) <= 40
+    assert truncate_to_tokens(text, count(text), 5, count) is None
+
+
+def render(layout, prompt, files, read):
+    return layout.header(prompt) + "".join(layout.file_block(path, read(path)) for path in files) + layout.footer()
+
+
+@pytest.mark.parametrize("mode", ["drop", "truncate"])
+@pytest.mark.parametrize("layout_name", ["markdown", "xml", "jsonl"])
+def test_budget_output_never_exceeds_budget(mode, layout_name):
+    rng = random.Random(7)
+    tokenizer = CharTokenizer()
+    layout = get_layout(layout_name)
+    contents = {
+        f"/project/file{i}.txt": "".join(f"{rng.random():.{rng.randint(1, 12)}f}\n" for _ in range(rng.randint(0, 300)))
+        for i in range(8)
+    }
+    counter = TokenCounter(tokenizer)
+    fixed = tokenizer.count(layout.header("Prompt") + layout.footer())
+    tokens = {path: counter.count(path, text, layout) for path, text in contents.items()}
+    for budget in range(fixed, fixed + sum(tokens.values()) + 10, 7):
+        plan = plan_budget(((path, count, 1) for path, count in tokens.items()), budget - fixed, mode)
+        cuts = fit_plan(plan, contents.get, tokens, lambda path, text: tokenizer.count(layout.file_block(path, text)))
+        files = [path for path in contents if plan.get(path) != 0]
+        output = render(layout, "Prompt", files, budget_reader(contents.get, cuts))
+        assert tokenizer.count(output) <= budget
+        assert fixed + sum(plan.get(path, tokens[path]) for path in files) <= budget
+
+
+def test_set_tokenizer_drops_cached_counts():
+    counter = TokenCounter(CharTokenizer(4))
+    assert counter.count("/a.txt", "x" * 8) == 2
+    assert counter.count_text("x" * 8) == 2
+    counter.set_tokenizer(CharTokenizer(2))
+    assert counter.count("/a.txt", "x" * 8) == 4
+    assert counter.count_text("x" * 8) == 4
+    assert (counter.hits, counter.misses) == (0, 2)
@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import Qt  # noqa: E402
+
+from promptgen.tree_model import FileTreeModel  # noqa: E402
+
+
+@pytest.fixture
+def project(tmp_path):
+    for path in ("src/main.py", ".git/HEAD", "node_modules/lib/index.js", "readme.md"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def model(project):
+    model = FileTreeModel()
+    model.setRoots([project])
+    return model
+
+
+def click(model, node, state):
+    model.setData(model.indexFromNode(node), state, Qt.CheckStateRole)
+
+
+def test_check_and_uncheck_folder_with_ignored_children(model, project):
+    root = model.topLevelNodes()[0]
+    model.materializeAll(root)
+    git = model.nodeForPath(os.path.join(project, ".git"))
+
+    click(model, root, Qt.Checked)
+    assert root.check_state == Qt.Checked
+    assert git.check_state == Qt.Unchecked
+    assert model.nodeForPath(os.path.join(project, "src")).check_state == Qt.Checked
+
+    click(model, root, Qt.Unchecked)
+    assert root.check_state == Qt.Unchecked
+    assert all(child.check_state == Qt.Unchecked for child in root.children)
+
+
+def test_ignored_rows_materialized_later_keep_folder_checked(model, project):
+    root = model.topLevelNodes()[0]
+    model.listChildren(root)
+    click(model, root, Qt.Checked)
+    model.materializeAll(root)
+    assert model.nodeForPath(os.path.join(project, "node_modules")).check_state == Qt.Unchecked
+    assert root.check_state == Qt.Checked
+
+
+def test_unchecking_a_regular_row_makes_folder_partial(model, project):
+    root = model.topLevelNodes()[0]
+    model.materializeAll(root)
+    click(model, root, Qt.Checked)
+    click(model, model.nodeForPath(os.path.join(project, "readme.md")), Qt.Unchecked)
+    assert root.check_state == Qt.PartiallyChecked
+
+
+def test_checking_an_ignored_row_counts(model, project):
+    root = model.topLevelNodes()[0]
+    model.materializeAll(root)
+    click(model, model.nodeForPath(os.path.join(project, ".git")), Qt.Checked)
+    assert root.check_state == Qt.PartiallyChecked
+
+
+def test_folder_with_only_ignored_rows_can_be_checked(tmp_path):
+    (tmp_path / "vendor" / ".git").mkdir(parents=True)
+    model = FileTreeModel()
+    model.setRoots([str(tmp_path)])
+    root = model.topLevelNodes()[0]
+    model.materializeAll(root)
+    vendor = model.nodeForPath(str(tmp_path / "vendor"))
+    model.materializeAll(vendor)
+    click(model, vendor, Qt.Checked)
+    assert vendor.check_state == Qt.Checked
+    assert root.check_state == Qt.Checked
+    click(model, vendor, Qt.Unchecked)
+    assert root.check_state == Qt.Unchecked
+
+
+@pytest.mark.parametrize("with_proxy", [False, True])
+def test_apply_listing_passes_model_tester(tmp_path, with_proxy):
+    from PyQt5.QtCore import QCoreApplication, qInstallMessageHandler
+    from PyQt5.QtTest import QAbstractItemModelTester
+
+    from promptgen.tree_model import FileFilterProxyModel
+
+    app = QCoreApplication.instance() or QCoreApplication([])  # noqa: F841
+    for path in ("d/a/inner/x.py", "d/m.py", "d/z/inner2/y.py"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    model = FileTreeModel()
+    model.setRoots([str(tmp_path / "d")])
+    mode = QAbstractItemModelTester.FailureReportingMode.Warning
+    testers = [QAbstractItemModelTester(model, mode)]
+    if with_proxy:
+        proxy = FileFilterProxyModel()
+        proxy.setSourceModel(model)
+        testers.append(QAbstractItemModelTester(proxy, mode))
+    failures = []
+    previous = qInstallMessageHandler(lambda kind, context, message: failures.append(message))
+    try:
+        root = model.topLevelNodes()[0]
+        model.materializeAll(root)
+        a_inner = model.nodeForPath(str(tmp_path / "d" / "a" / "inner"))
+        z_inner = model.nodeForPath(str(tmp_path / "d" / "z" / "inner2"))
+
+        entries = {"0": True, "a": True, "b": True, "c": True, "m.py": False, "z": True}
+        assert model.applyListing(root, entries)
+        assert [child.name for child in root.children] == ["0", "a", "b", "c", "z", "m.py"]
+        assert [child.row for child in root.children] == list(range(6))
+        assert model.parent(model.indexFromNode(z_inner)) == model.indexFromNode(z_inner.parent)
+
+        assert model.applyListing(root, {"a": True, "z": True})
+        assert [child.name for child in root.children] == ["a", "z"]
+        assert model.nodeForPath(str(tmp_path / "d" / "b")) is None
+        assert model.indexFromNode(z_inner).parent().row() == 1
+        assert a_inner.parent.parent is root
+    finally:
+        qInstallMessageHandler(previous)
+    del testers
+    assert failures == []